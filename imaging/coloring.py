@@ -8,7 +8,8 @@ import numpy as np
 from tqdm.auto import tqdm
 import sklearn
 import cv2
-from imaging.io import save_video
+from imaging.io import save_video, PrefetchReader
+from imaging.rois import ROITable, as_roi_table
 
 
 class ColorImages:
@@ -185,20 +186,26 @@ class ColorImages:
         return Fig
 
 
-def convert_grayscale_to_color(Image: np.ndarray) -> np.ndarray:
+def convert_grayscale_to_color(Image: np.ndarray, **kwargs: int) -> np.ndarray:
     """
     Converts Image to Grayscale
 
+    The image is normalized & converted in chunks (read ahead on a background thread)
+
     :param Image: Image to be converted
     :type Image: Any
+    :keyword chunk_size: number of frames converted at once (int, default 1000)
     :return: Color-Grayscale Image
     :rtype: Any
     """
-    ColorGrayScaleImage = np.full((*Image.shape, 3), 0, dtype=Image.dtype)
-    for _dim in range(3):
-        ColorGrayScaleImage[:, :, :, _dim] = Image
+    _minimum, _maximum = image_range(Image, **kwargs)
+
+    ColorGrayScaleImage = np.full((*Image.shape, 3), 0, dtype=np.uint8)
+    for _start, _stop, _images, _ in PrefetchReader(Image, chunk_size=kwargs.get("chunk_size", 1000)):
+        ColorGrayScaleImage[_start:_stop] = np.uint8(normalize_image(_images, minimum=_minimum, maximum=_maximum)
+                                                     * 255)[..., np.newaxis]
 
-    return np.uint8(normalize_image(ColorGrayScaleImage) * 255)
+    return ColorGrayScaleImage
 
 
 def generate_background(Images: np.ndarray, Option: str = "True",
@@ -217,22 +224,48 @@ def generate_background(Images: np.ndarray, Option: str = "True",
     return _background_image
 
 
-def normalize_image(Image: np.ndarray) -> np.ndarray:
+def normalize_image(Image: np.ndarray, **kwargs: float) -> np.ndarray:
     """
     Normalizes an image for color-mapping
 
     :param Image: Image to be normalized
     :type Image: Any
+    :keyword minimum: minimum of the complete image when normalizing a chunk (float, default Image.min())
+    :keyword maximum: maximum of the complete image when normalizing a chunk (float, default Image.max())
     :return: Normalized Image
     :rtype: Any
     """
 
     _image = Image.astype(np.float32)
-    _image -= _image.min()
-    _image /= _image.max()
+    _minimum = kwargs.get("minimum", None)
+    _maximum = kwargs.get("maximum", None)
+    if _minimum is None or _maximum is None:
+        _image -= _image.min()
+        _image /= _image.max()
+    else:
+        _image -= np.float32(_minimum)
+        _image /= np.float32(_maximum) - np.float32(_minimum)
     return _image
 
 
+def image_range(Images: np.ndarray, **kwargs: int) -> Tuple[float, float]:
+    """
+    Minimum and maximum of an image, computed in chunks (read ahead on a background thread)
+
+    :param Images: Images [Z x Y x X]
+    :type Images: Any
+    :keyword chunk_size: number of frames read at once (int, default 1000)
+    :return: minimum, maximum
+    :rtype: tuple[float, float]
+    """
+    _minimum = np.inf
+    _maximum = -np.inf
+    for _, _, _images, _ in PrefetchReader(Images, chunk_size=kwargs.get("chunk_size", 1000)):
+        _minimum = min(_minimum, _images.astype(np.float32, copy=False).min())
+        _maximum = max(_maximum, _images.astype(np.float32, copy=False).max())
+    return _minimum, _maximum
+
+
 def rescale_images(Images: np.ndarray, LowCut: float, HighCut: float) -> np.ndarray:
     """
     Rescale Images within percentiles
@@ -266,61 +299,32 @@ def rescale_images(Images: np.ndarray, LowCut: float, HighCut: float) -> np.ndar
     return _linearized_image
 
 
-def colorize_rois(Images: np.ndarray, Stats: np.ndarray, ROIs: Optional[List[int]] = None, *args: Optional[plt.cm.colors.Colormap]) \
+def colorize_rois(Images: np.ndarray, Stats: Union[np.ndarray, ROITable], ROIs: Optional[List[int]] = None, *args: Optional[plt.cm.colors.Colormap]) \
         -> np.ndarray:
     """
     Generates a colorized roi overlay video
 
     :param Images: Images To Extract ROI Overlay
     :type Images: Any
-    :param Stats: Suite2P Stats
+    :param Stats: Suite2P Stats or ROITable
     :type Stats: Any
     :param ROIs: Subset of ROIs
     :type ROIs: list[int]|None
     :return: Colorized ROIs
     :rtype: Any
     """
-    def flatten(list_of_lists):
-        return [item for sublist in list_of_lists for item in sublist]
-
-    def points_in_circle(radius, x0=0, y0=0, ):
-        x_ = np.arange(x0 - radius - 1, x0 + radius + 1, dtype=int)
-        y_ = np.arange(y0 - radius - 1, y0 + radius + 1, dtype=int)
-        x, y = np.where((x_[:, np.newaxis] - x0) ** 2 + (y_ - y0) ** 2 <= radius ** 2)
-        # x, y = np.where((np.hypot((x_-x0)[:,np.newaxis], y_-y0)<= radius)) # alternative implementation
-        for x, y in zip(x_[x], y_[y]):
-            yield x, y
-
     if len(args) >= 1:
         cmap = args[0]
     else:
         cmap = "binary"
 
     if ROIs is None:
-        ROIs = np.array(range(Stats.shape[0]))
+        ROIs = np.array(range(len(Stats)))
 
     ColorImage = colorize_complete_image(Images, cmap)
-    # _y = []
-    # _x = []
-    # for _roi in ROIs:
-    #    _y.append(Stats[_roi].get("ypix")[Stats[_roi].get("soma_crop")])
-    #    _x.append(Stats[_roi].get("xpix")[Stats[_roi].get("soma_crop")])
-    PixelPairs = []
-    for _roi in ROIs:
-        # PixelPairs.append(zip(list(Stats[_roi].get("ypix")[Stats[_roi].get("soma_crop")]),
-        # list(Stats[_roi].get("xpix")[Stats[_roi].get("soma_crop")])))
-        # PixelPairs.append(zip(list(Stats[_roi].get("ypix")),
-        # list(Stats[_roi].get("xpix"))))
-        PixelPairs.append([points for points in points_in_circle(Stats[_roi].get("radius"),
-                                                                     *Stats[_roi].get("med"))])
-    PixelPairs = flatten(PixelPairs)
-    _yx = [list(_tuple) for _tuple in list(zip(*PixelPairs))]
-    _y = np.array(_yx[0])
-    _y[_y < 0] = 0
-    _y[_y >= ColorImage.shape[1]] = ColorImage.shape[1]-1
-    _x = np.array(_yx[1])
-    _x[_x < 0] = 0
-    _x[_x >= ColorImage.shape[2]] = ColorImage.shape[2]-1
+    _y, _x = as_roi_table(Stats).circle_pixels(np.asarray(ROIs, dtype=int))
+    _y = np.clip(_y, 0, ColorImage.shape[1] - 1)
+    _x = np.clip(_x, 0, ColorImage.shape[2] - 1)
 
     ColorizedROIs = np.zeros_like(ColorImage)
     ColorizedROIs[:, _y, _x, :] = \
@@ -329,21 +333,32 @@ def colorize_rois(Images: np.ndarray, Stats: np.ndarray, ROIs: Optional[List[int
     return ColorizedROIs
 
 
-def colorize_complete_image(Images: np.ndarray, cmap: Union[plt.cm.colors.Colormap, str]) -> np.ndarray:
+def colorize_complete_image(Images: np.ndarray, cmap: Union[plt.cm.colors.Colormap, str], **kwargs: int) \
+        -> np.ndarray:
     """
     Colorizes an Image
 
+    The image is normalized & colorized in chunks (read ahead on a background thread), so the intermediate float
+    RGBA video never exists for all frames at once
+
     :param Images: Image to be colorized
     :type Images: Any
     :param cmap: Matplotlib colormap [Object or str]
     :type: Any
+    :keyword chunk_size: number of frames colorized at once (int, default 1000)
     :return: Colorized Image
     :rtype: Any
     """
     if isinstance(cmap, str):
-        return np.uint8(plt.cm.get_cmap(cmap)(normalize_image(Images))*255)
-    else:
-        return np.uint8(cmap(normalize_image(Images)) * 255)
+        cmap = plt.cm.get_cmap(cmap)
+
+    _minimum, _maximum = image_range(Images, **kwargs)
+
+    ColorImage = np.zeros((*Images.shape, 4), dtype=np.uint8)
+    for _start, _stop, _images, _ in PrefetchReader(Images, chunk_size=kwargs.get("chunk_size", 1000)):
+        ColorImage[_start:_stop] = np.uint8(cmap(normalize_image(_images, minimum=_minimum, maximum=_maximum)) * 255)
+
+    return ColorImage
 
 
 def overlay_colorized_rois(Background: np.ndarray, ColorizedVideo: np.ndarray, *args: Optional[float]) -> np.ndarray:
@@ -416,37 +431,19 @@ def generate_custom_map(Colors: List[str]) -> plt.cm.colors.Colormap:
         return plt.cm.jet
 
 
-def generate_pixel_pairs(Stats: np.ndarray, ROIs: List[int]) -> Tuple[Tuple[int, int]]:
+def generate_pixel_pairs(Stats: Union[np.ndarray, ROITable], ROIs: List[int]) -> Tuple[Tuple[int, int]]:
     """
     Generates a tuple containing a list of each pixel pair from every ROI
 
-    :param Stats: Suite2P Stats
+    :param Stats: Suite2P Stats or ROITable
     :type Stats: Any
     :param ROIs: List of ROIs
     :type ROIs: list[int]
     :return: List of each pixel for every ROI
     :rtype: tuple[tuple[int, int]]
     """
-    def flatten(list_of_zips):
-        return tuple([item for zips in list_of_zips for item in zips])
-
-    def points_in_circle(radius, x0=0, y0=0, ):
-        x_ = np.arange(x0 - radius - 1, x0 + radius + 1, dtype=int)
-        y_ = np.arange(y0 - radius - 1, y0 + radius + 1, dtype=int)
-        x, y = np.where((x_[:, np.newaxis] - x0) ** 2 + (y_ - y0) ** 2 <= radius ** 2)
-        # x, y = np.where((np.hypot((x_-x0)[:,np.newaxis], y_-y0)<= radius)) # alternative implementation
-        for x, y in zip(x_[x], y_[y]):
-            yield x, y
-
-    PixelPairs = []
-    for _roi in ROIs:
-        # PixelPairs.append(zip(list(Stats[_roi].get("ypix")[Stats[_roi].get("soma_crop")]),
-        # list(Stats[_roi].get("xpix")[Stats[_roi].get("soma_crop")])))
-        # PixelPairs.append(zip(list(Stats[_roi].get("ypix")),
-        # list(Stats[_roi].get("xpix"))))
-        PixelPairs.append([points for points in points_in_circle(Stats[_roi].get("radius"),
-                                                                     *Stats[_roi].get("med"))])
-    PixelPairs = flatten(PixelPairs)
+    _y, _x = as_roi_table(Stats).circle_pixels(np.asarray(ROIs, dtype=int))
+    PixelPairs = tuple(zip(_y.tolist(), _x.tolist()))
     # noinspection PyTypeChecker
     return PixelPairs
 
@@ -4,7 +4,13 @@ import numpy as np
 from tqdm.auto import tqdm
 import scipy.ndimage
 import skimage.measure
+import itertools
 import math
+import mmap
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from imaging.io import PrefetchReader
 
 try:
     import cupy
@@ -17,7 +23,8 @@ def filter_images(Images: np.ndarray, Footprint: Optional[np.ndarray] = None) ->
     """
     Denoise a tiff stack using a multidimensional median filter
 
-    This function simply calls scipy.ndimage.median_filter
+    This function simply calls scipy.ndimage.median_filter, except for integer images filtered with a 3 x 3 x 3 or
+    3 x 1 x 1 footprint, which use the bit-identical fast_median_filter
 
     Footprint is of the form np.ones((Z pixels, Y pixels, X pixels)) with the origin in the center
 
@@ -37,9 +44,265 @@ def filter_images(Images: np.ndarray, Footprint: Optional[np.ndarray] = None) ->
     if Images.shape[0] <= Images.shape[1] or Images.shape[0] <= Images.shape[2]:
         AssertionError("Images must be in the form Z x Y x X")
 
+    if np.issubdtype(Images.dtype, np.integer) and Images.ndim == 3 and np.all(Footprint):
+        if Footprint.shape == (3, 3, 3):
+            return fast_median_filter(Images)
+        elif Footprint.shape == (3, 1, 1):
+            return fast_median_filter(Images, temporal_only=True)
+
     return scipy.ndimage.median_filter(Images, footprint=Footprint)
 
 
+def fast_median_filter(Images: np.ndarray, **kwargs: Union[bool, int]) -> np.ndarray:
+    """
+    Fast 3 x 3 x 3 (or temporal-only 3 x 1 x 1) median filter using vectorized min/max networks
+
+    Output is bit-identical to scipy.ndimage.median_filter (mode "reflect") with a footprint of np.ones((3, 3, 3))
+    (or np.ones((3, 1, 1))). The stack is processed in small cache-sized tiles. In each tile, every axis of the
+    3 x 3 x 3 neighborhood is sorted with 3-element sorting networks over shifted views (shared between neighboring
+    pixels); 8 of the 27 sorted values then provably cannot be the median and the median of the remaining 19 is
+    found by forgetful selection (repeatedly discarding the minimum & maximum).
+
+    :param Images: Images stack to be filtered [Z x Y x X]
+    :type Images: Any
+    :keyword temporal_only: median of 3 consecutive frames only (bool, default False)
+    :keyword chunk_frames: number of frames per tile (int, default 4)
+    :keyword chunk_rows: number of rows per tile (int, default 16)
+    :return: filtered images [Z x Y x X]
+    :rtype: Any
+    """
+    _temporal_only = kwargs.get("temporal_only", False)
+    _chunk_frames = kwargs.get("chunk_frames", 4)
+    _chunk_rows = kwargs.get("chunk_rows", 16)
+
+    _frames, _y_pixels, _x_pixels = Images.shape
+    _filtered_images = np.empty(Images.shape, dtype=Images.dtype)
+
+    def reflect(Start: int, Stop: int, Length: int) -> np.ndarray:
+        # indices padded by one on each side (scipy reflect: d c b a | a b c d | d c b a)
+        _indices = np.arange(Start - 1, Stop + 1)
+        _indices = np.where(_indices < 0, -_indices - 1, _indices)
+        return np.where(_indices >= Length, 2 * Length - _indices - 1, _indices)
+
+    if _temporal_only:
+        _x_indices = np.arange(_x_pixels)
+    else:
+        _x_indices = reflect(0, _x_pixels, _x_pixels)
+
+    for _start in range(0, _frames, _chunk_frames):
+        _stop = min(_start + _chunk_frames, _frames)
+        _t_indices = reflect(_start, _stop, _frames)
+        for _row in range(0, _y_pixels, _chunk_rows):
+            _last_row = min(_row + _chunk_rows, _y_pixels)
+            if _temporal_only:
+                _tile = Images[_t_indices, _row:_last_row, :]
+                _filtered_images[_start:_stop, _row:_last_row] = sort_three(_tile[:-2], _tile[1:-1], _tile[2:])[1]
+            else:
+                _tile = Images[np.ix_(_t_indices, reflect(_row, _last_row, _y_pixels), _x_indices)]
+                _filtered_images[_start:_stop, _row:_last_row] = median_of_27(_tile)
+
+    return _filtered_images
+
+
+def median_of_27(Tile: np.ndarray) -> np.ndarray:
+    """
+    Median of each 3 x 3 x 3 neighborhood of a tile padded by one pixel on each side
+
+    :param Tile: padded tile [Z + 2 x Y + 2 x X + 2]
+    :type Tile: Any
+    :return: median [Z x Y x X]
+    :rtype: Any
+    """
+    # sort along time, then rows, then columns: afterwards each neighborhood is sorted along every axis
+    _sorted = [Tile]
+    for _axis in range(3):
+        _shifts = [slice(None)] * 3
+        _sorted_next = []
+        for _values in _sorted:
+            _views = []
+            for _shift in range(3):
+                _shifts[_axis] = slice(_shift, _values.shape[_axis] - 2 + _shift)
+                _views.append(_values[tuple(_shifts)])
+            _sorted_next.extend(sort_three(*_views))
+        _sorted = _sorted_next
+
+    # _sorted[9a + 3b + c] is greater than or equal to (a+1)(b+1)(c+1) values & less than or equal to (3-a)(3-b)(3-c)
+    # values; the 4 values below at least 15 others & the 4 values above at least 15 others are never the median
+    _candidates = [_sorted[9 * _a + 3 * _b + _c] for _a, _b, _c in itertools.product(range(3), repeat=3)
+                   if (_a + 1) * (_b + 1) * (_c + 1) <= 14 and (3 - _a) * (3 - _b) * (3 - _c) <= 14]
+
+    # forgetful selection: the minimum & maximum of any 11 of the 19 candidates cannot be their median
+    _values = [np.array(_candidate) for _candidate in _candidates[:11]]
+    _remaining = _candidates[11:]
+    _buffer = np.empty_like(_values[0])
+    while True:
+        for _index in range(1, len(_values)):
+            np.minimum(_values[0], _values[_index], out=_buffer)
+            np.maximum(_values[0], _values[_index], out=_values[_index])
+            _values[0], _buffer = _buffer, _values[0]
+        for _index in range(1, len(_values) - 1):
+            np.maximum(_values[_index], _values[-1], out=_buffer)
+            np.minimum(_values[_index], _values[-1], out=_values[_index])
+            _values[-1], _buffer = _buffer, _values[-1]
+        _values = _values[1:-1]
+        if not _remaining:
+            return _values[0]
+        _values.append(np.array(_remaining.pop(0)))
+
+
+def sort_three(First: np.ndarray, Second: np.ndarray, Third: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Elementwise sorting network of three arrays
+
+    :return: elementwise minimum, median, maximum
+    :rtype: tuple[Any, Any, Any]
+    """
+    _low = np.minimum(First, Second)
+    _high = np.maximum(First, Second)
+    _middle = np.minimum(_high, Third)
+    _high = np.maximum(_high, Third)
+    return np.minimum(_low, _middle), np.maximum(_low, _middle), _high
+
+
+def blockwise_filter_images(Images: np.ndarray, Footprint: Optional[np.ndarray] = None,
+                            Output: Optional[np.ndarray] = None, **kwargs: int) -> np.ndarray:
+    """
+    Out-of-core multidimensional median filter performed in overlapping blocks by a pool of processes (CPU)
+
+    Each block of frames is read with a halo of half the footprint's temporal extent on each side, filtered with
+    filter_images and trimmed, so the result is identical to filtering the complete stack at once
+    (see filter_images). When both Images and Output are file-backed numpy memmaps, the workers read their blocks
+    from and write their results to the files directly; otherwise the blocks are sent to the workers.
+
+    Footprint is of the form np.ones((Z pixels, Y pixels, X pixels)) with the origin in the center
+
+    :param Images: Images stack to be filtered [Z x Y x X]
+    :type Images: Any
+    :param Footprint: Mask of the median filter (Optional, Default 3 x 3 x 3)
+    :type Footprint: Any
+    :param Output: Array (e.g., numpy memmap) receiving the filtered images (Optional, Default new array)
+    :type Output: Any
+    :keyword block_size: number of frames per block (int, default 1000)
+    :keyword workers: number of worker processes (int, default os.cpu_count())
+    :return: filtered images [Z x Y x X]
+    :rtype: Any
+    """
+    _block_size = kwargs.get("block_size", 1000)
+    _workers = kwargs.get("workers", os.cpu_count())
+
+    if Footprint is None:
+        Footprint = np.ones((3, 3, 3))
+
+    for _dim in Footprint.shape:
+        assert(_dim % 2 != 0) # Must be uneven
+
+    if Images.shape[0] <= Images.shape[1] or Images.shape[0] <= Images.shape[2]:
+        AssertionError("Images must be in the form Z x Y x X")
+
+    if Output is None:
+        Output = np.empty(Images.shape, dtype=Images.dtype)
+    if Output.shape != Images.shape:
+        raise ValueError("Output must have the same shape as Images")
+    if Output is Images or (isinstance(Output, np.memmap) and isinstance(Images, np.memmap) and
+                            Output.filename is not None and Output.filename == Images.filename):
+        raise ValueError("Blocks overlap, Images cannot be filtered in place")
+
+    _halo = Footprint.shape[0] // 2
+    _boundaries = [(_start, min(_start + _block_size, Images.shape[0]))
+                   for _start in range(0, Images.shape[0], _block_size)]
+    # views of a memmap cannot be reopened by filename & offset
+    _mapped = all(isinstance(_array, np.memmap) and isinstance(_array.base, mmap.mmap) and
+                  _array.flags.c_contiguous for _array in (Images, Output))
+
+    with ProcessPoolExecutor(max_workers=_workers) as _executor, \
+            tqdm(total=len(_boundaries), desc="Filtering Images...", disable=False) as _progress:
+        if _mapped:
+            if Output.mode in ("r+", "w+"):
+                Output.flush()
+            _futures = [_executor.submit(filter_mapped_block, describe_memmap(Images), describe_memmap(Output),
+                                         _start, _stop, _halo, Footprint) for _start, _stop in _boundaries]
+            for _future in _futures:
+                _future.result()
+                _progress.update(1)
+        else:
+            # bound the number of blocks in flight so memory does not scale with the stack
+            _pending = {}
+            for _start, _stop, _images, _offset in PrefetchReader(Images, boundaries=_boundaries, halo=_halo):
+                if len(_pending) >= 2 * _workers:
+                    _done, _ = wait(_pending, return_when=FIRST_COMPLETED)
+                    for _future in _done:
+                        Output[slice(*_pending.pop(_future))] = _future.result()
+                        _progress.update(1)
+                _pending[_executor.submit(filter_block, _images, _offset, _stop - _start, Footprint)] = \
+                    (_start, _stop)
+            for _future in list(_pending):
+                Output[slice(*_pending.pop(_future))] = _future.result()
+                _progress.update(1)
+
+    return Output
+
+
+def filter_block(Images: np.ndarray, Offset: int, Frames: int, Footprint: np.ndarray) -> np.ndarray:
+    """
+    Median filters a block of frames (with halo) and trims the halo
+
+    :param Images: block of frames including the halo [Z x Y x X]
+    :type Images: Any
+    :param Offset: position of the first frame of the block (excluding halo)
+    :type Offset: int
+    :param Frames: number of frames in the block (excluding halo)
+    :type Frames: int
+    :param Footprint: Mask of the median filter
+    :type Footprint: Any
+    :return: filtered frames [Z x Y x X]
+    :rtype: Any
+    """
+    return filter_images(Images, Footprint)[Offset:Offset + Frames]
+
+
+def filter_mapped_block(Images: Tuple, Output: Tuple, Start: int, Stop: int, Halo: int, Footprint: np.ndarray) \
+        -> None:
+    """
+    Median filters a block of frames of a memory-mapped file into a memory-mapped output file
+
+    :param Images: description of the input memmap (see describe_memmap)
+    :type Images: tuple
+    :param Output: description of the output memmap (see describe_memmap)
+    :type Output: tuple
+    :param Start: first frame of the block
+    :type Start: int
+    :param Stop: last frame of the block (exclusive)
+    :type Stop: int
+    :param Halo: number of overlapping frames read on each side of the block
+    :type Halo: int
+    :param Footprint: Mask of the median filter
+    :type Footprint: Any
+    :rtype: None
+    """
+    _images = np.memmap(Images[0], dtype=Images[1], mode="r", shape=Images[2], offset=Images[3])
+    _low = max(Start - Halo, 0)
+    _high = min(Stop + Halo, _images.shape[0])
+    _filtered = filter_block(np.asarray(_images[_low:_high]), Start - _low, Stop - Start, Footprint)
+    del _images
+
+    _output = np.memmap(Output[0], dtype=Output[1], mode="r+", shape=Output[2], offset=Output[3])
+    _output[Start:Stop] = _filtered
+    _output.flush()
+    del _output
+
+
+def describe_memmap(Images: np.memmap) -> Tuple[str, str, Tuple[int, ...], int]:
+    """
+    Describes a memmap so it can be reopened by another process
+
+    :param Images: memmap
+    :type Images: numpy.memmap
+    :return: filename, type, shape, offset
+    :rtype: tuple[str, str, tuple[int, ...], int]
+    """
+    return Images.filename, Images.dtype.str, Images.shape, Images.offset
+
+
 def fast_filter_images(Images: np.ndarray, Footprint: Optional[np.ndarray] = None) -> cupy.ndarray:
     """
     GPU-parallelized multidimensional median filter
@@ -110,12 +373,12 @@ def blockwise_fast_filter_tiff(Images: np.ndarray, Footprint: Optional[np.ndarra
     :param Footprint: Mask of the median filter (Optional, Default 3 x 3 x 3)
     :type Footprint: Any
     :keyword block_size:   Integer indicating the size of each block. Must fit within memory. (int, default 21000)
-    :keyword block_buffer_region: Integer indicating the size of the overlapping region between blocks (int, default 500)
+    :keyword block_buffer_region: Integer indicating the size of the overlapping region on each side of a block
+        (int, default half the footprint's temporal extent)
     :return: Images: numpy array [Z x Y x X]
     :rtype: Any
     """
     _block_size = kwargs.get('block_size', int(21000))
-    _block_buffer_region = kwargs.get('block_buffer_region', int(500))
 
     if Footprint is None:
         Footprint = np.ones((3, 3, 3))
@@ -123,38 +386,29 @@ def blockwise_fast_filter_tiff(Images: np.ndarray, Footprint: Optional[np.ndarra
     for _dim in Footprint.shape:
         assert(_dim % 2 != 0) # Assert odd
 
+    # frames further than half the footprint away never influence a block
+    _block_buffer_region = kwargs.get('block_buffer_region', Footprint.shape[0] // 2)
 
     if Images.shape[0] <= Images.shape[1] or Images.shape[0] <= Images.shape[2]:
         AssertionError("Images must be in the form Z x Y x X")
 
-    _total_frames = Images.shape[0]
-    _blocks = range(0, _total_frames, _block_size)
-    _num_blocks = len(_blocks)
-    _remainder = np.full((_block_buffer_region, Images.shape[1], Images.shape[2]), 0, dtype=np.int16)
-
-    for _block in tqdm(
-            range(_num_blocks),
-            total=_num_blocks,
-            desc="Filtering Images...",
-            disable=False,
-    ):
-        if _block == 0:
-            _remainder = Images[_blocks[_block + 1] - 500:_blocks[_block + 1], :, :].copy()
-            Images[0:_blocks[_block + 1], :, :] = cupy.asnumpy(fast_filter_images(cupy.asarray(
-                Images[0:_blocks[_block + 1], :, :]), Footprint))
-        elif _block == _num_blocks - 1:
-
-            Images[_blocks[_block]:_total_frames, :, :] = \
-                cupy.asnumpy(fast_filter_images(
-                    cupy.asarray(np.append(_remainder, Images[_blocks[_block]:_total_frames, :, :],
-                                           axis=0)), Footprint))[_block_buffer_region:, :, :]
-        else:
-            _remainder_new = Images[_blocks[_block + 1] - 500:_blocks[_block + 1], :, :].copy()
-            Images[_blocks[_block]:_blocks[_block + 1], :, :] = \
-                cupy.asnumpy(fast_filter_images(
-                    cupy.asarray(np.append(_remainder, Images[_blocks[_block]:_blocks[_block + 1], :, :],
-                                           axis=0)), Footprint))[_block_buffer_region:_block_size+_block_buffer_region, :, :]
-            _remainder = _remainder_new.copy()
+    if _block_buffer_region > _block_size:
+        raise ValueError("The overlapping region between blocks cannot be larger than the blocks")
+
+    # each block is read with the overlapping region on both sides while the previous block is filtered; the next
+    # block is always received before the current block is written back (so its overlap is still unfiltered)
+    _blocks = iter(PrefetchReader(Images, chunk_size=_block_size, halo=_block_buffer_region, prefetch=1))
+    _num_blocks = math.ceil(Images.shape[0] / _block_size)
+    _block = next(_blocks, None)
+
+    with tqdm(total=_num_blocks, desc="Filtering Images...", disable=False) as _progress:
+        while _block is not None:
+            _next_block = next(_blocks, None)
+            _start, _stop, _images, _offset = _block
+            Images[_start:_stop, :, :] = cupy.asnumpy(fast_filter_images(cupy.asarray(_images), Footprint))[
+                                         _offset:_offset + _stop - _start, :, :]
+            _block = _next_block
+            _progress.update(1)
 
     return Images
 
@@ -166,6 +420,9 @@ def grouped_z_project(Images: np.ndarray, BinSize: Union[Tuple[int, int, int], i
 
     Downsample example function -> np.mean
 
+    Mean projections are computed in chunks by multi_grouped_z_project (no float64 copy of the stack); any other
+    downsampling function is passed to skimage.measure.block_reduce
+
     :param Images: A numpy array containing a tiff stack [Z x Y x X]
     :type Images: Any
     :param BinSize:  Size of each bin passed to downsampling function
@@ -175,8 +432,103 @@ def grouped_z_project(Images: np.ndarray, BinSize: Union[Tuple[int, int, int], i
     :return: downsampled image [Z x Y x X]
     :rtype: Any
     """
-    if DownsampleFunction is None:
-        DownsampleFunction = np.mean
+    if DownsampleFunction is None or DownsampleFunction is np.mean:
+        return multi_grouped_z_project(Images, [BinSize])[0]
     return skimage.measure.block_reduce(Images, block_size=BinSize,
                                                      func=DownsampleFunction).astype(Images.dtype)
     # cast back down from float64
+
+
+def multi_grouped_z_project(Images: Union[np.ndarray, str], BinSizes: Sequence[Union[Tuple[int, int, int], int]],
+                            OutputDirectory: Optional[str] = None, **kwargs: int) -> List[np.ndarray]:
+    """
+    Mean grouped z-project of a stack into several downsampled stacks in a single pass
+
+    The stack (e.g., a numpy memmap or binary video folder) is read once in chunks whose length is a multiple of
+    every temporal bin size. Each chunk is summed into its bins in integers (integer images) or float32
+    (float images), divided by the bin volume and cast back to the type of the images. Like
+    skimage.measure.block_reduce, incomplete bins at the end of an axis are padded with zeros, so the results
+    match grouped_z_project with np.mean.
+
+    Each downsampled stack is written to OutputDirectory\\grouped_z_project_{Z}x{Y}x{X}.npy if OutputDirectory is
+    provided
+
+    :param Images: Images stack [Z x Y x X] or a path readable by imaging.io.PrefetchReader
+    :type Images: Any
+    :param BinSizes: Size of each bin (Z, Y, X) of each downsampled stack (an integer bins all axes)
+    :type BinSizes: Sequence[Union[tuple, int]]
+    :param OutputDirectory: Directory receiving memory-mapped downsampled stacks (Optional, Default in memory)
+    :type OutputDirectory: str
+    :keyword chunk_size: approximate number of frames per chunk (int, default 1000)
+    :return: downsampled stacks [Z x Y x X], one per bin size
+    :rtype: list[Any]
+    """
+    _chunk_size = kwargs.get("chunk_size", 1000)
+
+    if isinstance(Images, (str, pathlib.Path)):
+        Images = PrefetchReader.open_images(str(Images))
+    _shape = tuple(Images.shape)
+    _type = np.dtype(Images.dtype)
+
+    _bin_sizes = []
+    for _bin_size in BinSizes:
+        if isinstance(_bin_size, (int, np.integer)):
+            _bin_size = (int(_bin_size), ) * len(_shape)
+        _bin_size = tuple(int(_size) for _size in _bin_size)
+        if len(_bin_size) != len(_shape) or min(_bin_size) < 1:
+            raise ValueError("Each bin size must be a positive integer or have one positive integer per axis")
+        _bin_sizes.append(_bin_size)
+
+    if np.issubdtype(_type, np.integer):
+        _accumulator_type = np.int64
+    else:
+        _accumulator_type = np.result_type(_type, np.float32)
+
+    # every chunk (except the last) holds whole temporal bins of every stack
+    _frames_per_bin = math.lcm(*[_bin_size[0] for _bin_size in _bin_sizes]) if _bin_sizes else 1
+    _frames_per_chunk = max(_chunk_size // _frames_per_bin, 1) * _frames_per_bin
+    _reader = PrefetchReader(Images, boundaries=[(_start, min(_start + _frames_per_chunk, _shape[0]))
+                                                 for _start in range(0, _shape[0], _frames_per_chunk)], prefetch=1)
+
+    _projections = []
+    for _bin_size in _bin_sizes:
+        _projected_shape = tuple(-(-_length // _size) for _length, _size in zip(_shape, _bin_size))
+        if OutputDirectory is not None:
+            _filename = "".join([OutputDirectory, "\\grouped_z_project_", "x".join(map(str, _bin_size)), ".npy"])
+            os.makedirs(os.path.dirname(_filename) or ".", exist_ok=True)
+            _projections.append(np.lib.format.open_memmap(_filename, mode="w+", dtype=_type,
+                                                          shape=_projected_shape))
+        else:
+            _projections.append(np.empty(_projected_shape, dtype=_type))
+
+    for _start, _stop, _images, _ in tqdm(_reader, total=len(_reader), desc="Projecting Images...", disable=False):
+        for _bin_size, _projection in zip(_bin_sizes, _projections):
+            _sums = sum_bins(_images, _bin_size, _accumulator_type)
+            _first = _start // _bin_size[0]
+            _projection[_first:_first + _sums.shape[0]] = (_sums / np.prod(_bin_size)).astype(_type)
+
+    for _projection in _projections:
+        if isinstance(_projection, np.memmap):
+            _projection.flush()
+
+    return _projections
+
+
+def sum_bins(Images: np.ndarray, BinSize: Tuple[int, ...], AccumulatorType: np.dtype) -> np.ndarray:
+    """
+    Sum of each bin of an array, incomplete bins at the end of an axis are padded with zeros
+
+    :param Images: array
+    :type Images: Any
+    :param BinSize: size of each bin along each axis
+    :type BinSize: tuple[int, ...]
+    :param AccumulatorType: type in which the bins are summed
+    :type AccumulatorType: Any
+    :return: sums
+    :rtype: Any
+    """
+    _padding = [(0, -_length % _size) for _length, _size in zip(Images.shape, BinSize)]
+    if any(_after for _, _after in _padding):
+        Images = np.pad(Images, _padding)
+    _shape = [_dim for _length, _size in zip(Images.shape, BinSize) for _dim in (_length // _size, _size)]
+    return Images.reshape(_shape).sum(axis=tuple(range(1, len(_shape), 2)), dtype=AccumulatorType)
@@ -5,7 +5,7 @@ from mose_framework.wrapping import read_wrapper, wrapped_process
 from imaging.tool_wrappers.Suite2PModule import Suite2PAnalysis
 from imaging.tool_wrappers.FissaModule import FissaAnalysis
 from imaging.tool_wrappers.CascadeModule import CascadeAnalysis
-from imaging.io import load_all_tiffs, save_raw_binary, repackage_bruker_tiffs
+from imaging.io import convert_bruker_to_binary
 from imaging.image_processing import remove_shutter_artifact
 from imaging.signal_processing import calculateFiringRate
 from imaging.utilities import mergeTraces
@@ -17,20 +17,12 @@ import os
 def pipeline(Obj, FrameRate, Combo, Name, Config):
 
 
-    # 0. Compile
-    repackage_bruker_tiffs(Obj.folder_dictionary.get("raw_imaging_data").path,
-                           Obj.folder_dictionary.get(Name).folders.get("compiled"),
-                           Combo)
-
-
-    # 1. Pre-Process
-    _images = load_all_tiffs(Obj.folder_dictionary.get(Name).folders.get("compiled"))
-    # _images = wrapped_process(_images, *read_wrapper(Config.get("preprocess")).interface())
-    # _images = remove_shutter_artifact(_images)
-    save_raw_binary(_images, Obj.folder_dictionary.get(Name).folders.get("compiled"))
-    Obj.folder_dictionary.get(Name).clean_up_compilation()
-    _frames, _y, _x = _images.shape  # (Any cropping should ALWAYS be taken from the front of the dataset)
-    _images = None
+    # 0. Compile & 1. Pre-Process
+    # The single frame tiffs are decoded straight into the binary video, no intermediate tiff stacks are written
+    # (preprocessing the images, e.g., remove_shutter_artifact, would now be done blockwise on the binary video)
+    _frames, _y, _x = convert_bruker_to_binary(Obj.folder_dictionary.get("raw_imaging_data").path,
+                                               Obj.folder_dictionary.get(Name).folders.get("compiled"),
+                                               Combo)  # (Any cropping should ALWAYS be taken from the front of the dataset)
 
     # 1. Motion-Correct
     _ops_file = Config.get("suite2p")
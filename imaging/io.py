@@ -1,178 +1,679 @@
 from __future__ import annotations
 import itertools
+import json
+import lzma
+import mmap
 import numpy as np
 import os
 from PIL import Image
 from tqdm.auto import tqdm
 from tqdm import tqdm as tq
 import tifffile
-from typing import Callable, List, Tuple, Sequence, Optional, Union
+from typing import Callable, Iterable, List, Tuple, Sequence, Optional, Union
 import math
 import pathlib
+import re
+import struct
+import time
+import zlib
+import queue
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from prettytable import PrettyTable
-from imageio import mimwrite
+from imageio import get_writer
 
+try:
+    import blosc
+except (ModuleNotFoundError, ImportError):
+    blosc = None
 
-def determine_bruker_folder_contents(ImageDirectory: str) -> Tuple[int, int, int, int, int]:
-    """
-    Function determine contents of the bruker folder
+try:
+    import zstandard
+except (ModuleNotFoundError, ImportError):
+    zstandard = None
 
-    :param ImageDirectory: Directory containing bruker imaging data
-    :type ImageDirectory: str
-    :returns: Channels, Planes, Frames, Height, Width
-    :rtype: tuple
+
+class BrukerFolderIndex:
     """
-    _directory = pathlib.Path(ImageDirectory)
-    _files = [_file for _file in _directory.glob("*.tif") if _file.is_file()]
-    # preallocate
+    Single-pass index of a bruker folder containing single frame tiff files
 
-    def parser(Tag_: str, SplitStrs: list) -> str:
-        return [_tag for _tag in SplitStrs if Tag_ in _tag]
+    Every filename (e.g., TSeries-001_Cycle00001_Ch2_000001.ome.tif) is parsed exactly once into its
+    channel, cycle and file index. The resulting table is saved as a compact, non-pickled array file next to the
+    data (bruker_index.npz) and reused until the directory's modification time or number of tiff files changes.
 
-    def find_num_unique_strings_given_static_substring(Tag: str) -> int:
-        nonlocal _files
-        _hits = [parser(Tag, str(_file).split("_")) for _file in _files]
-        _hits = [_hit for _nested_hit in _hits for _hit in _nested_hit]
-        return list(_hits).__len__()
+    In multi-plane acquisitions each cycle is one volume (the file index is the plane), otherwise the file index
+    is the frame.
 
-    def find_num_unique_substring_containing_tag(Tag: str) -> int:
-        nonlocal _files
-        _hits = [parser(Tag, str(_file).split("_")) for _file in _files]
-        _hits = [_hit for _nested_hit in _hits for _hit in _nested_hit]
-        return list(dict.fromkeys(_hits)).__len__()
+    **Required Inputs**
+        | *ImageDirectory* : Directory containing bruker imaging data
 
-    def find_channels() -> int:
-        return find_num_unique_substring_containing_tag("Ch")
+    **Keyword Arguments**
+        | *cache* : whether to read/write the on-disk index (bool, default True)
 
-    def is_multiplane() -> bool:
-        if find_num_unique_strings_given_static_substring("Cycle00001") > 1:
-            return True
-        else:
-            return False
+    **Properties**
+        | *channels* : Number of channels
+        | *planes* : Number of planes
+        | *frames* : Number of frames
+        | *height* : Height of images (Y Pixels)
+        | *width* : Width of images (X Pixels)
+        | *contents* : Channels, Planes, Frames, Height, Width
+        | *table* : Channels x Planes x Frames array indexing into filenames (-1 where missing)
 
-    def find_planes() -> int:
-        nonlocal channels
+    **Self Methods**
+        | *files* : Ordered list of files for a specific channel and plane
+    """
 
-        if is_multiplane():
-            return find_num_unique_strings_given_static_substring("Cycle00001")//channels
+    index_filename = "bruker_index.npz"
+
+    def __init__(self, ImageDirectory: str, **kwargs: bool):
+        self.directory = ImageDirectory
+        self.filenames = np.array([], dtype=str)
+        self.channel = np.array([], dtype=np.int32)
+        self.cycle = np.array([], dtype=np.int32)
+        self.file_index = np.array([], dtype=np.int32)
+        self.height = 0
+        self.width = 0
+        self._table = None
+
+        _cache = kwargs.get("cache", True)
+
+        if not (_cache and self.load()):
+            self.scan()
+            if _cache:
+                self.save()
+
+    @property
+    def index_file(self) -> str:
+        return os.path.join(self.directory, self.index_filename)
+
+    @property
+    def is_multiplane(self) -> bool:
+        return np.unique(self.cycle).shape[0] > 1 and np.unique(self.file_index).shape[0] > 1
+
+    @property
+    def channels(self) -> int:
+        return np.unique(self.channel).shape[0]
+
+    @property
+    def planes(self) -> int:
+        if self.is_multiplane:
+            return np.unique(self.file_index).shape[0]
         else:
             return 1
 
-    def find_frames() -> int:
-        nonlocal channels
-        if is_multiplane():
-            return find_num_unique_strings_given_static_substring("000001.ome")//channels
+    @property
+    def frames(self) -> int:
+        if self.is_multiplane or np.unique(self.file_index).shape[0] == 1:
+            return np.unique(self.cycle).shape[0]
         else:
-            return find_num_unique_strings_given_static_substring("Cycle00001")//channels
+            return np.unique(self.file_index).shape[0]
+
+    @property
+    def contents(self) -> Tuple[int, int, int, int, int]:
+        return self.channels, self.planes, self.frames, self.height, self.width
+
+    @property
+    def table(self) -> np.ndarray:
+        """
+        Channels x Planes x Frames array of positions in filenames (-1 where a file is missing)
+
+        :rtype: Any
+        """
+        if self._table is None:
+            _, _channel = np.unique(self.channel, return_inverse=True)
+            if self.is_multiplane:
+                _, _plane = np.unique(self.file_index, return_inverse=True)
+                _, _frame = np.unique(self.cycle, return_inverse=True)
+            elif np.unique(self.file_index).shape[0] == 1:
+                _plane = np.zeros_like(self.file_index)
+                _, _frame = np.unique(self.cycle, return_inverse=True)
+            else:
+                _plane = np.zeros_like(self.file_index)
+                _, _frame = np.unique(self.file_index, return_inverse=True)
+            self._table = np.full((self.channels, self.planes, self.frames), -1, dtype=np.int64)
+            self._table[_channel, _plane, _frame] = np.arange(self.filenames.shape[0])
+        return self._table
+
+    def files(self, Channel: int = 0, Plane: int = 0) -> List[str]:
+        """
+        Ordered list of files for a specific channel and plane
+
+        :param Channel: Channel (zero-indexed)
+        :type Channel: int
+        :param Plane: Plane (zero-indexed)
+        :type Plane: int
+        :return: list of files ordered by frame
+        :rtype: list[str]
+        """
+        _positions = self.table[Channel, Plane, :]
+        return [os.path.join(self.directory, _name) for _name in self.filenames[_positions[_positions >= 0]]]
+
+    def scan(self) -> Self:
+        """
+        Walks the directory once and parses every filename
+
+        :rtype: None
+        """
+        _pattern = re.compile(r"Cycle(\d+)_Ch(\d+)_(\d+)(?:\.ome)?\.tif$")
+        _parsed = []
+        with os.scandir(self.directory) as _entries:
+            for _entry in _entries:
+                _match = _pattern.search(_entry.name)
+                if _match is not None and _entry.is_file():
+                    _parsed.append((_entry.name, *[int(_value) for _value in _match.groups()]))
+        _parsed.sort(key=lambda _item: (_item[2], _item[1], _item[3]))
+
+        if not _parsed:
+            raise FileNotFoundError("".join(["Could not locate bruker tiffs in ", self.directory]))
+
+        _names, _cycles, _channels, _indices = zip(*_parsed)
+        self.filenames = np.array(_names, dtype=str)
+        self.cycle = np.array(_cycles, dtype=np.int32)
+        self.channel = np.array(_channels, dtype=np.int32)
+        self.file_index = np.array(_indices, dtype=np.int32)
+        self._table = None
+
+        with Image.open(os.path.join(self.directory, self.filenames[0])) as _image:
+            self.height, self.width = np.asarray(_image).shape
+
+    def save(self) -> Self:
+        """
+        Saves the index next to the data
+
+        :rtype: None
+        """
+        def write(ModificationTime: int) -> None:
+            np.savez(self.index_file, filenames=self.filenames, channel=self.channel, cycle=self.cycle,
+                     file_index=self.file_index, dimensions=np.array([self.height, self.width]),
+                     signature=np.array([ModificationTime, self.count_tiffs()], dtype=np.int64))
 
-    def find_dimensions() -> Tuple[int, int]:
-        nonlocal ImageDirectory
-        nonlocal _files
-        return np.asarray(Image.open("".join(str(_files[0])))).shape
+        try:
+            _mtime = self.directory_mtime()
+            write(_mtime)
+            # creating the index may itself have touched the directory, if so record the new time (in-place)
+            if self.directory_mtime() != _mtime:
+                write(self.directory_mtime())
+        except OSError:
+            print("Unable to save bruker index. Proceeding anyway...")
+
+    def load(self) -> bool:
+        """
+        Loads the on-disk index if it is still valid
+
+        :return: whether a valid index was loaded
+        :rtype: bool
+        """
+        try:
+            with np.load(self.index_file, allow_pickle=False) as _index:
+                _mtime, _count = _index["signature"]
+                if _mtime != self.directory_mtime() or _count != self.count_tiffs():
+                    return False
+                self.filenames = _index["filenames"]
+                self.channel = _index["channel"]
+                self.cycle = _index["cycle"]
+                self.file_index = _index["file_index"]
+                self.height, self.width = [int(_value) for _value in _index["dimensions"]]
+                self._table = None
+                return True
+        except (OSError, KeyError, ValueError):
+            return False
+
+    def directory_mtime(self) -> int:
+        return os.stat(self.directory).st_mtime_ns
+
+    def count_tiffs(self) -> int:
+        with os.scandir(self.directory) as _entries:
+            return sum(1 for _entry in _entries if _entry.name.endswith(".tif"))
 
-    channels = find_channels()
 
+def determine_bruker_folder_contents(ImageDirectory: str) -> Tuple[int, int, int, int, int]:
+    """
+    Function determine contents of the bruker folder
+
+    Uses the cached folder index (see BrukerFolderIndex)
+
+    :param ImageDirectory: Directory containing bruker imaging data
+    :type ImageDirectory: str
+    :returns: Channels, Planes, Frames, Height, Width
+    :rtype: tuple
+    """
     # noinspection PyTypeChecker
-    return (channels, find_planes(), find_frames(), *find_dimensions())
+    return BrukerFolderIndex(ImageDirectory).contents
 
 
-def load_bruker_tiffs(ImageDirectory: str) -> Union[np.ndarray, Tuple[np.ndarray]]:
+def load_bruker_tiffs(ImageDirectory: str, **kwargs: int) -> Union[np.ndarray, List[np.ndarray]]:
     """
     Load a sequence of tiff files from a directory.
 
     Designed to compile the outputs of a certain imaging utility
     that exports recordings such that each frame is saved as a single tiff.
 
+    Frames are decoded in parallel directly into the preallocated array (see load_single_frame_tiffs). Multi-channel
+    and/or multi-plane folders are read in a single pass (see demultiplex_bruker_tiffs) and returned as a list
+    containing the images of each channel, plane or (channel, plane) combination.
+
     :param ImageDirectory: Directory containing a sequence of single frame tiff files
     :type ImageDirectory: str
+    :keyword workers: number of decoding threads (int, default os.cpu_count())
     :return: complete_image:  All tiff files in the directory compiled into a single array (Z x Y x X, uint16)
     :rtype: Any
      """
 
-    _channels, _planes, _frames, _y_pixels, _x_pixels = determine_bruker_folder_contents(ImageDirectory)
+    _workers = kwargs.get("workers", os.cpu_count())
+
+    _index = BrukerFolderIndex(ImageDirectory)
+    _channels, _planes, _frames, _y_pixels, _x_pixels = _index.contents
+
+    if _channels == 1 and _planes == 1:
+        pretty_print_bruker_command(_channels, _planes, _frames, _y_pixels, _x_pixels)
+        _files = _index.files(0, 0)
+        # Bruker is usually saved to .tif in 0-65536 (uint16) even though recording says 8192 (uint13)
+        complete_image = np.full((_frames, _y_pixels, _x_pixels), 0, dtype=np.uint16)
+        return load_single_frame_tiffs(_files[:_frames], complete_image, workers=_workers, desc="Loading Images...")
+
+    _images = demultiplex_bruker_tiffs(ImageDirectory, workers=_workers)
+    if _planes == 1:
+        return [_images[_channel, 0] for _channel in range(_channels)]
+    elif _channels == 1:
+        return [_images[0, _plane] for _plane in range(_planes)]
+    else:
+        return [_images[_channel, _plane] for _channel, _plane in itertools.product(range(_channels),
+                                                                                      range(_planes))]
+
+
+def demultiplex_bruker_tiffs(ImageDirectory: str, OutputDirectory: Optional[str] = None, **kwargs: int) \
+        -> np.ndarray:
+    """
+    Demultiplexes a multi-channel and/or multi-plane bruker folder into a single array in one pass
+
+    The folder is indexed once (see BrukerFolderIndex) and every single frame tiff is decoded (in parallel, in
+    filename order) straight into its (channel, plane, frame) position. Missing frames are left as zeros. If an
+    output directory is given, the array is a memory-mapped .npy file (demultiplexed_video.npy) that can be opened
+    with np.load(..., mmap_mode="r").
+
+    :param ImageDirectory: Directory containing a sequence of single frame tiff files
+    :type ImageDirectory: str
+    :param OutputDirectory: Directory to save the memory-mapped array in (Optional, default None: in memory)
+    :type OutputDirectory: Optional[str]
+    :keyword workers: number of decoding threads (int, default os.cpu_count())
+    :return: images [Channels x Planes x Frames x Y x X] as uint16
+    :rtype: Any
+    """
+    _workers = kwargs.get("workers", os.cpu_count())
+
+    _index = BrukerFolderIndex(ImageDirectory)
+    _channels, _planes, _frames, _y_pixels, _x_pixels = _index.contents
     pretty_print_bruker_command(_channels, _planes, _frames, _y_pixels, _x_pixels)
+    _shape = (_channels, _planes, _frames, _y_pixels, _x_pixels)
 
-    def find_files(Tag: Union[str, list[str]]):
-        nonlocal ImageDirectory
-        nonlocal _files
+    if OutputDirectory is not None:
+        _filename = "".join([OutputDirectory, "\\demultiplexed_video.npy"])
+        os.makedirs(os.path.dirname(_filename) or ".", exist_ok=True)
+        _images = np.lib.format.open_memmap(_filename, mode="w+", dtype=np.uint16, shape=_shape)
+    else:
+        _images = np.full(_shape, 0, dtype=np.uint16)
 
-        def check_file_contents(Tag_: str, File_: pathlib.WindowsPath) -> bool:
-            if Tag_ in str(File_).split("_"):
-                return True
-            else:
-                return False
+    # route every file to its (channel, plane, frame), walking the files in filename order
+    _table = _index.table.reshape(-1)
+    _destinations = np.where(_table >= 0)[0]
+    _destinations = _destinations[np.argsort(_table[_destinations], kind="stable")]
+    _files = [os.path.join(ImageDirectory, _name) for _name in _index.filenames[_table[_destinations]]]
+
+    load_single_frame_tiffs(_files, _images.reshape(-1, _y_pixels, _x_pixels), indices=_destinations.tolist(),
+                            workers=_workers, desc="Demultiplexing Images...")
+
+    if isinstance(_images, np.memmap):
+        _images.flush()
+    return _images
 
-        # reset, rather maintain code as is then make a new temporary variable since this
-        # is basically instant
-        _files = [_file for _file in pathlib.Path(ImageDirectory).rglob("*.tif")]
 
-        # now find
-        if isinstance(Tag, list):
-            Tag = "".join([Tag[0], Tag[1]])
-            _files = [_file for _file in _files if Tag in str(_file.stem)]
+def load_single_frame_tiffs(Files: Sequence[Union[str, pathlib.Path]], Destination: Optional[np.ndarray] = None,
+                            **kwargs: Union[int, str, bool]) -> np.ndarray:
+    """
+    Decodes a sequence of single frame tiff files in parallel directly into a destination array
+
+    Files are split into contiguous blocks that are handed to a pool of threads. Each frame is written to
+    Destination[index] so frame order always matches the order of Files. Destination may be a numpy array or a
+    numpy memmap; if None, a uint16 array is allocated using the shape of the first frame.
+
+    :param Files: Ordered sequence of single frame tiff files
+    :type Files: Sequence[Union[str, pathlib.Path]]
+    :param Destination: Array to decode into [Z x Y x X] (Optional, default None)
+    :type Destination: Any
+    :keyword workers: number of decoding threads (int, default os.cpu_count())
+    :keyword block_size: number of consecutive frames decoded by a thread per task (int, default 64)
+    :keyword desc: description for the progress bar (str, default "Loading Images...")
+    :keyword verbose: whether to show progress & report throughput (bool, default True)
+    :keyword indices: index in Destination of each file (Sequence[int], default position in Files)
+    :return: Destination filled with the decoded frames [Z x Y x X]
+    :rtype: Any
+    """
+    _workers = kwargs.get("workers", os.cpu_count())
+    _block_size = kwargs.get("block_size", 64)
+    _desc = kwargs.get("desc", "Loading Images...")
+    _verbose = kwargs.get("verbose", True)
+    _indices = kwargs.get("indices", None)
+
+    _num_frames = len(Files)
+    if _indices is None:
+        _indices = range(_num_frames)
+    elif len(_indices) != _num_frames:
+        raise ValueError("An index must be supplied for every file")
+
+    if Destination is None:
+        with Image.open(str(Files[0])) as _image:
+            _y_pixels, _x_pixels = np.asarray(_image).shape
+        Destination = np.full((max(_indices, default=-1) + 1, _y_pixels, _x_pixels), 0, dtype=np.uint16)
+
+    if _num_frames > 0 and Destination.shape[0] <= max(_indices):
+        raise ValueError("Destination cannot hold the number of frames supplied")
+
+    def load_block(Start: int) -> int:
+        nonlocal Files
+        nonlocal Destination
+        _stop = min(Start + _block_size, _num_frames)
+        for _frame in range(Start, _stop):
+            with Image.open(str(Files[_frame])) as _image:
+                Destination[_indices[_frame], :, :] = np.asarray(_image)
+        return _stop - Start
+
+    _start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=_workers) as _executor, \
+            tqdm(total=_num_frames, desc=_desc, disable=not _verbose) as _pbar:
+        for _frames_loaded in _executor.map(load_block, range(0, _num_frames, _block_size)):
+            _pbar.update(_frames_loaded)
+    _elapsed = time.perf_counter() - _start_time
+
+    if _verbose:
+        _megabytes = _num_frames * np.prod(Destination.shape[1:]) * Destination.itemsize / 1e6
+        print("".join(["Decoded ", str(_num_frames), " frames in ", format(_elapsed, ".2f"), " s (",
+                       format(_num_frames / max(_elapsed, 1e-9), ".1f"), " frames/s, ",
+                       format(_megabytes / max(_elapsed, 1e-9), ".1f"), " MB/s)"]))
+
+    return Destination
+
+
+def select_bruker_files(Index: BrukerFolderIndex, *args: Union[int, tuple[int]]) -> Optional[List[str]]:
+    """
+    Selects the files of a specific channel and/or plane from an indexed bruker folder
+
+    Without args the folder must contain a single channel and a single plane
+
+    :param Index: Indexed bruker folder
+    :type Index: BrukerFolderIndex
+    :param args: optional argument to indicate a specific channel and/or plane
+    :type args: int
+    :return: ordered list of files or None if the selection is ambiguous
+    :rtype: Optional[list[str]]
+    """
+    _channels, _planes = Index.channels, Index.planes
+
+    if args:
+        # unpack if necessary
+        if isinstance(args[0], tuple):
+            _c = args[0][0]
+            _p = args[0][1]
+            args = tuple([_c, _p])
+
+        if _channels > 1 and _planes > 1 and len(args) >= 2:
+            return Index.files(args[0], args[1])
+        elif _channels == 1 and _planes > 1 and len(args) == 1:
+            return Index.files(0, args[0])
+        elif _channels == 1 and _planes > 1 and len(args) >= 2:
+            return Index.files(0, args[1])
+        elif _channels > 1 and _planes == 1:
+            return Index.files(args[0], 0)
         else:
-            _files = [_file for _file in _files if check_file_contents(Tag, _file)]
+            return Index.files(0, 0)
+    else:
+        try:
+            assert(_channels == 1)
+        except AssertionError:
+            print("Folder contains multiple channels")
+            return
+        try:
+            assert(_planes == 1)
+        except AssertionError:
+            print("Folder contains multiple planes")
+            return
+        return Index.files(0, 0)
 
-    def load_images():
-        nonlocal _files
-        nonlocal _frames
-        nonlocal _y_pixels
-        nonlocal _x_pixels
-        nonlocal _tqdm_desc
 
-        def load_image():
-            nonlocal ImageDirectory
-            nonlocal _files
-            nonlocal _file
-            return np.asarray(Image.open(str(_files[_file])))
+def convert_bruker_to_binary(ImageDirectory: str, OutputDirectory: str, *args: Union[int, tuple[int]],
+                             **kwargs: int) -> Optional[Tuple[int, int, int]]:
+    """
+    Converts a sequence of single frame tiff files directly into a binary video (binary_video & video_meta.txt)
 
-        # Bruker is usually saved to .tif in 0-65536 (uint16) even though recording says 8192 (uint13)
-        complete_image = np.full((_frames, _y_pixels, _x_pixels), 0, dtype=np.uint16)
-        for _file in tqdm(
-                range(_frames),
-                total=_frames,
-                desc=_tqdm_desc,
-                disable=False,
-        ):
-            complete_image[_file, :, :] = load_image()
+    Frames are decoded chunk by chunk straight into a preallocated memory-mapped binary video, skipping the
+    intermediate tiff stacks (see repackage_bruker_tiffs). Peak memory does not depend on the length of the
+    recording and the data is read once and written once.
 
-        return complete_image
+    :param ImageDirectory: Directory containing a sequence of single frame tiff files
+    :type ImageDirectory: str
+    :param OutputDirectory: Directory where the binary video will be saved
+    :type OutputDirectory: str
+    :param args: optional argument to indicate the conversion of a specific channel and/or plane
+    :type args: int
+    :keyword chunk_size: number of frames decoded before flushing to disk (int, default 7000)
+    :keyword workers: number of decoding threads (int, default os.cpu_count())
+    :keyword header: save a self-describing binary video with per-chunk checksums (bool, default False)
+    :keyword frame_rate: frame rate stored in the header (float, default nan: unknown)
+    :return: Frames, Height, Width of the binary video
+    :rtype: Optional[tuple[int, int, int]]
+    """
+    _chunk_size = kwargs.get("chunk_size", 7000)
+    _workers = kwargs.get("workers", os.cpu_count())
+    _header = kwargs.get("header", False)
 
-    _files = [_file for _file in pathlib.Path(ImageDirectory).rglob("*.tif")]
+    _index = BrukerFolderIndex(ImageDirectory)
+    _channels, _planes, _frames, _y, _x = _index.contents
+    pretty_print_bruker_command(_channels, _planes, _frames, _y, _x)
 
-    if _channels == 1 and _planes == 1:
-        _tqdm_desc = "Loading Images..."
-        return load_images()
-    elif _channels > 1 and _planes == 1:
-        images = []
-        for _channel in range(_channels):
-            _tqdm_desc = "".join(["Loading Channel ", str(_channel+1), " Images..."])
-            _tag = "".join(["Ch", str(_channel+1)])
-            find_files(_tag)
-            images.append(load_images())
-        return images
-    elif _channels == 1 and _planes > 1:
-        images = []
-        _base_tag = "00000"
-        for _plane in range(_planes):
-            _tqdm_desc = "".join(["Loading Plane ", str(_plane), " Images..."])
-            _tag = "".join([_base_tag, str(_plane+1), ".ome"])
-            find_files(_tag)
-            images.append(load_images())
-        return images
-    elif _channels > 1 and _planes > 1:
-        images = []
-        _base_tag = "00000"
-        for _channel, _plane in itertools.combinations(range(_channels), range(_planes)):
-            _tqdm_desc = "".join(["Loading Plane ", str(_plane),
-                                  " Channel ", str(_channel), " Images..."])
-            _tag = ["".join(["Ch", str(_channel)]), "".join([_base_tag, str(_plane+1), ".ome"])]
-            find_files(_tag)
-            images.append(load_images())
-        return images
-
-
-def load_single_tiff(Filename: str, NumFrames: int) -> np.ndarray:
+    _files = select_bruker_files(_index, *args)
+    if _files is None:
+        return
+
+    _frames = min(_frames, len(_files))
+    _video_file = "".join([OutputDirectory, "\\binary_video"])
+    if _header:
+        _header = BinaryVideoHeader((_frames, _y, _x), np.uint16, frame_rate=kwargs.get("frame_rate", np.nan),
+                                    chunk_frames=_chunk_size, checksums=[])
+        os.makedirs(os.path.dirname(_video_file) or ".", exist_ok=True)
+        _binary_video = np.memmap(_video_file, dtype=np.uint16, mode="w+", shape=(_frames, _y, _x),
+                                  offset=_header.data_offset)
+    else:
+        save_binary_meta((_frames, _y, _x), np.uint16, OutputDirectory)
+        _binary_video = np.memmap(_video_file, dtype=np.uint16, mode="w+", shape=(_frames, _y, _x))
+
+    _start_time = time.perf_counter()
+    for _start in tqdm(
+            range(0, _frames, _chunk_size),
+            total=math.ceil(_frames / _chunk_size),
+            desc="Converting Bruker Tiffs to Binary...",
+            disable=False,
+    ):
+        _stop = min(_start + _chunk_size, _frames)
+        load_single_frame_tiffs(_files[_start:_stop], _binary_video[_start:_stop], workers=_workers, verbose=False)
+        if _header:
+            _header.checksums.extend(BinaryVideoHeader.calculate_checksums(_binary_video[_start:_stop], _chunk_size))
+        # flush so dirty pages never accumulate beyond a chunk
+        _binary_video.flush()
+    del _binary_video
+
+    if _header:
+        with open(_video_file, "r+b") as f:
+            f.write(_header.pack())
+
+    _elapsed = time.perf_counter() - _start_time
+    print("".join(["Converted ", str(_frames), " frames in ", format(_elapsed, ".2f"), " s (",
+                   format(_frames / max(_elapsed, 1e-9), ".1f"), " frames/s)"]))
+    return _frames, _y, _x
+
+
+class TiffVolume:
+    """
+    Lazy, virtually concatenated volume of one or more tiff files
+
+    Each file is opened once to count its pages; no image data is read until the volume is indexed. Indexing
+    follows numpy semantics on the concatenated [Z x Y x X] volume and only the pages of the requested frames are
+    read. Uncompressed, contiguous pages are read through a memory map of the file instead of being decoded; each
+    file is mapped when its frames are first read.
+
+    **Required Inputs**
+        | *Files* : Ordered sequence of tiff files
+
+    **Keyword Arguments**
+        | *frames* : number of frames to use from each file (Sequence[int], default all pages)
+        | *memmap* : whether to memory map uncompressed, contiguous files (bool, default True)
+
+    **Properties**
+        | *shape* : Frames, Height, Width of the concatenated volume
+        | *dtype* : type of the images
+        | *offsets* : first frame of each file in the concatenated volume (length files + 1)
+
+    **Self Methods**
+        | *read* : Reads specific frames into a numpy array
+        | *close* : Closes all open files
+    """
+
+    def __init__(self, Files: Sequence[Union[str, pathlib.Path]], **kwargs: Union[Sequence[int], bool]):
+        _frames = kwargs.get("frames", None)
+        _memmap = kwargs.get("memmap", True)
+
+        self.files = [str(_file) for _file in Files]
+        if not self.files:
+            raise FileNotFoundError("No tiff files were provided")
+
+        self._handles = [tifffile.TiffFile(_file) for _file in self.files]
+        self._memmap = _memmap
+        self._maps = [None] * len(self.files)
+        self._page_views = [None] * len(self.files)
+        self._mapped = [False] * len(self.files)
+
+        _counts = [len(_handle.pages) for _handle in self._handles]
+        if _frames is not None:
+            _counts = [min(_count, _limit) for _count, _limit in zip(_counts, _frames)]
+        self.offsets = np.concatenate([[0], np.cumsum(_counts)]).astype(np.int64)
+
+        _first_page = self._handles[0].pages[0]
+        self._frame_shape = tuple(_first_page.shape)
+        self._dtype = np.dtype(_first_page.dtype)
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None) -> np.ndarray:
+        _images = self.read(np.arange(len(self)))
+        if dtype is not None:
+            return _images.astype(dtype, copy=False)
+        return _images
+
+    def __getitem__(self, Key) -> np.ndarray:
+        if not isinstance(Key, tuple):
+            Key = (Key, )
+        _frames = Key[0]
+
+        if isinstance(_frames, (int, np.integer)):
+            _frame = int(_frames)
+            if _frame < 0:
+                _frame += len(self)
+            if not 0 <= _frame < len(self):
+                raise IndexError("".join(["Frame ", str(_frames), " is out of bounds for volume with ",
+                                          str(len(self)), " frames"]))
+            return self.read(np.array([_frame]))[0][Key[1:]]
+        elif _frames is Ellipsis:
+            return self.read(np.arange(len(self)))[Key]
+
+        return self.read(np.arange(len(self))[_frames])[(slice(None), ) + Key[1:]]
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (len(self), ) + self._frame_shape
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    def read(self, Frames: Union[Sequence[int], np.ndarray], **kwargs: Union[str, bool]) -> np.ndarray:
+        """
+        Reads specific frames of the concatenated volume
+
+        :param Frames: indices of the frames to read
+        :type Frames: Union[Sequence[int], np.ndarray]
+        :keyword desc: description of progress bar (str, default None: no progress bar)
+        :return: numpy array [Z x Y x X]
+        :rtype: np.ndarray
+        """
+        _desc = kwargs.get("desc", None)
+
+        Frames = np.asarray(Frames, dtype=np.int64).ravel()
+        _images = np.empty((Frames.shape[0], ) + self._frame_shape, dtype=self._dtype)
+        _owner = np.searchsorted(self.offsets, Frames, side="right") - 1
+        _owners = np.unique(_owner)
+
+        for _file in tqdm(
+                _owners,
+                total=_owners.shape[0],
+                desc=_desc,
+                disable=_desc is None,
+        ):
+            _selected = np.where(_owner == _file)[0]
+            _pages = Frames[_selected] - self.offsets[_file]
+            # map the pages of a file on first access, so constructing the volume does not walk every page
+            if self._memmap and not self._mapped[_file]:
+                self._page_views[_file] = self._map_pages(_file)
+                self._mapped[_file] = True
+            if self._page_views[_file] is not None:
+                for _position, _page in zip(_selected, _pages):
+                    _images[_position] = self._page_views[_file][_page]
+            else:
+                _images[_selected] = self._handles[_file].asarray(key=_pages.tolist()).reshape(
+                    (-1, ) + self._frame_shape)
+
+        return _images
+
+    def close(self) -> None:
+        """
+        Closes all open files
+
+        :rtype: None
+        """
+        for _handle in self._handles:
+            _handle.close()
+        self._page_views = [None] * len(self.files)
+        self._maps = [None] * len(self.files)
+        self._mapped = [False] * len(self.files)
+
+    def _map_pages(self, File: int) -> Optional[List[np.ndarray]]:
+        # every page must be uncompressed and stored in a single contiguous strip, otherwise pages are decoded
+        _handle = self._handles[File]
+        _type = np.dtype(self._dtype).newbyteorder(_handle.byteorder)
+        _views = []
+        for _page in range(int(self.offsets[File + 1] - self.offsets[File])):
+            _tiff_page = _handle.pages[_page]
+            if not _tiff_page.is_contiguous or tuple(_tiff_page.shape) != self._frame_shape:
+                return None
+            if self._maps[File] is None:
+                self._maps[File] = np.memmap(self.files[File], dtype=np.uint8, mode="r")
+            _offset = _tiff_page.dataoffsets[0]
+            _views.append(self._maps[File][_offset:_offset + _type.itemsize * math.prod(self._frame_shape)]
+                          .view(_type).reshape(self._frame_shape))
+        return _views
+
+
+def load_single_tiff(Filename: str, NumFrames: int, **kwargs: bool) -> Union[np.ndarray, TiffVolume]:
     """
     Load a single tiff file
 
@@ -180,47 +681,609 @@ def load_single_tiff(Filename: str, NumFrames: int) -> np.ndarray:
     :param NumFrames: number of frames
     :type Filename: str
     :type NumFrames: int
+    :keyword lazy: return a lazy TiffVolume instead of reading the images (bool, default False)
     :return: numpy array [Z x Y x X]
-    :rtype: Any
+    :rtype: Union[np.ndarray, TiffVolume]
     """
+    if kwargs.get("lazy", False):
+        return TiffVolume([Filename], frames=[NumFrames])
     return tifffile.imread(Filename, key=range(0, NumFrames, 1))
 
 
-def load_all_tiffs(ImageDirectory: str) -> np.ndarray:
+def load_all_tiffs(ImageDirectory: str, **kwargs: bool) -> Union[np.ndarray, TiffVolume]:
     """
     Load a sequence of tiff stacks
 
     :param ImageDirectory: Directory containing a sequence of tiff stacks
     :type ImageDirectory: str
+    :keyword lazy: return a lazy TiffVolume instead of reading the images (bool, default False)
     :return: complete_image numpy array [Z x Y x X] as uint16
-    :rtype: Any
+    :rtype: Union[np.ndarray, TiffVolume]
     """
-    _fnames = [str(_fname.name) for _fname in pathlib.Path(ImageDirectory).glob("*") if ".tif" in _fname.suffix]
-    y_pix, x_pix = tifffile.TiffFile(ImageDirectory + "\\" + _fnames[0]).pages[0].shape
-    _num_frames = [] # initialize
-    [_num_frames.append(len(tifffile.TiffFile(ImageDirectory + "\\" + _fname).pages)) for _fname in _fnames]
-    _total_frames = sum(_num_frames)
-    complete_image = np.full((_total_frames, y_pix, x_pix), 0, dtype=np.uint16)
-    _last_frame = 0
-
-    for _fname in tqdm(
-            range(len(_fnames)),
-            total=len(_fnames),
-            desc="Loading Images...",
-            disable=False,
-    ):
-        complete_image[_last_frame:_last_frame+_num_frames[_fname], :, :] = \
-            load_single_tiff(ImageDirectory + "\\" + _fnames[_fname], _num_frames[_fname])
-        _last_frame += _num_frames[_fname]
+    _fnames = sorted([_fname for _fname in pathlib.Path(ImageDirectory).glob("*") if ".tif" in _fname.suffix])
+    _volume = TiffVolume(_fnames)
 
+    if kwargs.get("lazy", False):
+        return _volume
+
+    with _volume:
+        complete_image = _volume.read(np.arange(len(_volume)), desc="Loading Images...").astype(np.uint16,
+                                                                                              copy=False)
     return complete_image
 
 
-def load_raw_binary(Filename: Union[str, None], MetaFile: Union[str, None], *args: Optional[str]) -> np.ndarray:
+class BinaryVideoHeader:
+    """
+    Fixed, versioned header of a self-describing binary video
+
+    The header replaces video_meta.txt. It is stored at the start of the binary video and describes the shape,
+    type (including byte order), frame rate and the chunk index (byte offset, byte count & optional crc32 of each
+    chunk of frames). The fixed part has a constant size and the chunk index a constant size per chunk, so the
+    header is read in O(1) and the images memory-mapped at the (page-aligned) data offset. Binary videos without a
+    header (binary_video & video_meta.txt) are still read by all loaders.
+
+    **Required Inputs**
+        | *Shape* : Frames, Height, Width of the binary video
+        | *Type* : type of the images
+
+    **Keyword Arguments**
+        | *frame_rate* : frame rate of the video (float, default nan: unknown)
+        | *chunk_frames* : number of frames per chunk (int, default all frames)
+        | *checksums* : crc32 of each chunk (Sequence[int], default None: no checksums)
+
+    **Properties**
+        | *chunks* : number of chunks
+        | *frame_bytes* : number of bytes per frame
+        | *data_offset* : byte offset of the images in the binary video
+        | *chunk_index* : Chunks x 3 array containing the byte offset (relative to data_offset), byte count and
+            crc32 of each chunk
+
+    **Self Methods**
+        | *pack* : Packs the header into bytes
+        | *verify* : Verifies the checksums of the images
+    """
+
+    magic = b"IVIPBIN\x00"
+    version = 1
+    alignment = 4096
+    # magic, version, flags, data offset, frames, height, width, type, frame rate, chunk frames, chunks
+    _fixed = struct.Struct("<8sHHQQQQ8sdQQ")
+    _entry = struct.Struct("<QQI")
+
+    def __init__(self, Shape: Tuple[int, int, int], Type: Union[np.dtype, str], **kwargs):
+        self.shape = tuple(int(_dim) for _dim in Shape)
+        self.dtype = np.dtype(Type)
+        self.frame_rate = float(kwargs.get("frame_rate", np.nan))
+        self.chunk_frames = int(max(kwargs.get("chunk_frames", self.shape[0]) or 1, 1))
+        self.checksums = kwargs.get("checksums", None)
+
+    @property
+    def chunks(self) -> int:
+        return math.ceil(self.shape[0] / self.chunk_frames)
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.shape[1] * self.shape[2] * self.dtype.itemsize
+
+    @property
+    def data_offset(self) -> int:
+        _size = self._fixed.size + self.chunks * self._entry.size
+        return math.ceil(_size / self.alignment) * self.alignment
+
+    @property
+    def chunk_index(self) -> np.ndarray:
+        _starts = np.arange(0, self.shape[0], self.chunk_frames, dtype=np.int64)
+        _stops = np.minimum(_starts + self.chunk_frames, self.shape[0])
+        _index = np.zeros((self.chunks, 3), dtype=np.int64)
+        _index[:, 0] = _starts * self.frame_bytes
+        _index[:, 1] = (_stops - _starts) * self.frame_bytes
+        if self.checksums is not None:
+            _index[:, 2] = self.checksums
+        return _index
+
+    def pack(self) -> bytes:
+        """
+        Packs the header into bytes (padded to the data offset)
+
+        :return: header
+        :rtype: bytes
+        """
+        _flags = int(self.checksums is not None)
+        _header = [self._fixed.pack(self.magic, self.version, _flags, self.data_offset, *self.shape,
+                                    self.dtype.str.encode("ascii"), self.frame_rate, self.chunk_frames,
+                                    self.chunks)]
+        _header.extend([self._entry.pack(*_entry) for _entry in self.chunk_index.tolist()])
+        _header = b"".join(_header)
+        return _header + bytes(self.data_offset - len(_header))
+
+    def verify(self, Images: np.ndarray) -> bool:
+        """
+        Verifies the checksums of the images
+
+        :param Images: Images described by this header [Z x Y x X]
+        :type Images: np.ndarray
+        :return: whether the checksums match (True if there are no checksums)
+        :rtype: bool
+        """
+        if self.checksums is None:
+            return True
+        return list(self.checksums) == BinaryVideoHeader.calculate_checksums(Images, self.chunk_frames)
+
+    @staticmethod
+    def calculate_checksums(Images: np.ndarray, ChunkFrames: int) -> List[int]:
+        """
+        Calculates the crc32 of each chunk of frames
+
+        :param Images: Images [Z x Y x X]
+        :type Images: np.ndarray
+        :param ChunkFrames: number of frames per chunk
+        :type ChunkFrames: int
+        :return: crc32 of each chunk
+        :rtype: list[int]
+        """
+        return [zlib.crc32(np.ascontiguousarray(Images[_start:_start + ChunkFrames]).data)
+                for _start in range(0, Images.shape[0], ChunkFrames)]
+
+    @classmethod
+    def read(cls, Filename: str) -> Optional[BinaryVideoHeader]:
+        """
+        Reads the header of a binary video
+
+        :param Filename: filename for binary video
+        :type Filename: str
+        :return: header or None if the binary video has no header
+        :rtype: Optional[BinaryVideoHeader]
+        """
+        try:
+            with open(Filename, "rb") as f:
+                _fixed = f.read(cls._fixed.size)
+                if len(_fixed) < cls._fixed.size or not _fixed.startswith(cls.magic):
+                    return None
+                _magic, _version, _flags, _data_offset, _frames, _y, _x, _type, _frame_rate, _chunk_frames, \
+                    _chunks = cls._fixed.unpack(_fixed)
+                if _version > cls.version:
+                    raise ValueError("".join(["Binary video header version ", str(_version),
+                                              " is not supported (maximum ", str(cls.version), ")"]))
+                _index = np.frombuffer(f.read(_chunks * cls._entry.size),
+                                       dtype=np.dtype([("offset", "<u8"), ("bytes", "<u8"), ("crc", "<u4")]))
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+        _checksums = _index["crc"].tolist() if _flags & 1 else None
+        return cls((_frames, _y, _x), _type.rstrip(b"\x00").decode("ascii"), frame_rate=_frame_rate,
+                   chunk_frames=_chunk_frames, checksums=_checksums)
+
+
+class ChunkedVideo:
+    """
+    Chunked, compressed on-disk video with random access by frame range and spatial tile
+
+    The video is split into (time, y, x) chunks that are compressed independently (zlib & lzma, blosc & zstd if
+    installed) and appended to a single file (chunked_video). A small index (shape, type, chunking, codec, byte
+    offset & count of each chunk) is kept at the end of the file, so indexing only decompresses the chunks that
+    overlap the requested frames and pixels. Chunks are compressed and decompressed in parallel.
+
+    Indexing follows numpy semantics (like a numpy.memmap). Assignments must use integers or slices with a step of
+    one. Partially written chunks are kept in memory until they are complete or the video is flushed/closed.
+    Rewritten chunks are appended, so a video whose file is mostly unused is compacted when it is closed.
+
+    **Required Inputs**
+        | *Filename* : filename for chunked video
+
+    **Keyword Arguments**
+        | *Mode* : "r" (read), "r+" (read & write) or "w" (create) (str, default "r")
+        | *Shape* : Frames, Height, Width of a new video (tuple[int, int, int], default None)
+        | *Type* : type of a new video (np.dtype, default np.uint16)
+        | *chunks* : chunk shape (time, y, x) of a new video (tuple[int, int, int], default (64, 128, 128))
+        | *codec* : compression codec of a new video (str, default "zlib")
+        | *level* : compression level of a new video (int, default codec specific)
+        | *shuffle* : byte-shuffle chunks before compression (bool, default True)
+        | *frame_rate* : frame rate of a new video (float, default nan: unknown)
+        | *workers* : number of compression threads (int, default os.cpu_count())
+        | *cache* : number of decompressed chunks kept in memory (int, default 16)
+        | *compact* : compact the file on close when more than this fraction is unused (float, default 0.1)
+
+    **Properties**
+        | *shape* : Frames, Height, Width
+        | *dtype* : type of the images
+        | *chunks* : chunk shape (time, y, x)
+        | *grid* : number of chunks along each dimension
+
+    **Self Methods**
+        | *flush* : Writes pending chunks and the index to disk
+        | *close* : Flushes and closes the file
+    """
+
+    magic = b"IVIPCHK\x00"
+    version = 1
+    _pointer = struct.Struct("<QQ")
+
+    # compress(buffer, level, itemsize), decompress(buffer), default level
+    codecs = {
+        "raw": (lambda Buffer, Level, ItemSize: bytes(Buffer), lambda Buffer: Buffer, 0),
+        "zlib": (lambda Buffer, Level, ItemSize: zlib.compress(Buffer, Level), zlib.decompress, 3),
+        "lzma": (lambda Buffer, Level, ItemSize: lzma.compress(Buffer, preset=Level), lzma.decompress, 1),
+    }
+    if blosc is not None:
+        codecs["blosc"] = (lambda Buffer, Level, ItemSize: blosc.compress(Buffer, typesize=ItemSize, clevel=Level,
+                                                                          cname="zstd"), blosc.decompress, 5)
+    if zstandard is not None:
+        codecs["zstd"] = (lambda Buffer, Level, ItemSize: zstandard.ZstdCompressor(level=Level).compress(Buffer),
+                          lambda Buffer: zstandard.ZstdDecompressor().decompress(Buffer), 3)
+
+    def __init__(self, Filename: str, Mode: str = "r", Shape: Optional[Tuple[int, int, int]] = None,
+                 Type: Optional[Union[np.dtype, str]] = np.uint16, **kwargs):
+        self.filename = Filename
+        self.mode = Mode
+        self._workers = kwargs.get("workers", os.cpu_count())
+        self._executor = None
+        self._cache = OrderedDict()
+        self._cache_size = kwargs.get("cache", 16)
+        self._compact_fraction = kwargs.get("compact", 0.1)
+        self._lock = threading.Lock()
+        self._stale = Mode == "w"
+        self._dirty = {}
+        self._file = None
+
+        if Mode == "w":
+            if Shape is None:
+                raise ValueError("A new chunked video requires a shape")
+            _codec = kwargs.get("codec", "zlib")
+            if _codec not in self.codecs:
+                raise ValueError("".join(["Codec ", str(_codec), " is not available (available: ",
+                                          ", ".join(self.codecs.keys()), ")"]))
+            _level = kwargs.get("level", None)
+            self._meta = {
+                "version": self.version,
+                "shape": [int(_dim) for _dim in Shape],
+                "dtype": np.dtype(Type).str,
+                "chunks": [int(min(max(_chunk, 1), max(_dim, 1))) for _chunk, _dim in
+                           zip(kwargs.get("chunks", (64, 128, 128)), Shape)],
+                "codec": _codec,
+                "level": int(self.codecs.get(_codec)[2] if _level is None else _level),
+                "shuffle": bool(kwargs.get("shuffle", True)),
+                "frame_rate": float(kwargs.get("frame_rate", np.nan)),
+            }
+            self._offsets = np.full(self.grid, -1, dtype=np.int64)
+            self._nbytes = np.zeros(self.grid, dtype=np.int64)
+            os.makedirs(os.path.dirname(Filename) or ".", exist_ok=True)
+            self._file = open(Filename, "w+b")
+            self._file.write(self.magic)
+            self._file.write(self._pointer.pack(0, 0))
+            self._end = self._file.tell()
+            self.flush()
+        elif Mode in ("r", "r+"):
+            self._file = open(Filename, "rb" if Mode == "r" else "r+b")
+            if self._file.read(len(self.magic)) != self.magic:
+                self._file.close()
+                raise ValueError("".join([str(Filename), " is not a chunked video"]))
+            _index_offset, _index_bytes = self._pointer.unpack(self._file.read(self._pointer.size))
+            self._file.seek(_index_offset)
+            self._meta = json.loads(self._file.read(_index_bytes).decode("utf-8"))
+            if self._meta.get("version") > self.version:
+                raise ValueError("".join(["Chunked video version ", str(self._meta.get("version")),
+                                          " is not supported (maximum ", str(self.version), ")"]))
+            self._offsets = np.asarray(self._meta.pop("offsets"), dtype=np.int64).reshape(self.grid)
+            self._nbytes = np.asarray(self._meta.pop("nbytes"), dtype=np.int64).reshape(self.grid)
+            # new chunks are appended behind the current index so the file stays valid until the next flush
+            self._end = _index_offset + _index_bytes
+            self._index_bytes = _index_bytes
+        else:
+            raise ValueError("".join(["Mode must be r, r+ or w (not ", str(Mode), ")"]))
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __del__(self):
+        # noinspection PyBroadException
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None) -> np.ndarray:
+        _images = self[:]
+        if dtype is not None:
+            return _images.astype(dtype, copy=False)
+        return _images
+
+    def __getitem__(self, Key) -> np.ndarray:
+        _bounds, _local = self._bounding_box(Key)
+        _images = np.zeros(tuple(_stop - _start for _start, _stop in _bounds), dtype=self.dtype)
+
+        _chunks = list(self._overlapping_chunks(_bounds))
+        for _chunk, _data in zip(_chunks, self._pool().map(self._read_chunk, _chunks)):
+            _source, _destination = self._overlap(_chunk, _bounds)
+            _images[_destination] = _data[_source]
+
+        return _images[_local]
+
+    def __setitem__(self, Key, Value: Union[np.ndarray, int, float]) -> None:
+        if self.mode == "r":
+            raise ValueError("Chunked video is read-only")
+
+        Key = self._expand_key(Key)
+        if not all(isinstance(_key, (int, np.integer)) or (isinstance(_key, slice) and _key.step in (None, 1))
+                   for _key in Key):
+            raise IndexError("Assignments to a chunked video only support integers and slices with a step of one")
+        _bounds, _local = self._bounding_box(Key)
+        _box = tuple(_stop - _start for _start, _stop in _bounds)
+        _target = tuple(_dim for _dim, _key in zip(_box, _local) if not isinstance(_key, int))
+        Value = np.broadcast_to(np.asarray(Value, dtype=self.dtype), _target).reshape(_box)
+
+        _complete = []
+        for _chunk in self._overlapping_chunks(_bounds):
+            _source, _destination = self._overlap(_chunk, _bounds)
+            if _chunk not in self._dirty:
+                _extent = self._chunk_extent(_chunk)
+                _shape = tuple(_stop - _start for _start, _stop in _extent)
+                if self._offsets[_chunk] >= 0:
+                    self._dirty[_chunk] = (self._read_chunk(_chunk).copy(), np.ones(_shape, dtype=bool))
+                else:
+                    self._dirty[_chunk] = (np.zeros(_shape, dtype=self.dtype), np.zeros(_shape, dtype=bool))
+            _data, _written = self._dirty.get(_chunk)
+            _data[_source] = Value[_destination]
+            _written[_source] = True
+            if _written.all():
+                _complete.append(_chunk)
+
+        self._write_chunks(_complete)
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return tuple(self._meta.get("shape"))
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(self._meta.get("dtype"))
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def chunks(self) -> Tuple[int, int, int]:
+        return tuple(self._meta.get("chunks"))
+
+    @property
+    def grid(self) -> Tuple[int, int, int]:
+        return tuple(math.ceil(_dim / _chunk) for _dim, _chunk in zip(self.shape, self.chunks))
+
+    @property
+    def frame_rate(self) -> float:
+        return self._meta.get("frame_rate")
+
+    @property
+    def nbytes(self) -> int:
+        return math.prod(self.shape) * self.dtype.itemsize
+
+    @property
+    def stored_bytes(self) -> int:
+        return int(self._nbytes.sum())
+
+    def flush(self) -> None:
+        """
+        Writes pending chunks and the index to disk
+
+        :rtype: None
+        """
+        if self.mode == "r" or self._file is None:
+            return
+        self._write_chunks(list(self._dirty.keys()))
+        if not self._stale:
+            return
+        _index = self._index(self._offsets)
+        self._file.seek(self._end)
+        self._file.write(_index)
+        self._file.truncate()
+        self._file.seek(len(self.magic))
+        self._file.write(self._pointer.pack(self._end, len(_index)))
+        self._file.flush()
+        self._end += len(_index)
+        self._index_bytes = len(_index)
+        self._stale = False
+
+    def close(self) -> None:
+        """
+        Flushes and closes the file
+
+        :rtype: None
+        """
+        if self._file is None:
+            return
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._cache.clear()
+        if self.mode != "r" and self._end - self._live_bytes() > self._compact_fraction * self._end:
+            self._compact()
+        else:
+            self._file.close()
+            self._file = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # one executor per video, so repeated indexing does not pay for starting threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._workers)
+        return self._executor
+
+    def _index(self, Offsets: np.ndarray) -> bytes:
+        return json.dumps({**self._meta, "offsets": Offsets.ravel().tolist(),
+                           "nbytes": self._nbytes.ravel().tolist()}).encode("utf-8")
+
+    def _live_bytes(self) -> int:
+        return len(self.magic) + self._pointer.size + self.stored_bytes + self._index_bytes
+
+    def _compact(self) -> None:
+        # copy the live chunks (in file order) & a new index to a temporary file that replaces the video
+        _partial = "".join([self.filename, ".partial"])
+        _offsets = np.full(self.grid, -1, dtype=np.int64)
+        with open(_partial, "wb") as f:
+            f.write(self.magic)
+            f.write(self._pointer.pack(0, 0))
+            for _flat in np.argsort(self._offsets, axis=None):
+                _chunk = np.unravel_index(_flat, self.grid)
+                if self._offsets[_chunk] < 0:
+                    continue
+                self._file.seek(int(self._offsets[_chunk]))
+                _offsets[_chunk] = f.tell()
+                f.write(self._file.read(int(self._nbytes[_chunk])))
+            _index = self._index(_offsets)
+            _end = f.tell()
+            f.write(_index)
+            f.seek(len(self.magic))
+            f.write(self._pointer.pack(_end, len(_index)))
+        # the video must be closed before it can be replaced on windows
+        self._file.close()
+        self._file = None
+        os.replace(_partial, self.filename)
+        self._offsets = _offsets
+        self._end = _end + len(_index)
+
+    def _expand_key(self, Key) -> tuple:
+        if not isinstance(Key, tuple):
+            Key = (Key, )
+        if any(_key is Ellipsis for _key in Key):
+            _position = [_key is Ellipsis for _key in Key].index(True)
+            Key = Key[:_position] + (slice(None), ) * (self.ndim - len(Key) + 1) + Key[_position + 1:]
+        if len(Key) > self.ndim:
+            raise IndexError("".join(["Too many indices for chunked video with ", str(self.ndim), " dimensions"]))
+        return Key + (slice(None), ) * (self.ndim - len(Key))
+
+    def _bounding_box(self, Key) -> Tuple[List[Tuple[int, int]], tuple]:
+        # bounds of the requested region & the key relative to those bounds (same indexing semantics)
+        _bounds = []
+        _local = []
+        for _key, _dim in zip(self._expand_key(Key), self.shape):
+            if isinstance(_key, (int, np.integer)):
+                _index = int(_key) + _dim if _key < 0 else int(_key)
+                if not 0 <= _index < _dim:
+                    raise IndexError("".join(["Index ", str(_key), " is out of bounds for size ", str(_dim)]))
+                _bounds.append((_index, _index + 1))
+                _local.append(0)
+            elif isinstance(_key, slice):
+                _range = range(*_key.indices(_dim))
+                if len(_range) == 0:
+                    _bounds.append((0, 0))
+                    _local.append(slice(0, 0))
+                    continue
+                _start = min(_range[0], _range[-1])
+                _bounds.append((_start, max(_range[0], _range[-1]) + 1))
+                _stop = _range.stop - _start
+                _local.append(slice(_range.start - _start, _stop if _stop >= 0 else None, _range.step))
+            else:
+                _indices = np.arange(_dim)[_key]
+                if _indices.size == 0:
+                    _bounds.append((0, 0))
+                else:
+                    _bounds.append((int(_indices.min()), int(_indices.max()) + 1))
+                _local.append(_indices - _bounds[-1][0])
+        return _bounds, tuple(_local)
+
+    def _overlapping_chunks(self, Bounds: List[Tuple[int, int]]):
+        if any(_stop <= _start for _start, _stop in Bounds):
+            return iter(())
+        return itertools.product(*[range(_start // _chunk, (_stop - 1) // _chunk + 1)
+                                   for (_start, _stop), _chunk in zip(Bounds, self.chunks)])
+
+    def _chunk_extent(self, Chunk: Tuple[int, int, int]) -> List[Tuple[int, int]]:
+        return [(_index * _chunk, min((_index + 1) * _chunk, _dim))
+                for _index, _chunk, _dim in zip(Chunk, self.chunks, self.shape)]
+
+    def _overlap(self, Chunk: Tuple[int, int, int], Bounds: List[Tuple[int, int]]) -> Tuple[tuple, tuple]:
+        _source = []
+        _destination = []
+        for (_chunk_start, _chunk_stop), (_start, _stop) in zip(self._chunk_extent(Chunk), Bounds):
+            _low = max(_chunk_start, _start)
+            _high = min(_chunk_stop, _stop)
+            _source.append(slice(_low - _chunk_start, _high - _chunk_start))
+            _destination.append(slice(_low - _start, _high - _start))
+        return tuple(_source), tuple(_destination)
+
+    def _read_chunk(self, Chunk: Tuple[int, int, int]) -> np.ndarray:
+        _shape = tuple(_stop - _start for _start, _stop in self._chunk_extent(Chunk))
+        if Chunk in self._dirty:
+            return self._dirty.get(Chunk)[0]
+        if self._offsets[Chunk] < 0:
+            return np.zeros(_shape, dtype=self.dtype)
+        with self._lock:
+            if Chunk in self._cache:
+                self._cache.move_to_end(Chunk)
+                return self._cache.get(Chunk)
+        # os.pread does not move the shared file position, so chunks can be read concurrently
+        if hasattr(os, "pread"):
+            _buffer = os.pread(self._file.fileno(), int(self._nbytes[Chunk]), int(self._offsets[Chunk]))
+        else:
+            with open(self.filename, "rb") as f:
+                f.seek(int(self._offsets[Chunk]))
+                _buffer = f.read(int(self._nbytes[Chunk]))
+        _buffer = self.codecs.get(self._meta.get("codec"))[1](_buffer)
+        if self._meta.get("shuffle") and self.dtype.itemsize > 1:
+            _data = np.frombuffer(_buffer, dtype=np.uint8).reshape(self.dtype.itemsize, -1).T.copy()
+            _data = _data.view(self.dtype).reshape(_shape)
+        else:
+            _data = np.frombuffer(_buffer, dtype=self.dtype).reshape(_shape)
+        _data.flags.writeable = False
+        with self._lock:
+            self._cache[Chunk] = _data
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return _data
+
+    def _compress_chunk(self, Data: np.ndarray) -> bytes:
+        if self._meta.get("shuffle") and self.dtype.itemsize > 1:
+            _buffer = np.ascontiguousarray(Data).view(np.uint8).reshape(-1, self.dtype.itemsize).T.copy()
+        else:
+            _buffer = np.ascontiguousarray(Data)
+        return self.codecs.get(self._meta.get("codec"))[0](_buffer.data, self._meta.get("level"),
+                                                            self.dtype.itemsize)
+
+    def _write_chunks(self, Chunks: List[Tuple[int, int, int]]) -> None:
+        if not Chunks:
+            return
+        _compressed = self._pool().map(self._compress_chunk, [self._dirty.get(_chunk)[0] for _chunk in Chunks])
+        for _chunk, _buffer in zip(Chunks, _compressed):
+            self._file.seek(self._end)
+            self._file.write(_buffer)
+            self._offsets[_chunk] = self._end
+            self._nbytes[_chunk] = len(_buffer)
+            self._end += len(_buffer)
+            self._dirty.pop(_chunk)
+            with self._lock:
+                self._cache.pop(_chunk, None)
+        self._stale = True
+
+
+def is_chunked_video(Filename: str) -> bool:
+    """
+    Checks whether a file is a chunked video (see ChunkedVideo)
+
+    :param Filename: filename
+    :type Filename: str
+    :return: whether the file is a chunked video
+    :rtype: bool
+    """
+    try:
+        with open(Filename, "rb") as f:
+            return f.read(len(ChunkedVideo.magic)) == ChunkedVideo.magic
+    except (FileNotFoundError, IsADirectoryError):
+        return False
+
+
+def load_raw_binary(Filename: Union[str, None], MetaFile: Union[str, None], *args: Optional[str],
+                    **kwargs: bool) -> np.ndarray:
     """
     Loads a raw binary file
 
-    Enter the path to autofill (assumes Filename & meta are path + binary_video, video_meta.txt)
+    Enter the path to autofill (assumes Filename & meta are path + binary_video, video_meta.txt). Binary videos
+    with a header (see BinaryVideoHeader) and chunked videos (see ChunkedVideo) do not require a meta file.
 
     :param Filename: filename for binary video
     :type Filename: str
@@ -228,12 +1291,27 @@ def load_raw_binary(Filename: Union[str, None], MetaFile: Union[str, None], *arg
     :type MetaFile: str
     :param args: path to a directory containing Filename and MetaFile
     :type args: str
+    :keyword verify: verify the checksums of a binary video with a header (bool, default False)
     :return: numpy array [Z x Y x X]
     :rtype: Any
     """
     if len(args) == 1:
         Filename = "".join([args[0], "\\binary_video"])
         MetaFile = "".join([args[0], "\\video_meta.txt"])
+        if not os.path.isfile(Filename) and is_chunked_video("".join([args[0], "\\chunked_video"])):
+            Filename = "".join([args[0], "\\chunked_video"])
+
+    if is_chunked_video(Filename):
+        with ChunkedVideo(Filename) as _chunked_video:
+            return _chunked_video[:]
+
+    _header = BinaryVideoHeader.read(Filename)
+    if _header is not None:
+        _images = np.fromfile(Filename, dtype=_header.dtype, count=math.prod(_header.shape),
+                              offset=_header.data_offset).reshape(_header.shape)
+        if kwargs.get("verify", False) and not _header.verify(_images):
+            raise ValueError("".join(["Checksums of ", str(Filename), " do not match its header"]))
+        return _images
 
     _num_frames, _y_pixels, _x_pixels, _type = np.genfromtxt(MetaFile, delimiter=",", dtype="str")
     _num_frames = int(_num_frames)
@@ -246,20 +1324,33 @@ def load_binary_meta(Filename: str) -> Tuple[int, int, int, str]:
     """
     Loads meta file for binary video
 
-    :param Filename: The meta file (.txt ext)
+    The header of the binary video is used when the binary video has one (either passed directly or located next
+    to the meta file)
+
+    :param Filename: The meta file (.txt ext), a binary video with a header or a chunked video
     :type Filename: str
     :return: A tuple containing the number of frames, y pixels, and x pixels [Z x Y x X]
     :rtype: tuple[int, int, int, str]
     """
+    if is_chunked_video(Filename):
+        with ChunkedVideo(Filename) as _chunked_video:
+            return _chunked_video.shape[0], _chunked_video.shape[1], _chunked_video.shape[2], \
+                str(_chunked_video.dtype)
+
+    _header = BinaryVideoHeader.read(Filename.replace("video_meta.txt", "binary_video"))
+    if _header is not None:
+        return _header.shape[0], _header.shape[1], _header.shape[2], str(_header.dtype)
     _num_frames, _y_pixels, _x_pixels, _type = np.genfromtxt(Filename, delimiter=",", dtype="str")
     return int(_num_frames), int(_y_pixels), int(_x_pixels), str(_type)
 
 
-def load_mapped_binary(Filename: str, MetaFile: str, *args: Optional[str], **kwargs: str) -> np.memmap:
+def load_mapped_binary(Filename: str, MetaFile: str, *args: Optional[str], **kwargs: str) \
+        -> Union[np.memmap, ChunkedVideo]:
     """
     Loads a raw binary file in the workspace without loading into memory
 
-    Enter the path to autofill (assumes Filename & meta are path + binary_video, video_meta.txt)
+    Enter the path to autofill (assumes Filename & meta are path + binary_video, video_meta.txt). If the path
+    contains a chunked video (chunked_video) instead, it is opened as a ChunkedVideo.
 
     :param Filename: filename for binary video
     :type Filename: str
@@ -268,15 +1359,25 @@ def load_mapped_binary(Filename: str, MetaFile: str, *args: Optional[str], **kwa
     :param args: Path
     :type args: str
     :keyword mode: pass mode to numpy.memmap (str, default = "r")
-    :return: memmap(numpy) array [Z x Y x X]
+    :return: memmap(numpy) array or chunked video [Z x Y x X]
     :rtype: Any
     """
     if len(args) == 1:
         Filename = "".join([args[0], "\\binary_video"])
         MetaFile = "".join([args[0], "\\video_meta.txt"])
+        if not os.path.isfile(Filename) and is_chunked_video("".join([args[0], "\\chunked_video"])):
+            Filename = "".join([args[0], "\\chunked_video"])
 
     _mode = kwargs.get("mode", "r")
 
+    if is_chunked_video(Filename):
+        return ChunkedVideo(Filename, "r" if _mode in ("r", "c") else "r+")
+
+    _header = BinaryVideoHeader.read(Filename)
+    if _header is not None:
+        return np.memmap(Filename, dtype=_header.dtype, shape=_header.shape, mode=_mode,
+                         offset=_header.data_offset)
+
     _num_frames, _y_pixels, _x_pixels, _type = np.genfromtxt(MetaFile, delimiter=",", dtype="str")
     _num_frames = int(_num_frames)
     _x_pixels = int(_x_pixels)
@@ -284,246 +1385,685 @@ def load_mapped_binary(Filename: str, MetaFile: str, *args: Optional[str], **kwa
     return np.memmap(Filename, dtype=_type, shape=(_num_frames, _y_pixels, _x_pixels), mode=_mode)
 
 
-def repackage_bruker_tiffs(ImageDirectory: str, OutputDirectory: str, *args: Union[int, tuple[int]]) -> None:
+def read_frames(Images: Union[np.ndarray, TiffVolume, ChunkedVideo], Frames: Union[Sequence[int], np.ndarray]) \
+        -> np.ndarray:
+    """
+    Reads a sample of frames (e.g., strided samples of a memory-mapped video) in as few reads as possible
+
+    Arrays (numpy memmap) are read by a single indexed read of the sorted frames, tiff volumes by their read method
+    and other videos (chunked videos) by one read per run of consecutive frames, instead of one read per frame.
+
+    :param Images: video [Z x Y x X]
+    :type Images: Any
+    :param Frames: indices of the frames to read
+    :type Frames: Union[Sequence[int], Any]
+    :return: numpy array of the frames (in the order requested) [Z x Y x X]
+    :rtype: Any
+    """
+    Frames = np.asarray(Frames, dtype=np.int64).ravel()
+    _order = np.argsort(Frames, kind="stable")
+    _sorted = Frames[_order]
+
+    if isinstance(Images, np.ndarray):
+        _images = np.asarray(Images[_sorted])
+    elif isinstance(Images, TiffVolume):
+        _images = Images.read(_sorted)
+    else:
+        _runs = np.split(_sorted, np.flatnonzero(np.diff(_sorted) != 1) + 1) if _sorted.size else []
+        _images = np.concatenate([np.asarray(Images[int(_run[0]):int(_run[-1]) + 1]) for _run in _runs] or
+                                 [np.empty((0, *Images.shape[1:]), dtype=Images.dtype)])
+
+    _frames = np.empty_like(_images)
+    _frames[_order] = _images
+    return _frames
+
+
+class PrefetchReader:
+    """
+    Chunked frame reader that prefetches the next chunks on a background thread
+
+    Iterating yields (Start, Stop, Block, Offset) for each chunk, where Block contains frames Start - halo to
+    Stop + halo (clipped to the video) and Block[Offset:Offset + Stop - Start] are the frames Start to Stop. While
+    a chunk is being processed, up to *prefetch* following chunks are read into a bounded queue, so compute does
+    not wait on I/O at chunk boundaries. Each iteration starts a new reader thread, so the reader can be iterated
+    more than once.
+
+    Blocks are copies; a consumer writing results back into the source may write chunk k once it has received
+    chunk k + 1 (the halo of chunk k + 1 is read before chunk k is overwritten).
+
+    **Required Inputs**
+        | *Images* : video [Z x Y x X] or a path: a binary/chunked video folder, a tiff file or a tiff folder
+
+    **Keyword Arguments**
+        | *chunk_size* : number of frames per chunk (int, default 1000)
+        | *halo* : number of overlapping frames before & after each chunk (int or tuple[int, int], default 0)
+        | *prefetch* : number of chunks read ahead (int, default 2)
+        | *boundaries* : explicit (start, stop) of each chunk, overrides chunk_size (list[tuple[int, int]])
+
+    **Properties**
+        | *shape* : Frames, Height, Width of the video
+        | *boundaries* : (start, stop) of each chunk
+        | *halo* : overlapping frames before & after each chunk
+    """
+
+    def __init__(self, Images: Union[str, np.ndarray, TiffVolume, ChunkedVideo], **kwargs):
+        if isinstance(Images, (str, pathlib.Path)):
+            Images = PrefetchReader.open_images(str(Images))
+        self.images = Images
+
+        _halo = kwargs.get("halo", 0)
+        self.halo = tuple(_halo) if isinstance(_halo, (tuple, list)) else (int(_halo), int(_halo))
+        self._prefetch = max(kwargs.get("prefetch", 2), 1)
+
+        _boundaries = kwargs.get("boundaries", None)
+        if _boundaries is None:
+            _chunk_size = max(kwargs.get("chunk_size", 1000), 1)
+            _boundaries = [(_start, min(_start + _chunk_size, self.shape[0]))
+                           for _start in range(0, self.shape[0], _chunk_size)]
+        self.boundaries = [(int(_start), int(_stop)) for _start, _stop in _boundaries]
+
+    def __len__(self) -> int:
+        return len(self.boundaries)
+
+    def __iter__(self):
+        _filled_chunks = queue.Queue(maxsize=self._prefetch)
+        _stop_reading = threading.Event()
+
+        def put(Item) -> bool:
+            # give up if the consumer stopped iterating
+            while not _stop_reading.is_set():
+                try:
+                    _filled_chunks.put(Item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def read_chunks() -> None:
+            # noinspection PyBroadException
+            try:
+                for _start, _stop in self.boundaries:
+                    _low = max(_start - self.halo[0], 0)
+                    _high = min(_stop + self.halo[1], self.shape[0])
+                    if not put((_start, _stop, np.array(self.images[_low:_high]), _start - _low)):
+                        return
+                put(None)
+            except BaseException as _error:
+                put(_error)
+
+        _reader = threading.Thread(target=read_chunks, daemon=True)
+        _reader.start()
+        try:
+            while True:
+                _chunk = _filled_chunks.get()
+                if _chunk is None:
+                    return
+                if isinstance(_chunk, BaseException):
+                    raise _chunk
+                yield _chunk
+        finally:
+            _stop_reading.set()
+            _reader.join()
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return tuple(self.images.shape)
+
+    @staticmethod
+    def open_images(Path: str) -> Union[np.memmap, TiffVolume, ChunkedVideo]:
+        """
+        Opens a video without loading it into memory
+
+        :param Path: binary/chunked video folder, tiff file or tiff folder
+        :type Path: str
+        :return: video [Z x Y x X]
+        :rtype: Union[np.memmap, TiffVolume, ChunkedVideo]
+        """
+        if os.path.isfile("".join([Path, "\\binary_video"])) or \
+                os.path.isfile("".join([Path, "\\chunked_video"])):
+            return load_mapped_binary("", "", Path)
+        elif os.path.isfile(Path) and is_chunked_video(Path):
+            return ChunkedVideo(Path)
+        elif os.path.isfile(Path):
+            return TiffVolume([Path])
+        return load_all_tiffs(Path, lazy=True)
+
+
+class FrameChunk:
+    """
+    Lazily evaluated view of the frames Start to Stop of a video
+
+    No frames are read until the chunk is indexed (or converted to an array), so a list of chunks of a
+    memory-mapped video occupies no memory. Indexing follows numpy semantics relative to the first frame of the
+    chunk.
+
+    **Required Inputs**
+        | *Images* : video [Z x Y x X] (numpy array, memory-mapped, TiffVolume or ChunkedVideo)
+        | *Start* : first frame of the chunk
+        | *Stop* : frame after the last frame of the chunk
+
+    **Properties**
+        | *shape* : Frames, Height, Width of the chunk
+        | *dtype* : type of the images
+    """
+
+    def __init__(self, Images: Union[np.ndarray, TiffVolume, ChunkedVideo], Start: int, Stop: int):
+        self.images = Images
+        self.start = int(Start)
+        self.stop = int(Stop)
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __array__(self, dtype: Optional[np.dtype] = None, copy: Optional[bool] = None) -> np.ndarray:
+        _images = self[:]
+        if dtype is not None:
+            return _images.astype(dtype, copy=False)
+        return _images
+
+    def __getitem__(self, Key) -> np.ndarray:
+        _key = Key if isinstance(Key, tuple) else (Key, )
+        _frames = _key[0]
+        if _frames is Ellipsis:
+            _key = (slice(None), *_key)
+            _frames = slice(None)
+        # frames of the chunk to frames of the video
+        if isinstance(_frames, (int, np.integer)):
+            _frames = range(self.start, self.stop)[_frames]
+        elif isinstance(_frames, slice):
+            _range = range(self.start, self.stop)[_frames]
+            _frames = slice(_range.start, _range.stop, _range.step) if _range.step > 0 else np.asarray(_range)
+        else:
+            _frames = np.arange(self.start, self.stop)[_frames]
+        return np.asarray(self.images[(_frames, *_key[1:])])
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return (self.stop - self.start, *self.images.shape[1:])
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.images.dtype
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+
+def repackage_bruker_tiffs(ImageDirectory: str, OutputDirectory: str, *args: Union[int, tuple[int]],
+                           **kwargs: int) -> None:
     """
     Repackages a sequence of tiff files within a directory to a smaller sequence
     of tiff stacks.
     Designed to compile the outputs of a certain imaging utility
     that exports recordings such that each frame is saved as a single tiff.
 
+    Reading and writing overlap: a reader thread decodes the next chunk into one of two buffers while the
+    previous chunk is written, so peak memory is about two chunks regardless of the length of the recording.
+
     :param ImageDirectory: Directory containing a sequence of single frame tiff files
     :type ImageDirectory: str
     :param OutputDirectory: Empty directory where tiff stacks will be saved
     :type OutputDirectory: str
     :param args: optional argument to indicate the repackaging of a specific channel and/or plane
     :type args: int
+    :keyword chunk_size: number of frames per chunk & per tiff stack when splitting (int, default 7000)
+    :keyword workers: number of decoding threads (int, default os.cpu_count())
     :rtype: None
     """
 
-    # code here is pretty rough, needs TLC. Maybe simpler to use a generator to generate chunks
-
-    def load_image():
-        nonlocal ImageDirectory
-        nonlocal _files
-        nonlocal _file
-        nonlocal _offset
-        return np.asarray(Image.open(str(_files[_file + _offset])))
-
-    def find_files(Tag: Union[str, list[str]]):
-        nonlocal ImageDirectory
-        nonlocal _files
-
-        def check_file_contents(Tag_: str, File_: pathlib.WindowsPath) -> bool:
-            if Tag_ in str(File_.stem).split("_"):
-                return True
-            else:
-                return False
-
-        # reset, rather maintain code as is then make a new temporary variable since this
-        # is basically instant
-        _files = [_file for _file in pathlib.Path(ImageDirectory).rglob("*.tif")]
-
-        # now find
-        if isinstance(Tag, list):
-            Tag = "".join([Tag[0], "_", Tag[1]])
-            _files = [_file for _file in _files if Tag in str(_file.stem)]
-        else:
-            _files = [_file for _file in _files if check_file_contents(Tag, _file)]
+    _chunk_size = kwargs.get("chunk_size", 7000)
+    _workers = kwargs.get("workers", os.cpu_count())
 
     def not_over_4gb() -> bool:
-        nonlocal _files
+        nonlocal _frames
         nonlocal _y
         nonlocal _x
 
-        gb = np.full((_files.__len__(), _y, _x), 1, dtype=np.uint16).nbytes
+        # computed from the shape, no need to allocate anything
+        gb = _frames * _y * _x * np.dtype(np.uint16).itemsize / 1024 ** 3
         if gb <= 3.9: # 3.9 as a safety buffer
             return True
         else:
             return False
 
-    _files = [_file for _file in pathlib.Path(ImageDirectory).rglob("*.tif")]
-    _channels, _planes, _frames, _y, _x = determine_bruker_folder_contents(ImageDirectory)
-    pretty_print_bruker_command(_channels, _planes, _frames, _y, _x)
-
-    # finding the files for a specific channel/plane here
-    if args:
-        # unpack if necessary
-        if isinstance(args[0], tuple):
-            _c = args[0][0]
-            _p = args[0][1]
-            args = tuple([_c, _p])
+    def read_chunks() -> None:
+        nonlocal _files
+        nonlocal _frames
 
-        if _channels > 1 and _planes > 1 and len(args) >= 2:
-            _base_tag = "00000"
-            _tag = ["".join(["Ch", str(args[0])+1]), "".join([_base_tag, str(args[1]+1), ".ome"])]
-            find_files(_tag)
-        elif _channels == 1 and _planes > 1 and len(args) == 1:
-            _base_tag = "00000"
-            _tag = "".join([_base_tag, str(args[0]+1), ".ome"])
-            find_files(_tag)
-            print(_files)
-        elif _channels == 1 and _planes > 1 and len(args) >= 2:
-            _base_tag = "00000"
-            _tag = "".join([_base_tag, str(args[1]+1), ".ome"])
-            find_files(_tag)
-        elif _channels > 1 and _planes == 1:
-            _tag = "".join(["Ch", str(args[0]+1)])
-            find_files(_tag)
-        else:
-            pass
-    else:
-        try:
-            assert(_channels == 1)
-        except AssertionError:
-            print("Folder contains multiple channels")
-            return
+        # noinspection PyBroadException
         try:
-            assert(_planes == 1)
-        except AssertionError:
-            print("Folder contains multiple planes")
-            return
+            for _start in range(0, _frames, _chunk_size):
+                _stop = min(_start + _chunk_size, _frames)
+                _buffer = _free_buffers.get()
+                load_single_frame_tiffs(_files[_start:_stop], _buffer, workers=_workers, verbose=False)
+                _filled_buffers.put((_start, _stop, _buffer))
+            _filled_buffers.put(None)
+        except BaseException as _error:
+            _filled_buffers.put(_error)
+
+    def stack_filename(Index: int, Stacks: int) -> str:
+        if Index < 10:
+            return "".join([OutputDirectory, "\\compiledVideo_0", str(Index), "_of_", str(Stacks), ".tif"])
+        else:
+            return "".join([OutputDirectory, "\\compiledVideo_", str(Index), "_of_", str(Stacks), ".tif"])
 
-    # noinspection PyTypeChecker
+    _index = BrukerFolderIndex(ImageDirectory)
+    _channels, _planes, _frames, _y, _x = _index.contents
+    pretty_print_bruker_command(_channels, _planes, _frames, _y, _x)
+
+    # finding the files for a specific channel/plane here
+    _files = select_bruker_files(_index, *args)
+    if _files is None:
+        return
 
     # Decide whether saving in single stack is possible
     if not_over_4gb():
-        _images = np.full((_frames, _y, _x), 0, dtype=np.uint16)
-        _offset = 0
-        for _file in range(_frames):
-            _images[_file, :, :] = load_image()
-        save_single_tiff(_images, "".join([OutputDirectory, "\\compiledVideo_01_of_1.tif"]))
-        return
+        _frames_per_stack = _frames
     else:
-        # noinspection PyTypeChecker
-        _chunks = math.ceil(_frames/7000)
-        c_idx = 1
-        _offset = int()
-
-        _pbar = tq(total=_frames)
-        _pbar.set_description("Repackaging Bruker Tiffs...")
-
-        for _chunk in range(0, _frames, 7000):
-
-            _start_idx = _chunk
-            _offset = _start_idx
-            _end_idx = _chunk + 7000
-            _chunk_frames = _end_idx-_start_idx
-            # If this is the last chunk which may not contain a full 7000 frames...
-            if _end_idx > _frames:
-                _end_idx = _frames
-                _chunk_frames = _end_idx - _start_idx
-                _end_idx += 1
-
-            image_chunk = np.full((_chunk_frames, _y, _x), 0, dtype=np.uint16)
-
-            for _file in range(_chunk_frames):
-                image_chunk[_file, :, :] = load_image()
-                _pbar.update(1)
-
-            if c_idx < 10:
-                save_single_tiff(image_chunk, OutputDirectory + "\\" + "compiledVideo_0" + str(c_idx) + "_of_" + str(_chunks) + ".tif")
-            else:
-                save_single_tiff(image_chunk, OutputDirectory + "\\" + "compiledVideo_" + str(c_idx) + "_of_" + str(_chunks) + ".tif")
-            c_idx += 1
+        _frames_per_stack = _chunk_size
+    _stacks = math.ceil(_frames / _frames_per_stack)
+
+    # double buffering, the reader fills one buffer while the other is written
+    _free_buffers = queue.Queue()
+    _filled_buffers = queue.Queue()
+    for _ in range(2):
+        _free_buffers.put(np.full((min(_chunk_size, _frames), _y, _x), 0, dtype=np.uint16))
+
+    _reader = threading.Thread(target=read_chunks, daemon=True)
+    _reader.start()
+
+    _pbar = tq(total=_frames)
+    _pbar.set_description("Repackaging Bruker Tiffs...")
+    _start_time = time.perf_counter()
+
+    _stack = 0
+    _tif = None
+    try:
+        while True:
+            _chunk = _filled_buffers.get()
+            if _chunk is None:
+                break
+            elif isinstance(_chunk, BaseException):
+                raise _chunk
+
+            _start, _stop, _buffer = _chunk
+            if _start // _frames_per_stack + 1 != _stack:
+                if _tif is not None:
+                    _tif.close()
+                _stack = _start // _frames_per_stack + 1
+                _tif = tifffile.TiffWriter(stack_filename(_stack, _stacks))
+
+            for _frame in _buffer[:_stop - _start]:
+                _tif.write(_frame)
+            _pbar.update(_stop - _start)
+            _free_buffers.put(_buffer)
+    finally:
+        if _tif is not None:
+            _tif.close()
         _pbar.close()
+    _reader.join()
+
+    _elapsed = time.perf_counter() - _start_time
+    print("".join(["Repackaged ", str(_frames), " frames into ", str(_stacks), " stack(s) in ",
+                   format(_elapsed, ".2f"), " s (", format(_frames / max(_elapsed, 1e-9), ".1f"), " frames/s)"]))
     return
 
 
-def save_single_tiff(Images: np.ndarray, Filename: str, Type: Optional[np.dtype] = np.uint16) -> None:
+def save_single_tiff(Images: np.ndarray, Filename: str, Type: Optional[np.dtype] = np.uint16, **kwargs: int) \
+        -> None:
     """
     Save a numpy array to a single tiff file as type uint16
 
+    The images are floored & cast in chunks into a reusable buffer (peak memory does not scale with the number of
+    frames) and every chunk is written as contiguous pages.
+
     :param Images: numpy array [frames, y pixels, x pixels]
     :type Images: Any
     :param Filename: filename
     :type Filename: str
     :param Type: type for saving
     :type Type: Optional[Any]
+    :keyword chunk_size: number of frames cast & written at once (int, default 500)
     :rtype: None
     """
-    with tifffile.TiffWriter(Filename) as tif:
-        for frame in np.floor(Images).astype(Type):
-            tif.save(frame)
+    _chunk_size = max(1, min(kwargs.get("chunk_size", 500), Images.shape[0]))
+    _type = np.dtype(Type)
+
+    _buffer = np.empty((_chunk_size, *Images.shape[1:]), dtype=_type)
+    # floating point images must be floored before casting, integer images are cast directly
+    _floor_buffer = np.empty((_chunk_size, *Images.shape[1:]), dtype=Images.dtype) \
+        if np.issubdtype(Images.dtype, np.floating) else None
+    _bigtiff = math.prod(Images.shape) * _type.itemsize > 2 ** 32 - 2 ** 25
+
+    with tifffile.TiffWriter(Filename, bigtiff=_bigtiff) as tif:
+        for _start in range(0, Images.shape[0], _chunk_size):
+            _frames = min(_chunk_size, Images.shape[0] - _start)
+            if _floor_buffer is not None:
+                np.floor(Images[_start:_start + _frames], out=_floor_buffer[:_frames])
+                np.copyto(_buffer[:_frames], _floor_buffer[:_frames], casting="unsafe")
+            else:
+                np.copyto(_buffer[:_frames], Images[_start:_start + _frames], casting="unsafe")
+            tif.write(_buffer[:_frames], contiguous=True, photometric="minisblack", metadata=None)
 
 
-def save_tiff_stack(Images: str, OutputDirectory: str, Type: Optional[np.dtype] = np.uint16) -> None:
+def save_tiff_stack(Images: str, OutputDirectory: str, Type: Optional[np.dtype] = np.uint16, **kwargs: int) -> None:
     """
     Save a numpy array to a sequence of tiff stacks
 
+    The tiff stacks are written concurrently by a pool of workers
+
     :param Images: A numpy array containing a tiff stack [Z x Y x X]
     :type Images: Any
     :param OutputDirectory: A directory to save the sequence of tiff stacks in uint16
     :type OutputDirectory: str
     :param Type: type for saving
     :type Type: Optional[Any]
+    :keyword stack_size: number of frames per tiff stack (int, default 7000)
+    :keyword chunk_size: number of frames cast & written at once by each worker (int, default 500)
+    :keyword workers: number of tiff stacks written concurrently (int, default min(stacks, os.cpu_count()))
     :rtype: None
     """
     _num_frames = Images.shape[0]
+    _stack_size = kwargs.get("stack_size", 7000)
+    _chunk_size = kwargs.get("chunk_size", 500)
 
-    _chunks = math.ceil(_num_frames / 7000)
+    _chunks = math.ceil(_num_frames / _stack_size)
+    _workers = kwargs.get("workers", min(_chunks, os.cpu_count() or 1))
 
-    c_idx = 1
-    for _chunk in range(0, _num_frames, 7000):
+    def stack_filename(Index: int) -> str:
+        if Index < 10:
+            return OutputDirectory + "\\" + "Video_0" + str(Index) + "_of_" + str(_chunks) + ".tif"
+        else:
+            return OutputDirectory + "\\" + "Video_" + str(Index) + "_of_" + str(_chunks) + ".tif"
 
-        _start_idx = _chunk
-        _end_idx = _chunk + 7000
-        if _end_idx > _num_frames:
-            _end_idx = _num_frames + 1
+    def save_stack(Index: int) -> None:
+        _start_idx = (Index - 1) * _stack_size
+        _end_idx = min(_start_idx + _stack_size, _num_frames)
+        save_single_tiff(Images[_start_idx:_end_idx, :, :], stack_filename(Index), Type, chunk_size=_chunk_size)
 
-        if c_idx < 10:
-            save_single_tiff(Images[_start_idx:_end_idx, :, :],
-                                    OutputDirectory + "\\" + "Video_0" + str(c_idx) + "_of_" + str(
-                                       _chunks) + ".tif")
-        else:
-            save_single_tiff(Images[_start_idx:_end_idx, :, :],
-                                    OutputDirectory + "\\" + "Video_" + str(c_idx) + "_of_" + str(
-                                       _chunks) + ".tif")
-        c_idx += 1
+    with ThreadPoolExecutor(max_workers=max(_workers, 1)) as _executor:
+        # list forces any exception raised by a worker to propagate
+        list(tqdm(_executor.map(save_stack, range(1, _chunks + 1)), total=_chunks, desc="Saving Tiffs...",
+                  disable=False))
 
     return print("Finished Saving Tiffs")
 
 
-def save_raw_binary(Images: np.ndarray, ImageDirectory: str) -> None:
+def save_raw_binary(Images: np.ndarray, ImageDirectory: str, **kwargs: Union[bool, float, int]) -> None:
     """
     This function saves a tiff stack as a binary file
 
+    By default, the binary video is headerless and described by video_meta.txt (as expected by suite2p & DeepCAD).
+    With header=True the binary video is self-describing (see BinaryVideoHeader) and no meta file is written.
+    With backend="chunked" the images are saved as a compressed chunked video (chunked_video, see ChunkedVideo).
+
     :param Images: Images to be saved [Z x Y x X]
     :type Images: np.ndarray
     :param ImageDirectory: Directory to save images in
     :type ImageDirectory: str
+    :keyword header: save a self-describing binary video (bool, default False)
+    :keyword frame_rate: frame rate stored in the header (float, default nan: unknown)
+    :keyword chunk_frames: number of frames per chunk in the header (int, default 1000)
+    :keyword checksums: store a crc32 of each chunk in the header (bool, default True)
+    :keyword backend: "binary" or "chunked" (str, default "binary")
+    :keyword chunks: chunk shape (time, y, x) of a chunked video (tuple[int, int, int], default (64, 128, 128))
+    :keyword codec: compression codec of a chunked video (str, default "zlib")
+    :keyword level: compression level of a chunked video (int, default codec specific)
+    :keyword workers: number of compression threads of a chunked video (int, default os.cpu_count())
     :rtype: None
     """
     print("Saving images as a binary file...")
-    _meta_file = "".join([ImageDirectory, "\\video_meta.txt"])
     _video_file = "".join([ImageDirectory, "\\binary_video"])
 
+    if kwargs.get("backend", "binary") == "chunked":
+        with ChunkedVideo("".join([ImageDirectory, "\\chunked_video"]), "w", Images.shape, Images.dtype,
+                          **{_key: _value for _key, _value in kwargs.items()
+                             if _key in ("chunks", "codec", "level", "workers", "frame_rate")}) as _chunked_video:
+            # write whole rows of chunks so every chunk is compressed exactly once
+            _frames_per_write = _chunked_video.chunks[0] * max(kwargs.get("workers", os.cpu_count()) or 1, 1)
+            for _start in range(0, Images.shape[0], _frames_per_write):
+                _chunked_video[_start:_start + _frames_per_write] = Images[_start:_start + _frames_per_write]
+    elif kwargs.get("header", False):
+        _chunk_frames = kwargs.get("chunk_frames", 1000)
+        _checksums = BinaryVideoHeader.calculate_checksums(Images, _chunk_frames) \
+            if kwargs.get("checksums", True) else None
+        _header = BinaryVideoHeader(Images.shape, Images.dtype, frame_rate=kwargs.get("frame_rate", np.nan),
+                                    chunk_frames=_chunk_frames, checksums=_checksums)
+        os.makedirs(os.path.dirname(_video_file) or ".", exist_ok=True)
+        with open(_video_file, "wb") as f:
+            f.write(_header.pack())
+            np.ascontiguousarray(Images).tofile(f)
+    else:
+        save_binary_meta(Images.shape, Images.dtype, ImageDirectory)
+        Images.tofile(_video_file)
+    print("Finished saving images as a binary file.")
+
+
+def save_binary_meta(Shape: Tuple[int, int, int], Type: Union[np.dtype, str], ImageDirectory: str) -> None:
+    """
+    Writes the meta file (video_meta.txt) describing a binary video
+
+    :param Shape: shape of the binary video [Z x Y x X]
+    :type Shape: tuple[int, int, int]
+    :param Type: type of the binary video
+    :type Type: Union[np.dtype, str]
+    :param ImageDirectory: Directory containing the binary video
+    :type ImageDirectory: str
+    :rtype: None
+    """
+    _meta_file = "".join([ImageDirectory, "\\video_meta.txt"])
+
     try:
         with open(_meta_file, 'w') as f:
-            f.writelines([str(Images.shape[0]), ",", str(Images.shape[1]), ",",
-                          str(Images.shape[2]), ",", str(Images.dtype)])
+            f.writelines([str(Shape[0]), ",", str(Shape[1]), ",", str(Shape[2]), ",", str(np.dtype(Type))])
     except FileNotFoundError:
         _meta_path = _meta_file.replace("\\video_meta.txt", "")
         os.makedirs(_meta_path)
         with open(_meta_file, 'w') as f:
-            f.writelines([str(Images.shape[0]), ",", str(Images.shape[1]), ",",
-                          str(Images.shape[2]), ",", str(Images.dtype)])
+            f.writelines([str(Shape[0]), ",", str(Shape[1]), ",", str(Shape[2]), ",", str(np.dtype(Type))])
 
-    Images.tofile(_video_file)
-    print("Finished saving images as a binary file.")
 
+def save_trace_store(Fields: dict, Filename: str) -> None:
+    """
+    Saves traces to a non-pickled store that is loaded lazily (see TraceStore)
+
+    Each field is saved as one contiguous array (Filename_field.npy). Fields of traces per ROI & tiff (object arrays
+    of arrays with varying shapes) are concatenated into a single flat array with an offsets table
+    (Filename_field_offsets.npy: offset followed by the shape of each ROI & tiff). Dense traces (TraceTensor) are
+    saved as their data, with the frame boundaries of each tiff kept in the index. An index (Filename.json)
+    describing the fields is written last. Fields that are None are not saved. Each file is written under a
+    temporary name and replaces the previous file once complete, and memory-mapped fields are copied into memory
+    first, so a loaded store can be saved back to the same file.
+
+    :param Fields: fields to save (e.g., ProcessedTracesDictionary.__dict__)
+    :type Fields: dict
+    :param Filename: filename of the store without extension
+    :type Filename: str
+    :rtype: None
+    """
+    _index = {"version": 1, "fields": {}}
+    for _field, _value in Fields.items():
+        if _value is None:
+            continue
+        _filename = "".join([Filename, "_", _field, ".npy"])
+
+        if hasattr(_value, "data") and hasattr(_value, "boundaries"):
+            _save_store_array(in_memory(_value.data), _filename)
+            _index["fields"][_field] = {"kind": "tensor", "boundaries": np.asarray(_value.boundaries).tolist()}
+            continue
+
+        # fields mapped from a store may be mapped from the files being replaced
+        _value = in_memory(_value if isinstance(_value, np.ndarray) else np.asarray(_value))
+
+        if _value.dtype != object:
+            _save_store_array(_value, _filename)
+            _index["fields"][_field] = {"kind": "array"}
+            continue
+
+        _elements = [np.asarray(_element) for _element in _value.ravel()]
+        if any(_element.dtype == object for _element in _elements) or \
+                len({_element.ndim for _element in _elements}) > 1:
+            raise TypeError("Field " + _field + " must contain numeric arrays of equal dimensions")
+        _offsets = np.zeros((len(_elements), 1 + (_elements[0].ndim if _elements else 0)), dtype=np.int64)
+        _offsets[1:, 0] = np.cumsum([_element.size for _element in _elements])[:-1]
+        _offsets[:, 1:] = [_element.shape for _element in _elements]
+
+        _data = np.lib.format.open_memmap(_filename + ".partial", mode="w+",
+                                          dtype=np.result_type(*_elements) if _elements else np.float64,
+                                          shape=(int(sum(_element.size for _element in _elements)), ))
+        for _offset, _element in zip(_offsets[:, 0], _elements):
+            _data[_offset:_offset + _element.size] = _element.ravel()
+        _data.flush()
+        del _data
+        with open(_filename[:-len(".npy")] + "_offsets.npy.partial", "wb") as _file:
+            np.save(_file, _offsets, allow_pickle=False)
+        os.replace(_filename + ".partial", _filename)
+        os.replace(_filename[:-len(".npy")] + "_offsets.npy.partial", _filename[:-len(".npy")] + "_offsets.npy")
+        _index["fields"][_field] = {"kind": "ragged", "shape": list(_value.shape)}
+
+    with open("".join([Filename, ".json.partial"]), "w") as _file:
+        json.dump(_index, _file)
+    os.replace("".join([Filename, ".json.partial"]), "".join([Filename, ".json"]))
+
+
+def _save_store_array(Array: np.ndarray, Filename: str) -> None:
+    with open(Filename + ".partial", "wb") as _file:
+        np.save(_file, Array, allow_pickle=False)
+    os.replace(Filename + ".partial", Filename)
+
+
+def is_memory_mapped(Array: np.ndarray) -> bool:
+    """
+    Whether an array is (a view of) a memory-mapped file
 
-def save_video(Images: np.ndarray, Filename: str, fps: Union[float, int] = 30) -> None:
+    :param Array: array
+    :type Array: Any
+    :rtype: bool
+    """
+    _base = Array
+    while _base is not None:
+        if isinstance(_base, (np.memmap, mmap.mmap)):
+            return True
+        _base = getattr(_base, "base", None)
+    return False
+
+
+def in_memory(Value: np.ndarray) -> np.ndarray:
+    """
+    Copies memory-mapped arrays (or the memory-mapped arrays of an object array) into memory
+
+    Once no views remain, the maps are closed, so the mapped files can be replaced.
+
+    :param Value: array or object array of arrays
+    :type Value: Any
+    :return: array that is not memory-mapped
+    :rtype: Any
+    """
+    if not isinstance(Value, np.ndarray):
+        return Value
+    if Value.dtype == object:
+        _copied = np.empty(Value.shape, dtype=object)
+        for _position in np.ndindex(Value.shape):
+            _copied[_position] = in_memory(Value[_position])
+        return _copied
+    return np.array(Value) if is_memory_mapped(Value) else Value
+
+
+class TraceStore(Mapping):
+    """
+    Lazily loaded, non-pickled store of traces (see save_trace_store)
+
+    The store is a read-only mapping of the fields. Each field is memory-mapped on first access, so loading the
+    store only reads the index, and only the frames used are read from disk. Fields of traces per ROI & tiff are
+    returned as object arrays of views of the memory-mapped field, and dense traces as a TraceTensor of the
+    memory-mapped field.
+
+    **Required Inputs**
+        | *Filename* : filename of the store without extension (or the index, Filename.json)
+
+    **Properties**
+        | *fields* : description of the stored fields
+    """
+
+    def __init__(self, Filename: str):
+        if Filename.endswith(".json"):
+            Filename = Filename[:-len(".json")]
+        self.filename = Filename
+        with open("".join([Filename, ".json"]), "r") as _file:
+            self.fields = json.load(_file)["fields"]
+        self._loaded = {}
+
+    def __getitem__(self, Field: str) -> np.ndarray:
+        if Field not in self._loaded:
+            if Field not in self.fields:
+                raise KeyError(Field)
+            self._loaded[Field] = self._load_field(Field)
+        return self._loaded[Field]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __getattr__(self, Field: str) -> np.ndarray:
+        # fields are also attributes (as ProcessedTracesDictionary)
+        if Field.startswith("_") or Field in ("filename", "fields"):
+            raise AttributeError(Field)
+        try:
+            return self[Field]
+        except KeyError:
+            raise AttributeError(Field)
+
+    @staticmethod
+    def exists(Filename: str) -> bool:
+        """
+        Whether a store exists
+
+        :param Filename: filename of the store without extension
+        :type Filename: str
+        :rtype: bool
+        """
+        return os.path.isfile("".join([Filename, ".json"]))
+
+    def _load_field(self, Field: str) -> np.ndarray:
+        _data = np.load("".join([self.filename, "_", Field, ".npy"]), mmap_mode="r", allow_pickle=False)
+        if self.fields[Field]["kind"] == "array":
+            return _data
+        if self.fields[Field]["kind"] == "tensor":
+            from imaging.utilities import TraceTensor
+            return TraceTensor(_data, boundaries=self.fields[Field]["boundaries"])
+
+        _offsets = np.load("".join([self.filename, "_", Field, "_offsets.npy"]), allow_pickle=False)
+        _value = np.empty(int(np.prod(self.fields[Field]["shape"])), dtype=object)
+        for _position, (_offset, *_shape) in enumerate(_offsets.tolist()):
+            _value[_position] = _data[_offset:_offset + int(np.prod(_shape))].reshape(_shape)
+        return _value.reshape(self.fields[Field]["shape"])
+
+
+def save_video(Images: Union[np.ndarray, Iterable[np.ndarray]], Filename: str, fps: Union[float, int] = 30,
+               **kwargs: int) -> None:
     """
     Function writes video to .mp4
 
-    :param Images: Images to be written
+    Images are streamed to the encoder: an array is split into chunks of frames, or an iterator (e.g., a generator
+    rendering colorized frames) supplies chunks of frames [Z x Y x X (x RGB(A))]. Each chunk is converted to unsigned
+    8-bit on its own and encoded on a background thread while the next chunk is produced, so memory does not scale
+    with the length of the video.
+
+    :param Images: Images to be written, or an iterator of chunks of images
     :type Images: Any
     :param Filename: Filename  (Or Complete Filename Path)
     :type Filename: str
     :param fps: frame rate
     :type fps: Union[float, int]
+    :keyword chunk_size: number of frames per chunk when Images is an array (int, default 500)
+    :keyword queue_size: number of chunks waiting to be encoded (int, default 2)
     :rtype: None
     """
+    _chunk_size = kwargs.get("chunk_size", 500)
+    _queue_size = kwargs.get("queue_size", 2)
 
     if "\\" not in Filename:
         Filename = "".join([os.getcwd(), "\\", Filename])
@@ -531,12 +2071,48 @@ def save_video(Images: np.ndarray, Filename: str, fps: Union[float, int] = 30) -
     if ".mp4" not in Filename:
         Filename = "".join([Filename, ".mp4"])
 
-    if Images.dtype.type != np.uint8:
-        print("\nForcing to unsigned 8-bit\n")
-        Images = Images.astype(np.uint8)
+    if isinstance(Images, np.ndarray):
+        if Images.dtype.type != np.uint8:
+            print("\nForcing to unsigned 8-bit\n")
+        _chunks = (Images[_start:_start + _chunk_size] for _start in range(0, Images.shape[0], _chunk_size))
+    else:
+        _chunks = iter(Images)
+
+    _pending_chunks = queue.Queue(maxsize=_queue_size)
+    _errors = []
+
+    def encode_chunks() -> None:
+        # noinspection PyBroadException
+        try:
+            with get_writer(Filename, fps=fps, quality=10, macro_block_size=4) as _writer:
+                _chunk = _pending_chunks.get()
+                while _chunk is not None:
+                    for _frame in _chunk:
+                        _writer.append_data(_frame)
+                    _chunk = _pending_chunks.get()
+        except BaseException as _error:
+            _errors.append(_error)
+            # keep draining so the producer never blocks on a full queue
+            while _pending_chunks.get() is not None:
+                pass
 
     print("\nWriting Images to .mp4...\n")
-    mimwrite(Filename, Images, fps=fps, quality=10, macro_block_size=4)
+    _encoder = threading.Thread(target=encode_chunks, daemon=True)
+    _encoder.start()
+    try:
+        for _chunk in _chunks:
+            if _errors:
+                break
+            _chunk = np.asarray(_chunk)
+            if _chunk.dtype.type != np.uint8:
+                _chunk = _chunk.astype(np.uint8)
+            _pending_chunks.put(_chunk)
+    finally:
+        _pending_chunks.put(None)
+        _encoder.join()
+
+    if _errors:
+        raise _errors[0]
     print("\nFinished writing images to .mp4.\n")
 
 
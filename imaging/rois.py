@@ -0,0 +1,582 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple, Union
+import os
+import numpy as np
+import scipy.sparse
+from skimage.measure import find_contours
+
+
+class ROITable:
+    """
+    Columnar table of Suite2P ROIs
+
+    The pixels of every ROI are concatenated into single arrays (ypix, xpix, lam, overlap, soma_crop) and the
+    pixels of ROI *n* are found at offsets[n]:offsets[n + 1] (as in a CSR sparse matrix). Scalar properties are
+    stored as one column per property, so filters & geometry over all ROIs are array operations. The table is saved
+    as a non-pickled array file (roi_table.npz), see from_suite2p_folder.
+
+    The table replaces the array of Suite2P stat dictionaries: indexing an integer returns the stat entry of an ROI
+    (Table[n].get("ypix"), Table[n].get("soma_crop"), ...) and to_suite2p returns the array of stat entries for
+    functions indexing the stat array itself (e.g., Stats.shape).
+
+    **Required Inputs**
+        | *Offsets* : position of the first pixel of each ROI followed by the total number of pixels
+
+    **Keyword Arguments**
+        | *ypix* : y-coordinates of the pixels (np.ndarray[int32])
+        | *xpix* : x-coordinates of the pixels (np.ndarray[int32])
+        | *lam* : weights of the pixels (np.ndarray[float32], default ones)
+        | *overlap* : whether each pixel is shared with another ROI (np.ndarray[bool], default False)
+        | *soma_crop* : whether each pixel belongs to the soma (np.ndarray[bool], default True)
+        | *med* : centroid (y, x) of each ROI (np.ndarray[float64], default nan)
+        | *radius* : radius of each ROI (np.ndarray[float64], default nan)
+        | *npix* : area of each ROI (np.ndarray[int64], default number of pixels)
+        | *compact* : compactness of each ROI (np.ndarray[float64], default nan)
+        | *iscell* : suite2p classification & probability of each ROI (np.ndarray[float64], default None)
+
+    **Properties**
+        | *counts* : number of pixels of each ROI
+        | *roi_ids* : ROI of each pixel
+        | *diameters* : diameter of each ROI
+        | *neurons* : ROIs classified as cells
+
+    **Self Methods**
+        | *pixels* : pixels of a single ROI
+        | *select* : table of a subset of ROIs
+        | *masks* : boolean masks of the ROIs
+        | *cropped_masks* : boolean masks of the ROIs cropped to their bounding boxes
+        | *circle_pixels* : pixels within the radius of the centroid of each ROI
+        | *to_suite2p* : Suite2P stat entries of the ROIs
+        | *save* : saves the table
+    """
+
+    table_filename = "roi_table.npz"
+    pixel_columns = ("ypix", "xpix", "lam", "overlap", "soma_crop")
+    roi_columns = ("med", "radius", "npix", "compact", "iscell")
+
+    def __init__(self, Offsets: np.ndarray, **kwargs: np.ndarray):
+        self.offsets = np.asarray(Offsets, dtype=np.int64)
+        _num_rois = self.offsets.shape[0] - 1
+        _num_pixels = int(self.offsets[-1])
+
+        self.ypix = np.asarray(kwargs.get("ypix", np.zeros(_num_pixels)), dtype=np.int32)
+        self.xpix = np.asarray(kwargs.get("xpix", np.zeros(_num_pixels)), dtype=np.int32)
+        self.lam = np.asarray(kwargs.get("lam", np.ones(_num_pixels)), dtype=np.float32)
+        self.overlap = np.asarray(kwargs.get("overlap", np.zeros(_num_pixels)), dtype=bool)
+        self.soma_crop = np.asarray(kwargs.get("soma_crop", np.ones(_num_pixels)), dtype=bool)
+        self.med = np.asarray(kwargs.get("med", np.full((_num_rois, 2), np.nan)), dtype=np.float64)
+        self.radius = np.asarray(kwargs.get("radius", np.full(_num_rois, np.nan)), dtype=np.float64)
+        self.npix = np.asarray(kwargs.get("npix", np.diff(self.offsets)), dtype=np.int64)
+        self.compact = np.asarray(kwargs.get("compact", np.full(_num_rois, np.nan)), dtype=np.float64)
+        _iscell = kwargs.get("iscell", None)
+        self.iscell = None if _iscell is None else np.asarray(_iscell, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, Key: Union[int, slice, np.ndarray]) -> Union[Dict[str, np.ndarray], ROITable]:
+        # an integer returns the ROI in the form of a suite2p stat entry
+        if isinstance(Key, (int, np.integer)):
+            _roi = range(len(self))[Key]
+            _pixels = slice(self.offsets[_roi], self.offsets[_roi + 1])
+            return {
+                **{_column: getattr(self, _column)[_pixels] for _column in self.pixel_columns},
+                "med": self.med[_roi], "radius": self.radius[_roi], "npix": self.npix[_roi],
+                "compact": self.compact[_roi]
+            }
+        return self.select(Key)
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def roi_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self)), self.counts)
+
+    @property
+    def diameters(self) -> np.ndarray:
+        return self.radius * 2
+
+    @property
+    def neurons(self) -> np.ndarray:
+        if self.iscell is None:
+            return np.arange(len(self))
+        return np.flatnonzero(self.iscell[:, 0] == 1)
+
+    def pixels(self, ROI: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pixels of a single ROI
+
+        :param ROI: ROI
+        :type ROI: int
+        :return: y-coordinates, x-coordinates
+        :rtype: tuple[Any, Any]
+        """
+        return self.ypix[self.offsets[ROI]:self.offsets[ROI + 1]], self.xpix[self.offsets[ROI]:self.offsets[ROI + 1]]
+
+    def select(self, ROIs: Union[slice, np.ndarray, list]) -> ROITable:
+        """
+        Table of a subset of ROIs
+
+        :param ROIs: indices, boolean mask or slice of the ROIs
+        :type ROIs: Union[slice, Any]
+        :return: table containing the selected ROIs (in the order selected)
+        :rtype: ROITable
+        """
+        _rois = np.arange(len(self))[ROIs]
+        _counts = self.counts[_rois]
+        _offsets = np.concatenate([[0], np.cumsum(_counts)]).astype(np.int64)
+        # position of each selected pixel in the concatenated columns
+        _pixels = np.repeat(self.offsets[:-1][_rois] - _offsets[:-1], _counts) + np.arange(_offsets[-1])
+        return ROITable(_offsets,
+                        **{_column: getattr(self, _column)[_pixels] for _column in self.pixel_columns},
+                        **{_column: getattr(self, _column)[_rois] for _column in self.roi_columns
+                           if getattr(self, _column) is not None})
+
+    def masks(self, Shape: Tuple[int, int], **kwargs: bool) -> np.ndarray:
+        """
+        Boolean masks of the ROIs
+
+        :param Shape: Height, Width of the images
+        :type Shape: tuple[int, int]
+        :keyword exclude_overlap: exclude pixels shared with other ROIs (bool, default True)
+        :return: masks [ROIs x Y x X]
+        :rtype: Any
+        """
+        _pixels = ~self.overlap if kwargs.get("exclude_overlap", True) else slice(None)
+        _masks = np.zeros((len(self), *Shape), dtype=bool)
+        _masks[self.roi_ids[_pixels], self.ypix[_pixels], self.xpix[_pixels]] = True
+        return _masks
+
+    def cropped_masks(self, **kwargs: bool) -> List[CroppedMask]:
+        """
+        Boolean masks of the ROIs cropped to their bounding boxes
+
+        :keyword exclude_overlap: exclude pixels shared with other ROIs (bool, default True)
+        :return: masks
+        :rtype: list[CroppedMask]
+        """
+        _pixels = ~self.overlap if kwargs.get("exclude_overlap", True) else np.ones_like(self.overlap)
+        return [CroppedMask.from_coordinates(self.ypix[_start:_stop][_pixels[_start:_stop]],
+                                             self.xpix[_start:_stop][_pixels[_start:_stop]])
+                for _start, _stop in zip(self.offsets[:-1], self.offsets[1:])]
+
+    def circle_pixels(self, ROIs: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pixels within the radius of the centroid of each ROI
+
+        :param ROIs: subset of ROIs (Optional, default all)
+        :type ROIs: Any
+        :return: first (y) & second (x) coordinates of the pixels
+        :rtype: tuple[Any, Any]
+        """
+        if ROIs is None:
+            ROIs = np.arange(len(self))
+        _radius = self.radius[ROIs]
+        _centers = self.med[ROIs].reshape(-1, 2)
+
+        # candidate pixels: the window (center - radius - 1 to center + radius + 1) of every ROI, row-major, with the
+        # first value, step & length of np.arange(start, stop, dtype=int) along each axis
+        _starts = _centers - _radius[:, np.newaxis] - 1
+        _lengths = np.maximum(np.ceil(_centers + _radius[:, np.newaxis] + 1 - _starts), 0).astype(np.int64)
+        _origins = _starts.astype(np.int64)
+        _steps = (_starts + 1).astype(np.int64) - _origins
+        _sizes = _lengths.prod(axis=1)
+        _rois = np.repeat(np.arange(_radius.shape[0]), _sizes)
+        _positions = np.arange(_sizes.sum()) - np.repeat(np.cumsum(_sizes) - _sizes, _sizes)
+
+        _first = _origins[_rois, 0] + _positions // _lengths[_rois, 1] * _steps[_rois, 0]
+        _second = _origins[_rois, 1] + _positions % _lengths[_rois, 1] * _steps[_rois, 1]
+        _inside = (_first - _centers[_rois, 0]) ** 2 + (_second - _centers[_rois, 1]) ** 2 <= _radius[_rois] ** 2
+        return _first[_inside], _second[_inside]
+
+    def to_suite2p(self) -> np.ndarray:
+        """
+        Suite2P stat entries of the ROIs
+
+        :return: stat dictionaries of the ROIs (as Suite2P "stat")
+        :rtype: Any
+        """
+        _stats = np.empty(len(self), dtype=object)
+        for _roi in range(len(self)):
+            _stats[_roi] = self[_roi]
+        return _stats
+
+    def save(self, Filename: str) -> None:
+        """
+        Saves the table as a non-pickled array file
+
+        :param Filename: filename (.npz)
+        :type Filename: str
+        :rtype: None
+        """
+        with open(Filename, "wb") as _file:
+            np.savez(_file, offsets=self.offsets,
+                     **{_column: getattr(self, _column) for _column in self.pixel_columns + self.roi_columns
+                        if getattr(self, _column) is not None})
+
+    @classmethod
+    def load(cls, Filename: str) -> ROITable:
+        """
+        Loads a saved table
+
+        :param Filename: filename (.npz)
+        :type Filename: str
+        :rtype: ROITable
+        """
+        with np.load(Filename, allow_pickle=False) as _table:
+            return cls(_table["offsets"], **{_column: _table[_column] for _column in _table.files
+                                             if _column != "offsets"})
+
+    @classmethod
+    def from_suite2p(cls, Stats: np.ndarray, Cells: Optional[np.ndarray] = None) -> ROITable:
+        """
+        Converts Suite2P stat (and iscell) into a table
+
+        :param Stats: Suite2P "stat"
+        :type Stats: Any
+        :param Cells: Suite2P "iscell" (Optional)
+        :type Cells: Any
+        :rtype: ROITable
+        """
+        _num_rois = len(Stats)
+        _counts = np.array([len(_stat["ypix"]) for _stat in Stats], dtype=np.int64)
+
+        def concatenate(Key: str, Default: Union[int, bool], Type: np.dtype) -> np.ndarray:
+            return np.concatenate([np.zeros(0, dtype=Type)] +
+                                  [np.asarray(_stat.get(Key, np.full(_count, Default)), dtype=Type)
+                                   for _stat, _count in zip(Stats, _counts)])
+
+        return cls(np.concatenate([[0], np.cumsum(_counts)]),
+                   ypix=concatenate("ypix", 0, np.int32),
+                   xpix=concatenate("xpix", 0, np.int32),
+                   lam=concatenate("lam", 1, np.float32),
+                   overlap=concatenate("overlap", False, bool),
+                   soma_crop=concatenate("soma_crop", True, bool),
+                   med=np.array([_stat.get("med", (np.nan, np.nan)) for _stat in Stats],
+                                dtype=np.float64).reshape(_num_rois, 2),
+                   radius=np.array([_stat.get("radius", np.nan) for _stat in Stats], dtype=np.float64),
+                   npix=np.array([_stat.get("npix", _count) for _stat, _count in zip(Stats, _counts)],
+                                 dtype=np.int64),
+                   compact=np.array([_stat.get("compact", np.nan) for _stat in Stats], dtype=np.float64),
+                   iscell=Cells)
+
+    @classmethod
+    def from_suite2p_folder(cls, Directory: str, **kwargs: bool) -> ROITable:
+        """
+        Loads the table of a Suite2P plane folder (containing stat.npy & iscell.npy)
+
+        The table is built from stat.npy once and saved as roi_table.npz, which is reused while it is newer than
+        stat.npy & iscell.npy
+
+        :param Directory: Suite2P plane folder
+        :type Directory: str
+        :keyword cache: whether to read/write roi_table.npz (bool, default True)
+        :rtype: ROITable
+        """
+        _cache = kwargs.get("cache", True)
+        _table_file = "".join([Directory, "\\", cls.table_filename])
+        _stat_file = "".join([Directory, "\\stat.npy"])
+        _cell_file = "".join([Directory, "\\iscell.npy"])
+        _sources = [_file for _file in (_stat_file, _cell_file) if os.path.isfile(_file)]
+
+        if _cache and os.path.isfile(_table_file) and \
+                all(os.path.getmtime(_file) <= os.path.getmtime(_table_file) for _file in _sources):
+            return cls.load(_table_file)
+
+        _cells = np.load(_cell_file, allow_pickle=True) if os.path.isfile(_cell_file) else None
+        _table = cls.from_suite2p(np.load(_stat_file, allow_pickle=True), _cells)
+        if _cache:
+            _table.save(_table_file)
+        return _table
+
+
+class CroppedMask:
+    """
+    Boolean mask of a region stored within its bounding box
+
+    Memory scales with the area of the region rather than the field of view.
+
+    **Required Inputs**
+        | *Origin* : position (y, x) of the first pixel of the cropped mask in the field of view
+        | *Mask* : cropped boolean mask
+
+    **Properties**
+        | *area* : number of pixels in the region
+        | *bounds* : (y start, y stop, x start, x stop) of the cropped mask in the field of view
+
+    **Self Methods**
+        | *coordinates* : coordinates of the pixels in the field of view (row-major order)
+        | *dense* : boolean mask of the field of view
+    """
+
+    def __init__(self, Origin: Tuple[int, int], Mask: np.ndarray):
+        self.origin = (int(Origin[0]), int(Origin[1]))
+        self.mask = np.asarray(Mask, dtype=bool)
+
+    @property
+    def area(self) -> int:
+        return int(np.count_nonzero(self.mask))
+
+    @property
+    def bounds(self) -> Tuple[int, int, int, int]:
+        return self.origin[0], self.origin[0] + self.mask.shape[0], self.origin[1], self.origin[1] + self.mask.shape[1]
+
+    def coordinates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Coordinates of the pixels in the field of view (row-major order, as numpy.nonzero of the dense mask)
+
+        :return: y-coordinates, x-coordinates
+        :rtype: tuple[Any, Any]
+        """
+        _y, _x = self.mask.nonzero()
+        return _y + self.origin[0], _x + self.origin[1]
+
+    def dense(self, Shape: Tuple[int, int]) -> np.ndarray:
+        """
+        Boolean mask of the field of view
+
+        :param Shape: Height, Width of the field of view
+        :type Shape: tuple[int, int]
+        :rtype: Any
+        """
+        _mask = np.zeros(Shape, dtype=bool)
+        _mask[self.coordinates()] = True
+        return _mask
+
+    @classmethod
+    def from_coordinates(cls, Y: np.ndarray, X: np.ndarray) -> CroppedMask:
+        """
+        Cropped mask containing the pixels at the coordinates
+
+        :param Y: y-coordinates
+        :type Y: Any
+        :param X: x-coordinates
+        :type X: Any
+        :rtype: CroppedMask
+        """
+        if len(Y) == 0:
+            return cls((0, 0), np.zeros((0, 0), dtype=bool))
+        _origin = (int(np.min(Y)), int(np.min(X)))
+        _mask = np.zeros((int(np.max(Y)) - _origin[0] + 1, int(np.max(X)) - _origin[1] + 1), dtype=bool)
+        _mask[np.asarray(Y) - _origin[0], np.asarray(X) - _origin[1]] = True
+        return cls(_origin, _mask)
+
+
+def grow_neuropil(Mask: CroppedMask, Shape: Tuple[int, int], TotalExpansion: float = 4) -> CroppedMask:
+    """
+    Neuropil surrounding a region, grown within a cropped window
+
+    Identical to fissa.roitools.get_npil_mask: the region is alternately expanded in the 4 cardinal & the 4
+    diagonal directions until the neuropil is TotalExpansion times the area of the region. The window is enlarged
+    whenever the neuropil reaches a side of the window that is not a side of the field of view.
+
+    :param Mask: region
+    :type Mask: CroppedMask
+    :param Shape: Height, Width of the field of view
+    :type Shape: tuple[int, int]
+    :param TotalExpansion: area of the neuropil relative to the area of the region
+    :type TotalExpansion: float
+    :return: neuropil (excluding the region)
+    :rtype: CroppedMask
+    """
+    _area_original = Mask.area
+    _area_total = Shape[0] * Shape[1]
+    _y_start, _y_stop, _x_start, _x_stop = Mask.bounds
+    _margin = max(int(np.ceil(np.sqrt(_area_original * (TotalExpansion + 1)))), 2)
+
+    while True:
+        _origin = (max(_y_start - _margin, 0), max(_x_start - _margin, 0))
+        _stop = (min(_y_stop + _margin, Shape[0]), min(_x_stop + _margin, Shape[1]))
+        _region = np.zeros((_stop[0] - _origin[0], _stop[1] - _origin[1]), dtype=bool)
+        _region[_y_start - _origin[0]:_y_stop - _origin[0], _x_start - _origin[1]:_x_stop - _origin[1]] = Mask.mask
+
+        _grown = _region.copy()
+        _area_current = 0
+        _count = 0
+        while _area_current < TotalExpansion * _area_original and _area_current < _area_total - _area_original:
+            _reference = _grown.copy()
+            if _count % 2 == 0:
+                # N, E, S, W
+                _grown[1:] |= _reference[:-1]
+                _grown[:-1] |= _reference[1:]
+                _grown[:, 1:] |= _reference[:, :-1]
+                _grown[:, :-1] |= _reference[:, 1:]
+            else:
+                # NE, SE, SW, NW
+                _grown[1:, 1:] |= _reference[:-1, :-1]
+                _grown[1:, :-1] |= _reference[:-1, 1:]
+                _grown[:-1, 1:] |= _reference[1:, :-1]
+                _grown[:-1, :-1] |= _reference[1:, 1:]
+            _area_current = np.count_nonzero(_grown) - _area_original
+            _count += 1
+
+        # pixels grown beyond the window would have been lost
+        if (_origin[0] > 0 and _grown[0].any()) or (_stop[0] < Shape[0] and _grown[-1].any()) or \
+                (_origin[1] > 0 and _grown[:, 0].any()) or (_stop[1] < Shape[1] and _grown[:, -1].any()):
+            _margin *= 2
+            continue
+
+        _grown[_region] = False
+        return CroppedMask(_origin, _grown)
+
+
+def split_neuropil(Neuropil: CroppedMask, Centre: Tuple[float, float], Regions: int, Shape: Tuple[int, int]) \
+        -> List[CroppedMask]:
+    """
+    Splits a neuropil into regions of approximately equal area around a centre
+
+    Identical to fissa.roitools.split_npil
+
+    :param Neuropil: neuropil
+    :type Neuropil: CroppedMask
+    :param Centre: centre (y, x) around which the neuropil is split
+    :type Centre: tuple[float, float]
+    :param Regions: number of regions
+    :type Regions: int
+    :param Shape: Height, Width of the field of view
+    :type Shape: tuple[int, int]
+    :return: regions (within the window of the neuropil)
+    :rtype: list[CroppedMask]
+    """
+    _local_y, _local_x = Neuropil.mask.nonzero()
+    if _local_y.size == 0:
+        raise ValueError("Neuropil must not be empty")
+    _theta = np.arctan2(_local_y + Neuropil.origin[0] - Centre[0], _local_x + Neuropil.origin[1] - Centre[1])
+
+    # start the first region where the neuropil is closest to the centre
+    _num_bins = min(20, Shape[0])
+    _bin_counts, _bins = np.histogram(_theta, bins=np.linspace(-np.pi, np.pi, _num_bins + 1))
+    _theta = (_theta - (_bins[np.argmin(_bin_counts)] + np.pi / _num_bins)) % (2 * np.pi) - np.pi
+
+    Regions = int(Regions)
+    if Regions < 1:
+        raise ValueError("Number of slices must be positive")
+    _bounds = [np.percentile(_theta, 100.0 * (_region + 1) / Regions) for _region in range(Regions)]
+
+    _regions = []
+    for _region in range(Regions):
+        _pixels = _theta <= _bounds[_region]
+        if _region > 0:
+            _pixels = _pixels * (_theta > _bounds[_region - 1])
+        _mask = np.zeros_like(Neuropil.mask)
+        _mask[_local_y[_pixels], _local_x[_pixels]] = True
+        _regions.append(CroppedMask(Neuropil.origin, _mask))
+    return _regions
+
+
+def neuropil_masks(Mask: CroppedMask, Shape: Tuple[int, int], Regions: int = 4, Expansion: float = 1) \
+        -> List[CroppedMask]:
+    """
+    Neuropil regions surrounding a region, computed within cropped windows
+
+    Identical to fissa.roitools.getmasks_npil: the neuropil is Regions * Expansion times the area of the region
+    and is split into Regions regions around the centre of mass of the region
+
+    :param Mask: region
+    :type Mask: CroppedMask
+    :param Shape: Height, Width of the field of view
+    :type Shape: tuple[int, int]
+    :param Regions: number of neuropil regions
+    :type Regions: int
+    :param Expansion: area of each neuropil region relative to the area of the region
+    :type Expansion: float
+    :return: neuropil regions
+    :rtype: list[CroppedMask]
+    """
+    _y, _x = Mask.coordinates()
+    return split_neuropil(grow_neuropil(Mask, Shape, Expansion * Regions), (np.mean(_y), np.mean(_x)), Regions, Shape)
+
+
+def roi_edge(Mask: CroppedMask) -> List[np.ndarray]:
+    """
+    Outline of a region, traced within its cropped window
+
+    Identical to fissa.roitools.find_roi_edge of the dense mask
+
+    :param Mask: region
+    :type Mask: CroppedMask
+    :return: contours (y, x) of the region, defined from the corners of the pixels
+    :rtype: list[Any]
+    """
+    _padded = np.zeros((Mask.mask.shape[0] + 2, Mask.mask.shape[1] + 2))
+    _padded[1:-1, 1:-1] = Mask.mask
+    return [_contour - 0.5 + Mask.origin for _contour in find_contours(_padded, level=0.5)]
+
+
+class MaskMatrix:
+    """
+    Sparse matrix of regions by pixels for extracting the mean trace of every region
+
+    Rows are regions and columns are the pixels belonging to any region, so the traces of all regions within a chunk
+    of frames are a single sparse-dense matrix product. Traces are summed over the pixels & divided by the area of
+    each region, so integer images give exactly the float64 mean of numpy (as fissa's extraction).
+
+    **Required Inputs**
+        | *Masks* : regions
+        | *Shape* : Height, Width of the field of view
+
+    **Properties**
+        | *matrix* : sparse matrix (regions x pixels) of ones
+        | *pixels* : flattened indices of the pixels of the columns
+        | *areas* : number of pixels in each region
+
+    **Self Methods**
+        | *extract* : traces of the regions & mean image
+    """
+
+    def __init__(self, Masks: List[CroppedMask], Shape: Tuple[int, int]):
+        self.shape = tuple(Shape)
+        _coordinates = [_mask.coordinates() for _mask in Masks]
+        _flat = [np.ravel_multi_index(_pixels, self.shape) for _pixels in _coordinates]
+        self.areas = np.array([_pixels.shape[0] for _pixels in _flat], dtype=np.int64)
+        _flat = np.concatenate([np.zeros(0, dtype=np.int64), *_flat])
+        self.pixels, _columns = np.unique(_flat, return_inverse=True)
+        self.matrix = scipy.sparse.csr_matrix(
+            (np.ones(_flat.shape[0]), _columns.ravel(), np.concatenate([[0], np.cumsum(self.areas)])),
+            shape=(len(Masks), self.pixels.shape[0]))
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def extract(self, Images: np.ndarray, **kwargs: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Traces of the regions & mean image, streaming the images in chunks of frames
+
+        :param Images: images in numpy array or memory-mapped [Z x Y x X]
+        :type Images: Any
+        :keyword chunk_size: number of frames per chunk (int, default 1000)
+        :return: traces [Regions x Z], mean image [Y x X]
+        :rtype: tuple[Any, Any]
+        """
+        _chunk_size = kwargs.get("chunk_size", 1000)
+        _frames = Images.shape[0]
+        _traces = np.zeros((len(self), _frames), dtype=np.float64)
+        _sum = np.zeros(self.shape[0] * self.shape[1], dtype=np.float64)
+
+        for _start in range(0, _frames, _chunk_size):
+            _stop = min(_start + _chunk_size, _frames)
+            _chunk = np.asarray(Images[_start:_stop]).reshape(_stop - _start, -1)
+            _sum += _chunk.sum(axis=0, dtype=np.float64)
+            _traces[:, _start:_stop] = self.matrix @ _chunk[:, self.pixels].T.astype(np.float64)
+
+        # empty regions have a mean of nan (as numpy)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            _traces /= self.areas[:, np.newaxis]
+        return _traces, (_sum / _frames).reshape(self.shape)
+
+
+def as_roi_table(Stats: Union[ROITable, np.ndarray], Cells: Optional[np.ndarray] = None) -> ROITable:
+    """
+    Returns a table of the ROIs, converting Suite2P stat if necessary
+
+    :param Stats: Suite2P "stat" or ROITable
+    :type Stats: Union[ROITable, Any]
+    :param Cells: Suite2P "iscell" (Optional)
+    :type Cells: Any
+    :rtype: ROITable
+    """
+    if isinstance(Stats, ROITable):
+        return Stats
+    return ROITable.from_suite2p(Stats, Cells)
@@ -0,0 +1,256 @@
+from __future__ import annotations
+from typing import Callable, List, Tuple
+import os
+import glob
+import hashlib
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from tqdm import tqdm
+
+
+def separate_rois_parallel(Raw: np.ndarray, Separator: Callable, **kwargs) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Separates the raw traces of each ROI using a pool of processes
+
+    The ROIs are separated in batches (work units) by the separator. The raw traces are packed once into
+    shared memory and the workers write the separated traces & mixing matrices directly into preallocated outputs
+    in shared memory, so neither the inputs nor the outputs are pickled between processes. Each finished batch is
+    saved to the checkpoint folder (non-pickled .npz), so an interrupted separation resumes from the finished ROIs.
+    The outputs have the layout of fissa.Experiment.separate.
+
+    :param Raw: raw traces of fissa (ROIs x trials, each regions x frames)
+    :type Raw: Any
+    :param Separator: separates the raw traces of the trials of a single ROI, called as
+        Separator(Raw, verbosity=0, alpha, max_iter, tol, max_tries, method) and returning the separated & matched
+        traces of each trial, the mixing matrix and the convergence (e.g., fissa.core.separate_trials). It must be
+        picklable (a module-level function) to be called by the worker processes.
+    :type Separator: Callable
+    :keyword workers: number of worker processes (int, default os.cpu_count())
+    :keyword batch_size: number of ROIs per work unit (int, default 8)
+    :keyword checkpoint_folder: folder of the checkpoints (str, default None, no checkpoints)
+    :keyword alpha: sparsity regularization of NMF (float, default 0.1)
+    :keyword max_iter: maximum iterations of the separation (int, default 20000)
+    :keyword tol: tolerance of the separation (float, default 1e-4)
+    :keyword max_tries: maximum number of random initializations (int, default 1)
+    :keyword method: separation method (str, default "nmf")
+    :return: sep, result, mixmat, info (each ROIs x trials)
+    :rtype: tuple[Any, Any, Any, Any]
+    """
+    _workers = kwargs.get("workers", os.cpu_count())
+    _batch_size = kwargs.get("batch_size", 8)
+    _checkpoint_folder = kwargs.get("checkpoint_folder", None)
+    _parameters = {"alpha": kwargs.get("alpha", 0.1), "max_iter": kwargs.get("max_iter", 20000),
+                   "tol": kwargs.get("tol", 1e-4), "max_tries": kwargs.get("max_tries", 1),
+                   "method": kwargs.get("method", "nmf")}
+
+    _num_rois, _num_trials = Raw.shape
+    _trial_lengths = [Raw[0, _trial].shape[1] for _trial in range(_num_trials)]
+    _bounds = np.concatenate([[0], np.cumsum(_trial_lengths)]).astype(int)
+    _regions = Raw[0, 0].shape[0]
+
+    # shared inputs & preallocated shared outputs (separations have at most as many components as regions)
+    _arrays = {"raw": (_num_rois, _regions, _bounds[-1]), "sep": (_num_rois, _regions, _bounds[-1]),
+               "result": (_num_rois, _regions, _bounds[-1]), "mixmat": (_num_rois, _regions, _regions)}
+    _memory = {_name: shared_memory.SharedMemory(create=True, size=max(int(np.prod(_shape)) * 8, 1))
+               for _name, _shape in _arrays.items()}
+    _shared = None
+    try:
+        _shared = {_name: np.ndarray(_shape, dtype=np.float64, buffer=_memory[_name].buf)
+                   for _name, _shape in _arrays.items()}
+        for _roi in range(_num_rois):
+            for _trial in range(_num_trials):
+                _shared["raw"][_roi, :, _bounds[_trial]:_bounds[_trial + 1]] = Raw[_roi, _trial]
+        _specs = {_name: (_memory[_name].name, _shape) for _name, _shape in _arrays.items()}
+
+        _components = np.zeros(_num_rois, dtype=int)
+        _info = np.empty((_num_rois, _num_trials), dtype=object)
+        _batches = [np.arange(_start, min(_start + _batch_size, _num_rois))
+                    for _start in range(0, _num_rois, _batch_size)]
+
+        # resume from the checkpoints of the same traces & parameters
+        if _checkpoint_folder is not None:
+            _finished = load_separation_checkpoints(_checkpoint_folder, _shared, _components, _info, _parameters)
+            _batches = [_batch for _batch in _batches if not np.all(_finished[_batch])]
+
+        def finish(Batch: np.ndarray, Components: List[int], Info: List[dict]) -> None:
+            _components[Batch] = Components
+            for _roi, _convergence in zip(Batch, Info):
+                _info[_roi, :] = [_convergence] * _num_trials
+            if _checkpoint_folder is not None:
+                save_separation_checkpoint(_checkpoint_folder, Batch, _shared, Components, Info)
+
+        if _workers is not None and _workers <= 1:
+            for _batch in tqdm(_batches, total=len(_batches), desc="Separating ROIs", disable=False):
+                finish(_batch, *separate_batch(Separator, _specs, _batch, _bounds, _parameters))
+        else:
+            with ProcessPoolExecutor(max_workers=_workers) as _executor:
+                _futures = {_executor.submit(separate_batch, Separator, _specs, _batch, _bounds, _parameters): _batch
+                            for _batch in _batches}
+                for _future in tqdm(as_completed(_futures), total=len(_futures), desc="Separating ROIs",
+                                    disable=False):
+                    finish(_futures[_future], *_future.result())
+
+        _sep = np.empty((_num_rois, _num_trials), dtype=object)
+        _result = np.empty_like(_sep)
+        _mixmat = np.empty_like(_sep)
+        _outputs = {_name: _shared[_name].copy() for _name in ("sep", "result", "mixmat")}
+        for _roi in range(_num_rois):
+            _mixmat[_roi, :] = [_outputs["mixmat"][_roi, :, :_components[_roi]]] * _num_trials
+            for _trial in range(_num_trials):
+                _frames = slice(_bounds[_trial], _bounds[_trial + 1])
+                _sep[_roi, _trial] = _outputs["sep"][_roi, :_components[_roi], _frames]
+                _result[_roi, _trial] = _outputs["result"][_roi, :_components[_roi], _frames]
+    finally:
+        # views of the shared memory must be released before closing
+        _shared = None
+        for _block in _memory.values():
+            _block.close()
+            _block.unlink()
+
+    _non_converged = [_roi for _roi in range(_num_rois) if not _info[_roi, 0]["converged"]]
+    if len(_non_converged) > 0:
+        print("Separation did not converge for the following " + str(len(_non_converged)) + " ROIs: " +
+              str(_non_converged))
+    if _checkpoint_folder is not None:
+        for _file in glob.glob(_checkpoint_folder + "\\*.npz") + glob.glob(_checkpoint_folder + "\\key.json"):
+            os.remove(_file)
+    return _sep, _result, _mixmat, _info
+
+
+def separate_batch(Separator: Callable, Specs: dict, Batch: np.ndarray, Bounds: np.ndarray, Parameters: dict) \
+        -> Tuple[List[int], List[dict]]:
+    """
+    Separates a batch of ROIs, reading the raw traces from & writing the outputs into shared memory
+
+    :param Separator: separator of a single ROI (see separate_rois_parallel)
+    :type Separator: Callable
+    :param Specs: name & shape of the shared arrays (raw, sep, result, mixmat)
+    :type Specs: dict
+    :param Batch: ROIs
+    :type Batch: Any
+    :param Bounds: first frame of each trial followed by the total number of frames
+    :type Bounds: Any
+    :param Parameters: parameters of the separator
+    :type Parameters: dict
+    :return: number of components & convergence of each ROI
+    :rtype: tuple[list[int], list[dict]]
+    """
+    _memory = {_name: shared_memory.SharedMemory(name=_spec[0]) for _name, _spec in Specs.items()}
+    _shared = _raw = None
+    try:
+        _shared = {_name: np.ndarray(Specs[_name][1], dtype=np.float64, buffer=_memory[_name].buf)
+                   for _name in Specs}
+        _components = []
+        _info = []
+        for _roi in Batch:
+            _raw = [_shared["raw"][_roi, :, Bounds[_trial]:Bounds[_trial + 1]] for _trial in range(len(Bounds) - 1)]
+            _sep, _match, _mixmat, _convergence = Separator(_raw, verbosity=0, **Parameters)
+            _sep = np.concatenate(_sep, axis=1)
+            _shared["sep"][_roi, :_sep.shape[0]] = _sep
+            _shared["result"][_roi, :_sep.shape[0]] = np.concatenate(_match, axis=1)
+            _shared["mixmat"][_roi, :, :_mixmat.shape[1]] = _mixmat
+            _components.append(int(_sep.shape[0]))
+            _info.append({_key: (_value.item() if isinstance(_value, np.generic) else _value)
+                          for _key, _value in _convergence.items()})
+    finally:
+        # views of the shared memory must be released before closing
+        _shared = _raw = None
+        for _block in _memory.values():
+            _block.close()
+    return _components, _info
+
+
+def separation_checkpoint_key(Raw: np.ndarray, Parameters: dict) -> str:
+    """
+    Key identifying the raw traces & separation parameters of a checkpoint
+
+    :param Raw: packed raw traces (ROIs x regions x frames)
+    :type Raw: Any
+    :param Parameters: parameters of the separation
+    :type Parameters: dict
+    :rtype: str
+    """
+    return json.dumps({"shape": list(Raw.shape), "digest": hashlib.sha1(Raw.tobytes()).hexdigest(),
+                       **{_key: Parameters[_key] for _key in sorted(Parameters)}}, sort_keys=True)
+
+
+def save_separation_checkpoint(CheckpointFolder: str, Batch: np.ndarray, Shared: dict, Components: List[int],
+                               Info: List[dict]) -> None:
+    """
+    Saves the outputs of a finished batch of ROIs
+
+    :param CheckpointFolder: folder of the checkpoints
+    :type CheckpointFolder: str
+    :param Batch: ROIs
+    :type Batch: Any
+    :param Shared: shared arrays (sep, result, mixmat)
+    :type Shared: dict
+    :param Components: number of components of each ROI
+    :type Components: list[int]
+    :param Info: convergence of each ROI
+    :type Info: list[dict]
+    :rtype: None
+    """
+    _checkpoint = "".join([CheckpointFolder, "\\rois_", str(Batch[0]), "_", str(Batch[-1]), ".npz"])
+    # written under a temporary name, so an interrupted write is never loaded
+    with open(_checkpoint + ".partial", "wb") as _file:
+        np.savez(_file, rois=np.asarray(Batch), components=np.asarray(Components), sep=Shared["sep"][Batch],
+                 result=Shared["result"][Batch], mixmat=Shared["mixmat"][Batch], info=np.array(json.dumps(Info)))
+    os.replace(_checkpoint + ".partial", _checkpoint)
+
+
+def load_separation_checkpoints(CheckpointFolder: str, Shared: dict, Components: np.ndarray, Info: np.ndarray,
+                                Parameters: dict) -> np.ndarray:
+    """
+    Loads the outputs of the finished batches of ROIs into the shared arrays
+
+    Checkpoints of other raw traces or parameters are discarded & the key of the current separation is written
+
+    :param CheckpointFolder: folder of the checkpoints
+    :type CheckpointFolder: str
+    :param Shared: shared arrays (raw, sep, result, mixmat)
+    :type Shared: dict
+    :param Components: number of components of each ROI (modified)
+    :type Components: Any
+    :param Info: convergence of each ROI & trial (modified)
+    :type Info: Any
+    :param Parameters: parameters of the separation
+    :type Parameters: dict
+    :return: whether each ROI is finished
+    :rtype: Any
+    """
+    _finished = np.zeros(Shared["raw"].shape[0], dtype=bool)
+    _key = separation_checkpoint_key(Shared["raw"], Parameters)
+    _key_file = CheckpointFolder + "\\key.json"
+    _checkpoints = glob.glob(CheckpointFolder + "\\rois_*.npz")
+
+    _previous_key = None
+    if os.path.isfile(_key_file):
+        with open(_key_file, "r") as _file:
+            _previous_key = _file.read()
+
+    if _previous_key == _key:
+        for _checkpoint in _checkpoints:
+            try:
+                with np.load(_checkpoint, allow_pickle=False) as _data:
+                    _rois = _data["rois"]
+                    Shared["sep"][_rois] = _data["sep"]
+                    Shared["result"][_rois] = _data["result"]
+                    Shared["mixmat"][_rois] = _data["mixmat"]
+                    Components[_rois] = _data["components"]
+                    for _roi, _convergence in zip(_rois, json.loads(str(_data["info"]))):
+                        Info[_roi, :] = [_convergence] * Info.shape[1]
+                    _finished[_rois] = True
+            except (OSError, ValueError, KeyError):
+                # unreadable checkpoints are separated again
+                print("Could not load checkpoint " + _checkpoint)
+        print("Resuming separation with " + str(int(_finished.sum())) + " finished ROIs")
+    else:
+        for _checkpoint in _checkpoints:
+            os.remove(_checkpoint)
+        os.makedirs(CheckpointFolder, exist_ok=True)
+        with open(_key_file, "w") as _file:
+            _file.write(_key)
+    return _finished
@@ -9,6 +9,7 @@ import itertools
 import scipy.ndimage
 import pandas as pd
 from scipy.ndimage.filters import gaussian_filter
+from imaging.utilities import TraceTensor, as_trace_tensor
 
 
 def calculate_dFoF(Traces: np.ndarray, FrameRate: float, **kwargs: Union[bool, float]):
@@ -19,8 +20,6 @@ def calculate_dFoF(Traces: np.ndarray, FrameRate: float, **kwargs: Union[bool, f
     _merge_after = kwargs.get('merge_after', True)
     _offset = kwargs.get('offset', 0.0001)
 
-    # /// Pre-Allocate ///
-    dFoF = np.empty_like(Traces)
     # /// Initialize Feedback
     msg = "Calculating Δf/f0"
     if _across_tiffs:
@@ -35,6 +34,13 @@ def calculate_dFoF(Traces: np.ndarray, FrameRate: float, **kwargs: Union[bool, f
     sys.stdout.flush()
     desc = "Calculating {}f/f0".format("d" if sys.version_info < (3, 0) else "Δ")
 
+    # /// Dense Traces ///
+    if isinstance(Traces, TraceTensor):
+        return calculate_dFoF_tensor(Traces, FrameRate, desc, **kwargs)
+
+    # /// Pre-Allocate ///
+    dFoF = np.empty_like(Traces)
+
     # /// Determine Format ///
     if Traces[0, 0].shape:
         _format = 0  # ROIs x TIFFS <- SUB-MASKS x FRAMES
@@ -110,6 +116,64 @@ def calculate_dFoF(Traces: np.ndarray, FrameRate: float, **kwargs: Union[bool, f
         print("NOT YET")
 
 
+def calculate_dFoF_tensor(Traces: TraceTensor, FrameRate: float, Description: str = "Calculating Δf/f0",
+                          **kwargs: Union[bool, float, int]) -> Union[TraceTensor, np.ndarray]:
+    """
+    Calculates Δf/f0 of dense traces (see calculate_dFoF)
+
+    The baseline f0 of a block of neurons is found at once along the frames of the tensor. The traces are not
+    modified.
+
+    :param Traces: traces
+    :type Traces: TraceTensor
+    :param FrameRate: frame rate
+    :type FrameRate: float
+    :param Description: description of the progress bar
+    :type Description: str
+    :keyword raw: raw traces used for f0 (TraceTensor or ROI x TIFF, default None)
+    :keyword use_raw_f0: divide by the f0 of the raw traces (bool, default True)
+    :keyword across_tiffs: single f0 across all tiffs (bool, default True)
+    :keyword merge_after: return the first component merged across tiffs (bool, default True)
+    :keyword offset: offset added to the traces (float, default 0.0001)
+    :keyword block_size: number of neurons calculated at once (int, default 64)
+    :return: Δf/f0 (tensor, or [Neurons x Frames] if merged)
+    :rtype: Union[TraceTensor, Any]
+    """
+    _raw = kwargs.get('raw', None)
+    _use_raw_f0 = kwargs.get('use_raw_f0', True) and _raw is not None
+    _across_tiffs = kwargs.get('across_tiffs', True)
+    _merge_after = kwargs.get('merge_after', True)
+    _offset = kwargs.get('offset', 0.0001)
+    _block_size = kwargs.get('block_size', 64)
+
+    if _use_raw_f0:
+        _raw = as_trace_tensor(_raw)
+    _tiffs = [(0, Traces.frames)] if _across_tiffs else list(zip(Traces.boundaries[:-1], Traces.boundaries[1:]))
+    dFoF = np.empty(Traces.shape, dtype=np.float32)
+
+    for _start in tqdm(
+            range(0, Traces.neurons, _block_size),
+            total=int(np.ceil(Traces.neurons / _block_size)),
+            desc=Description,
+            disable=False,
+    ):
+        _stop = min(_start + _block_size, Traces.neurons)
+        for _first, _last in _tiffs:
+            _trace = Traces.data[_start:_stop, :, _first:_last].astype(np.float64) + _offset
+            _trace_f0 = findBaselineF0(_trace, FrameRate, 2, keepdims=True)
+            if not _across_tiffs:
+                _trace_f0[_trace_f0 < 0] = 0
+            if _use_raw_f0:
+                _raw_f0 = findBaselineF0(_raw.data[_start:_stop, 0, _first:_last].astype(np.float64), FrameRate, 1)
+                dFoF[_start:_stop, :, _first:_last] = (_trace - _trace_f0) / _raw_f0[:, np.newaxis, np.newaxis]
+            else:
+                dFoF[_start:_stop, :, _first:_last] = (_trace - _trace_f0) / _trace_f0
+
+    if _merge_after:
+        return np.ascontiguousarray(dFoF[:, 0, :])
+    return Traces.with_data(dFoF)
+
+
 def smoothTraces(Traces, **kwargs):
     _niter = kwargs.get('niter', 5)
     _kappa = kwargs.get('kappa', 100)
@@ -136,6 +200,22 @@ def smoothTraces_TiffOrg(Traces, **kwargs):
     _kappa = kwargs.get('kappa', 100)
     _gamma = kwargs.get('gamma', 0.15)
 
+    # Dense traces are smoothed in place of their rows
+    if isinstance(Traces, TraceTensor):
+        _calculated_kappa = _kappa * np.ptp(Traces.data, axis=2)
+        _smoothed = np.empty(Traces.shape, dtype=np.float32)
+        for _neuron in tqdm(
+                range(Traces.neurons),
+                total=Traces.neurons,
+                desc="Smoothing",
+                disable=False,
+        ):
+            for _component in range(Traces.components):
+                _smoothed[_neuron, _component, :] = anisotropic_diffusion(
+                    Traces.data[_neuron, _component, :], niter=_niter, kappa=_calculated_kappa[_neuron, _component],
+                    gamma=_gamma)
+        return Traces.with_data(_smoothed), _smoothed.transpose(0, 2, 1)
+
     # Find Sizes of Traces - Frames, Neurons, Tiffs, Components, Frames In Images
     _frames = np.concatenate(Traces[0], axis=1)[0, :].shape[0]
     [_neurons, _tiffs] = Traces.shape
@@ -198,6 +278,20 @@ def detrendTraces_TiffOrg(Traces, **kwargs):
     _order = kwargs.get('order', 4)
     _plot = kwargs.get('plot', False)
 
+    # Dense traces are detrended row by row
+    if isinstance(Traces, TraceTensor):
+        _detrended = np.empty(Traces.shape, dtype=np.float32)
+        for _neuron in tqdm(
+                range(Traces.neurons),
+                total=Traces.neurons,
+                desc="Detrending",
+                disable=False,
+        ):
+            for _component in range(Traces.components):
+                _detrended[_neuron, _component, :] = polynomial(
+                    Traces.data[_neuron, _component, :].astype(np.float64), order=_order, plot=_plot)
+        return Traces.with_data(_detrended)
+
     _frames = np.concatenate(Traces[0], axis=1)[0, :].shape[0]
     [_neurons, _tiffs] = Traces.shape
     _components = Traces[0, 0].shape[0]
@@ -11,7 +11,7 @@ import numpy as np
 from imaging.modified_denoising.utils import save_yaml, read_yaml
 from imaging.modified_denoising.data_process import test_preprocess_lessMemoryNoTail_feedImage, \
     testset, multibatch_test_save, singlebatch_test_save
-from imaging.io import save_raw_binary
+from imaging.io import save_raw_binary, save_binary_meta, ChunkedVideo, PrefetchReader
 import pprint
 
 # Make sure to  edit the forking pickler to use protocol 4 in multiprocessing library
@@ -95,9 +95,9 @@ class DenoisingAnalysis:
 
 
                 # Iterate
-                for _image in range(len(_img_list)):
+                for _image, (_start, _stop, _stack, _) in enumerate(_img_list):
                     _name_list, _noise_img, _coordinate_list = \
-                        test_preprocess_lessMemoryNoTail_feedImage(self.opt, np.array(_img_list[_image]))
+                        test_preprocess_lessMemoryNoTail_feedImage(self.opt, _stack)
                     _prev_time = time.time()
                     _time_start = time.time()
                     _denoise_img = np.zeros(_noise_img.shape)
@@ -181,12 +181,15 @@ class DenoisingAnalysis:
                         _result_name = "".join([self.opt.output_path, "\\", _model_name.replace(".pth", ""), str(_image)])
                         save_raw_binary(_output_img, _result_name)
                     else:
-                        _mapped_output[_image*_output_img.shape[0]:_image*_output_img.shape[0]+_output_img.shape[0],
-                            :, :] = _output_img
+                        _mapped_output[_start:_start+_output_img.shape[0], :, :] = _output_img
 
                     _output_img = None
         if len(_model_list) <= 1:
-            del _mapped_output # close the memmap file
+            # write the dirty pages (binary) or the pending chunks & index (chunked) before releasing the file
+            _mapped_output.flush()
+            if isinstance(_mapped_output, ChunkedVideo):
+                _mapped_output.close()
+            del _mapped_output
         print("Finished modified_denoising")
 
     @classmethod
@@ -213,15 +216,15 @@ class DenoisingAnalysis:
                 return
 
             if _num_frames <= opt.test_datasize:
-                img_list = [_images]
+                _boundaries = [(0, _num_frames)]
             else:
                 _chunk_size = cls.calculate_chunk_size(_num_frames, opt.test_datasize)
-                _indices = np.arange(0, _num_frames+1, _num_frames/_chunk_size)
-                img_list = []
-                for i in range(_indices.shape[0]-1):
-                    img_list.append(_images[_indices[i].astype(int):_indices[i+1].astype(int), :, :])
+                _indices = np.arange(0, _num_frames+1, _num_frames/_chunk_size).astype(int)
+                _boundaries = list(zip(_indices[:-1], _indices[1:]))
+            # stacks are read on a background thread while the previous stack is denoised
+            img_list = PrefetchReader(_images, boundaries=_boundaries, prefetch=1)
 
-            mapped_output = cls.create_memmap_binary(_images, opt.output_path)
+            mapped_output = cls.create_memmap_binary(_images, opt.output_path, storage=getattr(opt, "storage", "binary"))
             return img_list, mapped_output
 
     @staticmethod
@@ -333,6 +336,9 @@ class DenoisingAnalysis:
         _batch_size = "".join(["--batch_size2=", str(kwargs.get("batch_size", 1))])
         parsed_inputs.append(_batch_size)
 
+        _storage = "".join(["--storage=", kwargs.get("storage", "binary")])
+        parsed_inputs.append(_storage)
+
         return parsed_inputs
 
     @staticmethod
@@ -370,6 +376,7 @@ class DenoisingAnalysis:
         parser.add_argument('--verbose', type=bool, default=True, help="Verbosity boolean")
         parser.add_argument('--output_path', type=str, default="D:\\", help="output_path")
         parser.add_argument('--batch_size2', type=int, default=1, help="batch_size real")
+        parser.add_argument('--storage', type=str, default="binary", help="output storage (binary or chunked)")
 
         return parser
 
@@ -405,18 +412,21 @@ class DenoisingAnalysis:
             return False
 
     @staticmethod
-    def create_memmap_binary(Image, Path):
-        _meta_file = "".join([Path, "\\video_meta.txt"])
-
-        try:
-            with open(_meta_file, 'w') as f:
-                f.writelines([str(Image.shape[0]), ",", str(Image.shape[1]), ",",
-                              str(Image.shape[2]), ",", str(np.uint16)])
-        except FileNotFoundError:
-            _meta_path = _meta_file.replace("\\video_meta.txt", "")
-            os.makedirs(_meta_path)
-            with open(_meta_file, 'w') as f:
-                f.writelines([str(Image.shape[0]), ",", str(Image.shape[1]), ",",
-                              str(Image.shape[2]), ",", str(Image.dtype)])
+    def create_memmap_binary(Image, Path, **kwargs):
+        """
+        Creates the output video for the denoised images
+
+        :param Image: images to be denoised [Z x Y x X]
+        :param Path: output directory
+        :type Path: str
+        :keyword storage: "binary" (binary_video & video_meta.txt) or "chunked" (compressed chunked_video)
+        :keyword chunks: chunk shape (time, y, x) of a chunked video
+        :keyword codec: compression codec of a chunked video
+        :return: numpy.memmap or ChunkedVideo [Z x Y x X]
+        """
+        if kwargs.get("storage", "binary") == "chunked":
+            return ChunkedVideo("".join([Path, "\\chunked_video"]), "w", Image.shape, np.uint16,
+                                **{_key: _value for _key, _value in kwargs.items() if _key in ("chunks", "codec")})
 
+        save_binary_meta(Image.shape, np.uint16, Path)
         return np.memmap("".join([Path, "\\binary_video"]), dtype="uint16", mode="w+", shape=Image.shape)
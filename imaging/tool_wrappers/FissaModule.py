@@ -7,7 +7,10 @@ import pickle as pkl
 import fissa
 import pathlib
 from typing import Tuple, List
-from imaging.io import load_raw_binary
+from tqdm import tqdm
+from imaging.io import load_mapped_binary, FrameChunk, save_trace_store, TraceStore, in_memory
+from imaging.rois import ROITable, MaskMatrix, as_roi_table, neuropil_masks, roi_edge
+from imaging.separation import separate_rois_parallel
 
 
 # /// /// Main Module /// ///
@@ -17,12 +20,18 @@ class FissaAnalysis:
     ------------
     A module for Fissa Signal Extraction & Source-Separation
 
+    The Suite2P stats (self.stat) are loaded as an imaging.rois.ROITable rather than the array of stat dictionaries:
+    self.stat[roi] still returns the stat dictionary of an ROI, and self.stat.to_suite2p() returns the array of stat
+    dictionaries for functions that expect it (e.g., imaging.colorizer.colorize_rois).
+
     Self Methods
     ------------
     | **loadDataFolder** : Load a Suite2P folder (single-plane only) into Class
     |
     | **loadSuite2P_ROIs** : Loads Suite2P ROI Masks into Class
     |
+    | **loadNeuropilMasks** : Generates the Neuropil Masks of the ROIs
+    |
     | **loadNeuronalIndex** : Loads Neuronal Index into Class
     |
     | **deriveNeuronalIndex** : Derives Neuronal Index from Class
@@ -31,6 +40,8 @@ class FissaAnalysis:
     |
     | **loadFissaSep** : Load saved separation data into class
     |
+    | **denseROIs** : Boolean masks of the ROIs across the field of view
+    |
     | **initializeFissa** : Initialize Fissa
     |
     | **passPrepToFissa** : Passes Preparation Data to Use in Separation Process
@@ -49,6 +60,8 @@ class FissaAnalysis:
     |
     | **extractTraces**
     |
+    | **prepareTraces** : Extracts the traces of the ROIs & neuropil regions into the preparation
+    |
     | **separateTraces**
     |
     | **passExperimentToPrep**
@@ -78,6 +91,7 @@ class FissaAnalysis:
         self.stat = None
         self.iscell = None
         self.s2p_rois = None
+        self.s2p_neuropils = None
         self.output_folder = _output_folder
         self.sep_file = None
         self.prep_file = None
@@ -136,8 +150,8 @@ class FissaAnalysis:
             self.images = _video_folder + '\\suite2p\\plane0\\reg_tif'
             # Images stored here
         else:
-            print("\nLoading and Splitting Images\n")
-            self.images = self.split_binary_images(load_raw_binary("", "", _video_folder))
+            print("\nMapping and Splitting Images\n")
+            self.images = self.split_binary_images(load_mapped_binary("", "", _video_folder))
 
         try:
             self.ops = np.load((_data_folder + '\\suite2p\\plane0\\ops.npy'),
@@ -159,15 +173,12 @@ class FissaAnalysis:
         # Derive frame_rate if and only if it was not specified
 
         try:
-            self.stat = np.load((_data_folder + '\\suite2p\\plane0\\stat.npy'),
-                                allow_pickle=True)
-            if type(self.stat) is not np.ndarray:
-                raise TypeError
-        except TypeError:
+            self.stat = ROITable.from_suite2p_folder(_data_folder + '\\suite2p\\plane0')
+        except (TypeError, KeyError, ValueError):
             print("Suite2P Stats file in unexpected format")
-        except RuntimeError:
+        except (RuntimeError, FileNotFoundError):
             print("Could not locate Suite2P stats file")
-        # Suite2P stats stored here & loaded
+        # Suite2P stats stored here & loaded (as a table of the ROIs, see imaging.rois.ROITable)
 
         try:
             self.iscell = np.load((_data_folder + '\\suite2p\\plane0\\iscell.npy'),
@@ -220,27 +231,51 @@ class FissaAnalysis:
         **Modifies**
             | self.s2p_rois
 
+        ROI masks are cropped to their bounding boxes (see imaging.rois.CroppedMask), so their memory scales with the
+        area of the ROIs rather than the field of view.
+
         :rtype: None
         """
-        # Get image size
-        Lx = self.ops["Lx"]
-        Ly = self.ops["Ly"]
-
         # Get the cell ids
-        ncells = len(self.stat)
-        cell_ids = np.arange(ncells)  # assign each cell an ID, starting from 0.
-        cell_ids = cell_ids[self.iscell[:, 0] == 1]  # only take the ROIs that are actually cells.
-        num_rois = len(cell_ids)
+        cell_ids = np.flatnonzero(self.iscell[:, 0] == 1)  # only take the ROIs that are actually cells.
+
+        # Generate cropped ROI masks (excluding pixels overlapping with other ROIs)
+        self.s2p_rois = as_roi_table(self.stat).select(cell_ids).cropped_masks()
+
+    def loadNeuropilMasks(self, **kwargs) -> Self:
+        """
+        Generates the Neuropil Masks of the ROIs
+
+        The neuropil of each ROI is grown & split within a window surrounding the ROI, identically to
+        fissa.roitools.getmasks_npil
+
+        **Requires**
+            | self.ops
+            | self.s2p_rois
+
+        **Modifies**
+            | self.s2p_neuropils
+
+        :keyword regions: number of neuropil regions (int, default 4)
+        :keyword expansion: area of each neuropil region relative to the area of the ROI (float, default 1)
+        :rtype: None
+        """
+        _shape = (self.ops["Ly"], self.ops["Lx"])
+        _regions = kwargs.get("regions", 4)
+        _expansion = kwargs.get("expansion", 1)
+        self.s2p_neuropils = [neuropil_masks(_roi, _shape, _regions, _expansion) for _roi in self.s2p_rois]
+
+    def denseROIs(self) -> List[np.ndarray]:
+        """
+        Boolean masks of the ROIs across the field of view, as required by fissa's extraction of tiff folders
 
-        # Generate ROI masks in a format usable by FISSA (in this case, a list of masks)
-        rois = [np.zeros((Ly, Lx), dtype=bool) for _ in range(num_rois)]
+        **Requires**
+            | self.ops
+            | self.s2p_rois
 
-        for i, n in enumerate(cell_ids):
-            # Variable i is the position in cell_ids, and n is the actual cell number
-            ypix = self.stat[n]["ypix"][~self.stat[n]["overlap"]]
-            xpix = self.stat[n]["xpix"][~self.stat[n]["overlap"]]
-            rois[i][ypix, xpix] = 1
-        self.s2p_rois = rois
+        :rtype: list[Any]
+        """
+        return [_roi.dense((self.ops["Ly"], self.ops["Lx"])) for _roi in self.s2p_rois]
 
     def loadNeuronalIndex(self) -> Self:
         """
@@ -337,14 +372,19 @@ class FissaAnalysis:
 
         **Requires**
             | self.images
+            | self.ops
             | self.s2p_rois
 
         **Modifies**
             | self.experiment
 
+        Dense masks are only built for tiff folders, which are extracted by fissa. Array trials are extracted from the
+        cropped masks (see prepareTraces), so the experiment keeps the cropped masks instead.
+
         :rtype: None
         """
-        self.experiment = fissa.Experiment(self.images, [self.s2p_rois[:len(self.s2p_rois)]])
+        _rois = self.denseROIs() if isinstance(self.images, str) else list(self.s2p_rois)
+        self.experiment = fissa.Experiment(self.images, [_rois])
         # noinspection PyProtectedMember
         self.experiment._adopt_default_parameters(only_preparation=False, force=False)
         print("Initialized Fissa")
@@ -411,6 +451,9 @@ class FissaAnalysis:
         """
         Saves Processed Traces
 
+        Each field is saved as a contiguous array (processed_traces_field.npy) described by processed_traces.json, see
+        imaging.io.save_trace_store
+
         **Requires**
             self.ProcessedTraces
             self.output_folder
@@ -418,16 +461,19 @@ class FissaAnalysis:
         :rtype:
         """
         print("Saving Processed Traces...")
-        _output_file = self.output_folder + "\\ProcessedTraces"
-        _output_pickle = open(_output_file, 'wb')
-        pkl.dump(self.ProcessedTraces, _output_pickle)
-        _output_pickle.close()
+        # fields loaded from the store are memory-mapped from the files being replaced, the maps are closed first
+        for _field, _value in vars(self.ProcessedTraces).items():
+            setattr(self.ProcessedTraces, _field, in_memory(_value))
+        save_trace_store(self.ProcessedTraces.__dict__, self.output_folder + "\\processed_traces")
         print("Finished Saving Processed Traces.")
 
     def loadProcessedTraces(self) -> Self:
         """
         Loads Processed Traces
 
+        Fields are memory-mapped (see imaging.io.TraceStore). Processed traces saved as a pickle (ProcessedTraces) by
+        previous versions are still loaded.
+
         **Requires**
             | self.output_folder
             | self.ProcessedTraces
@@ -438,10 +484,16 @@ class FissaAnalysis:
         :rtype: None
         """
         print("Loading Processed Traces...")
-        _input_file = self.output_folder + "\\ProcessedTraces"
-        _input = open(_input_file, 'rb')
-        self.ProcessedTraces = pkl.load(_input)
-        _input.close()
+        _store = self.output_folder + "\\processed_traces"
+        if TraceStore.exists(_store):
+            self.ProcessedTraces = ProcessedTracesDictionary()
+            for _field, _value in TraceStore(_store).items():
+                setattr(self.ProcessedTraces, _field, _value)
+        else:
+            _input_file = self.output_folder + "\\ProcessedTraces"
+            _input = open(_input_file, 'rb')
+            self.ProcessedTraces = pkl.load(_input)
+            _input.close()
         print("Finished Loading Processed Traces.")
 
     def saveAll(self) -> Self:
@@ -461,23 +513,109 @@ class FissaAnalysis:
         self.saveProcessedTraces()
 
     def extractTraces(self) -> Self:
-        self.experiment.separation_prep()
-        print("Passing traces between modules.")
-        self.passExperimentToPrep()
+        if isinstance(self.images, str):
+            # tiff folders are extracted by fissa
+            self.experiment.separation_prep()
+            print("Passing traces between modules.")
+            self.passExperimentToPrep()
+        else:
+            self.prepareTraces()
         self.preserveOriginalExtractions()
         print("Finished module-passing.")
         print("Ready for post-processing or source-separation.")
 
-    def separateTraces(self) -> Self:
+    def separateTraces(self, **kwargs) -> Self:
+        """
+        Separates the prepared traces of each ROI with fissa (see imaging.separation.separate_rois_parallel)
+
+        **Requires**
+            | self.preparation
+            | self.experiment
+
+        **Modifies**
+            | self.experiment
+
+        :keyword workers: number of worker processes (int, default os.cpu_count())
+        :keyword batch_size: number of ROIs per work unit (int, default 8)
+        :keyword checkpoint_folder: folder of the checkpoints of finished ROIs (str, default
+            output_folder\\separation_checkpoint)
+        :rtype: None
+        """
         print('Passing prepared traces to fissa.')
         self.passPrepToFissa()
         print('Initiating fissa source-separation')
-        self.experiment.separate()
+        _checkpoint_folder = kwargs.get("checkpoint_folder", None if self.output_folder is None
+                                        else self.output_folder + "\\separation_checkpoint")
+        self.experiment.sep, self.experiment.result, self.experiment.mixmat, self.experiment.info = \
+            separate_rois_parallel(self.experiment.raw, fissa.core.separate_trials,
+                                   workers=kwargs.get("workers", os.cpu_count()),
+                                   batch_size=kwargs.get("batch_size", 8), checkpoint_folder=_checkpoint_folder,
+                                   alpha=self.experiment.alpha, max_iter=self.experiment.max_iter,
+                                   tol=self.experiment.tol, max_tries=self.experiment.max_tries,
+                                   method=self.experiment.method)
         print("Passing traces between modules.")
         self.preserveOriginalSourceSeparations()
         print("Finished module-passing.")
         print("Ready for further analysis.")
 
+    def prepareTraces(self, **kwargs) -> Self:
+        """
+        Extracts the traces of the ROIs & neuropil regions into the preparation
+
+        Replaces fissa's preparation: the ROI & neuropil masks of all ROIs form one sparse matrix (see
+        imaging.rois.MaskMatrix), so each chunk of frames of each trial is extracted by a single matrix product.
+        The preparation has the layout of fissa.Experiment (raw[roi, trial] = regions x frames,
+        roi_polys[roi, trial][region] = contours, means[trial] = mean image).
+
+        **Requires**
+            | self.images
+            | self.ops
+            | self.s2p_rois
+            | self.experiment
+
+        **Modifies**
+            | self.s2p_neuropils
+            | self.preparation
+            | self.experiment
+
+        :keyword regions: number of neuropil regions (int, default as experiment or 4)
+        :keyword expansion: area of each neuropil region relative to the area of the ROI (float, default as
+            experiment or 1)
+        :keyword chunk_size: number of frames extracted at once (int, default 1000)
+        :rtype: None
+        """
+        _regions = kwargs.get("regions", getattr(self.experiment, "nRegions", None) or 4)
+        _expansion = kwargs.get("expansion", getattr(self.experiment, "expansion", None) or 1)
+        _chunk_size = kwargs.get("chunk_size", 1000)
+        _shape = (self.ops["Ly"], self.ops["Lx"])
+
+        if self.s2p_neuropils is None or len(self.s2p_neuropils) != len(self.s2p_rois) or \
+                any(len(_neuropil) != _regions for _neuropil in self.s2p_neuropils):
+            self.loadNeuropilMasks(regions=_regions, expansion=_expansion)
+        _masks = [[_roi, *_neuropil] for _roi, _neuropil in zip(self.s2p_rois, self.s2p_neuropils)]
+        _matrix = MaskMatrix([_mask for _roi_masks in _masks for _mask in _roi_masks], _shape)
+        _polys = [[roi_edge(_mask) for _mask in _roi_masks] for _roi_masks in _masks]
+
+        _trials = self.images if isinstance(self.images, (list, tuple)) else [self.images]
+        _raw = np.empty((len(_masks), len(_trials)), dtype=object)
+        _roi_polys = np.empty_like(_raw)
+        _means = []
+        for _trial, _images in enumerate(tqdm(_trials, total=len(_trials), desc="Extracting Traces", disable=False)):
+            _traces, _mean = _matrix.extract(_images, chunk_size=_chunk_size)
+            _traces = _traces.reshape(len(_masks), _regions + 1, -1)
+            _means.append(_mean)
+            for _roi in range(len(_masks)):
+                _raw[_roi][_trial] = _traces[_roi]
+                _roi_polys[_roi][_trial] = _polys[_roi]
+
+        self.preparation.raw = _raw
+        self.preparation.roi_polys = _roi_polys
+        self.preparation.expansion = _expansion
+        self.preparation.nRegions = _regions
+        self.preparation.means = _means
+        # the experiment holds the preparation for saving (saveFissaPrep) & separation
+        self.passPrepToFissa()
+
     def passExperimentToPrep(self) -> Self:
         self.preparation.raw = self.experiment.raw
         self.preparation.roi_polys = self.experiment.roi_polys
@@ -494,14 +632,19 @@ class FissaAnalysis:
     def pruneNonNeuronalROIs(self) -> Self:
         self.stat = self.stat[self.neuronal_index]
         self.s2p_rois = [self.s2p_rois[i] for i in self.neuronal_index]
+        if self.s2p_neuropils is not None:
+            self.s2p_neuropils = [self.s2p_neuropils[i] for i in self.neuronal_index]
         self.iscell = self.iscell[self.neuronal_index, :]
 
     @staticmethod
-    def split_binary_images(Images: np.ndarray) -> List[np.ndarray]:
+    def split_binary_images(Images: np.ndarray) -> List[FrameChunk]:
         """
         This Function splits binary image into stacks for multiprocessing
 
-        :param Images: Binary Images in numpy array [Z x Y x X]
+        The stacks are lazily evaluated views of the images (see imaging.io.FrameChunk), so frames are only read
+        from the memory-mapped binary when a stack is extracted.
+
+        :param Images: Binary Images in numpy array or memory-mapped [Z x Y x X]
         :type Images: Any
         :return: List of Binary Videos
         :rtype: list
@@ -525,13 +668,14 @@ class FissaAnalysis:
                 if ImageLength % chunk_size == 0 and ImageLength / chunk_size <= SizeLimit:
                     return chunk_size
                 chunk_size += 1
+            # no evenly sized stacks within the limit
+            return max(int(np.ceil(ImageLength / SizeLimit)), 1)
 
+        # number of frames from the binary header (or meta file) of the memory-mapped images
         _num_frames = Images.shape[0]
         _chunk_size = determine_split_size(_num_frames, 8000)
-        _idx = np.arange(0, _num_frames+1, _num_frames/_chunk_size)
-        img_list = []
-        for i in range(_idx.shape[0] - 1):
-            img_list.append(Images[_idx[i].astype(int):_idx[i + 1].astype(int), :, :])
+        _idx = np.linspace(0, _num_frames, _chunk_size + 1).astype(int)
+        img_list = [FrameChunk(Images, _start, _stop) for _start, _stop in zip(_idx[:-1], _idx[1:])]
         return img_list
 
 
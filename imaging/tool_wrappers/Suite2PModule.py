@@ -7,8 +7,12 @@ from suite2p import gui
 from natsort import natsorted
 import os
 import glob
-from imaging.io import load_raw_binary, save_raw_binary
-from typing import Tuple, List, Union, Optional
+import json
+from tqdm.auto import tqdm
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from imaging.io import load_mapped_binary, save_raw_binary, save_binary_meta, read_frames
+from imaging.rois import ROITable
+from typing import Any, Tuple, List, Union, Optional, Sequence
 from datetime import date, datetime
 
 
@@ -27,6 +31,9 @@ class Suite2PAnalysis:
         | *file_type* :  video file type (str [tiff or binary], default "tiff")
         | *ops* : Suite2P ops (dict, default None)
 
+    **Properties**
+        | *reg_video* : registered video read by detection & extraction when converted on the fly (ConvertedBinary,
+            ops["reg_file"] is unset)
 
     """
     def __init__(self, ImageDirectory: str, OutputDirectory: str, **kwargs: Union[dict, str, Tuple[int]]):
@@ -67,6 +74,7 @@ class Suite2PAnalysis:
         self.F = None
         self.Fneu = None
         self.spks = None
+        self.reg_video = None
 
         # Protected
         self.__instance_date = get_date()
@@ -118,6 +126,10 @@ class Suite2PAnalysis:
     def stat_file_path(self) -> str:
         return "".join([self.ops.get('save_path'), "\\stat.npy"])
 
+    @property
+    def roi_table_path(self) -> str:
+        return "".join([self.ops.get('save_path'), "\\", ROITable.table_filename])
+
     @property
     def ops_file_path(self) -> str:
         return "".join([self.ops.get("save_path"), "\\ops.npy"])
@@ -188,6 +200,19 @@ class Suite2PAnalysis:
         self.save_stats()
         self.save_ops()
         self.save_cells()
+        self.save_roi_table()
+
+    def save_roi_table(self) -> None:
+        """
+        Saves the stat & iscell files as a table of the ROIs (see imaging.rois.ROITable)
+
+        :return: None
+        :rtype: None
+        """
+        if isinstance(self.stat, ROITable):
+            self.stat.save(self.roi_table_path)
+        else:
+            ROITable.from_suite2p(self.stat, self.iscell).save(self.roi_table_path)
 
     def openGUI(self) -> None:
         """
@@ -210,27 +235,40 @@ class Suite2PAnalysis:
         self.ops['neuropil_extract'] = False
         self.ops.update(suite2p.run_s2p(self.ops, self.db))
 
-    def motionCorrect(self) -> Self:
+    def motionCorrect(self, **kwargs: int) -> Self:
         """
         Function simply runs suite2p motion correction
         Note that it assumes you have already converted video to binary
 
+        The reference image is computed once and the batches of the binary are registered against it by a pool of
+        processes (see register_binary_parallel), the result is identical to suite2p.registration_wrapper
+
+        :keyword workers: number of worker processes, 1 runs suite2p.registration_wrapper (int, default os.cpu_count())
         :return: None
         :rtype: None
         """
+        _workers = kwargs.get("workers", os.cpu_count())
         # Ingest ops (parameters)
         self.ops = {**self.ops, **self.db}
         # Set Registered Data Filename
         self.ops["reg_file"] = "".join([self.ops.get("save_path0"), "\\suite2p\\plane0\\registered_data.bin"])
-        # Read in raw tif corresponding to our example tif
-        f_raw = suite2p.io.BinaryRWFile(Ly=self.ops.get("Ly"), Lx=self.ops.get("Lx"), filename=self.ops.get("raw_file"))
-        f_reg = suite2p.io.BinaryRWFile(Ly=self.ops.get("Ly"), Lx=self.ops.get("Lx"), filename=self.ops.get("reg_file"))
-
-        refImg, rmin, rmax, meanImg, rigid_offsets, \
-        nonrigid_offsets, zest, meanImg_chan2, badframes, \
-        yrange, xrange = suite2p.registration_wrapper(f_reg, f_raw=f_raw, f_reg_chan2=None,
-                                                      f_raw_chan2=None, refImg=None,
-                                                      align_by_chan2=False, ops=self.ops)
+
+        if _workers > 1:
+            refImg, rmin, rmax, meanImg, rigid_offsets, \
+            nonrigid_offsets, zest, meanImg_chan2, badframes, \
+            yrange, xrange = register_binary_parallel(self.ops, workers=_workers)
+        else:
+            # Read in raw tif corresponding to our example tif
+            f_raw = suite2p.io.BinaryRWFile(Ly=self.ops.get("Ly"), Lx=self.ops.get("Lx"),
+                                            filename=self.ops.get("raw_file"))
+            f_reg = suite2p.io.BinaryRWFile(Ly=self.ops.get("Ly"), Lx=self.ops.get("Lx"),
+                                            filename=self.ops.get("reg_file"))
+
+            refImg, rmin, rmax, meanImg, rigid_offsets, \
+            nonrigid_offsets, zest, meanImg_chan2, badframes, \
+            yrange, xrange = suite2p.registration_wrapper(f_reg, f_raw=f_raw, f_reg_chan2=None,
+                                                          f_raw_chan2=None, refImg=None,
+                                                          align_by_chan2=False, ops=self.ops)
         self.ops = {**self.ops,
                         **{
                             "refImg": refImg,
@@ -247,13 +285,20 @@ class Suite2PAnalysis:
                         }
                     }
 
-    def roiDetection(self) -> Self:
+    def roiDetection(self, **kwargs: bool) -> Self:
         """
         Runs Suite2P ROI Detection
 
+        Binaries that are not int16 are converted once into a cached converted binary (see convert_binary_file),
+        or on the fly while they are read by detection & extraction (see ConvertedBinary). A binary converted on the
+        fly is not a registered binary of suite2p (int16) on disk, so ops["reg_file"] is unset: functions reading
+        the registered binary (exportCroppedCorrection, the suite2p GUI) require the converted binary.
+
+        :keyword on_the_fly: convert while reading instead of writing a converted binary (bool, default False)
         :return: None
         :rtype: None
         """
+        _on_the_fly = kwargs.get("on_the_fly", False)
         self.ops = {**self.ops, **self.db}
 
         try:
@@ -263,28 +308,32 @@ class Suite2PAnalysis:
             self.ops["reg_file"] = "".join([self.ops.get("data_path"), "\\binary_video"])
         # This was not elegant, but it does work
 
+        self.reg_video = None
         try:
             _video_meta = self.load_binary_meta("".join([self.ops.get("data_path"), "\\video_meta.txt"]))
             if _video_meta[-1] != "int16":
-                _binary_video = load_raw_binary("", "", self.ops.get("data_path"))
-                _binary_video = self.convert_binary(_binary_video)
-                _new_data_path = "".join([self.ops.get("data_path"), "\\converted"])
-                self.ops["data_path"] = _new_data_path
-                self.db["data_path"] = _new_data_path
-                self.ops["reg_file"] = "".join([self.ops.get("data_path"), "\\binary_video"])
-                # Db overwrites, this to prevent using converted some places and not others
-                os.makedirs(_new_data_path, exist_ok=True)
-                save_raw_binary(_binary_video, _new_data_path)
-                del _binary_video
+                if _on_the_fly:
+                    self.reg_video = ConvertedBinary(load_mapped_binary("", "", self.ops.get("data_path")))
+                    # the binary on disk is not int16, it must not be read as the registered binary
+                    self.ops["reg_file"] = None
+                    print("Converting binary on the fly, ops reg_file is unset")
+                else:
+                    _new_data_path = self.convert_binary_file(self.ops.get("data_path"))
+                    self.ops["data_path"] = _new_data_path
+                    self.db["data_path"] = _new_data_path
+                    self.ops["reg_file"] = "".join([self.ops.get("data_path"), "\\binary_video"])
+                    # Db overwrites, this to prevent using converted some places and not others
                 del _video_meta
-                # collect garbage
 
         except FileNotFoundError:
             print("Could not find meta file. Proceeding anyway...")
         # This was not elegant, but it does work
 
-        f_reg = suite2p.io.BinaryRWFile(Ly=self.ops.get("Ly"), Lx=self.ops.get("Lx"),
-                                        filename=self.ops.get("reg_file"))
+        if self.reg_video is not None:
+            f_reg = self.reg_video
+        else:
+            f_reg = suite2p.io.BinaryRWFile(Ly=self.ops.get("Ly"), Lx=self.ops.get("Lx"),
+                                            filename=self.ops.get("reg_file"))
 
         self.ops, self.stat = suite2p.detection_wrapper(f_reg=f_reg, ops=self.ops,
                                                         classfile=suite2p.classification.builtin_classfile)
@@ -299,7 +348,9 @@ class Suite2PAnalysis:
         """
 
 
-        if len(args) == 0:
+        if len(args) == 0 and self.reg_video is not None:
+            f_reg = self.reg_video
+        elif len(args) == 0:
             f_reg = suite2p.io.BinaryRWFile(Ly=self.ops.get("Ly"), Lx=self.ops.get("Lx"),
                                             filename=self.ops.get("reg_file"))
         else:
@@ -343,49 +394,146 @@ class Suite2PAnalysis:
                                              fs=self.ops['fs'])
         np.save("".join([self.ops.get("save_path"), "\\spks.npy"]), self.spks, allow_pickle=True)
 
-    def integrateMotionCorrectionDenoising(self) -> Self:
+    def integrateMotionCorrectionDenoising(self, **kwargs: int) -> Self:
         """
         Computes reference and mean images, adds x & y ranges using denoised image
         without motion correcting
 
+        The binary is memory-mapped: the reference is computed from strided samples and the mean is accumulated
+        over batches read by a pool of threads, so memory is bounded by the batch size. The reference & mean
+        images are cached alongside the binary (see reference_stats_path) and reused while the binary and the
+        relevant ops are unchanged.
+
+        :keyword workers: number of threads reading batches (int, default os.cpu_count())
         :rtype: Any
         """
-        _images = load_raw_binary("", "", self.ops.get("data_path"))
+        _workers = kwargs.get("workers", os.cpu_count())
+        _images = load_mapped_binary("", "", self.ops.get("data_path"))
         # shape
         _num_frames, self.ops["yrange"], self.ops["xrange"] = _images.shape
         self.ops["yrange"] = [0, self.ops.get("yrange")]
         self.ops["xrange"] = [0, self.ops.get("xrange")]
-        # references
-        _frames = _images[
-            np.linspace(0, _num_frames, 1 + np.minimum(self.ops['nimg_init'], _num_frames), dtype=int)[:-1]]
-        self.ops["refImgO"] = suite2p.registration.register.compute_reference(_frames, self.ops)
+
+        _key = self.reference_stats_key(_images, self.ops)
+        _stats = self.load_reference_stats(self.reference_stats_path, _key)
+        if _stats is None:
+            # references
+            _samples = np.linspace(0, _num_frames, 1 + np.minimum(self.ops['nimg_init'], _num_frames), dtype=int)[:-1]
+            _frames = read_frames(_images, _samples)
+            _ref_img = suite2p.registration.register.compute_reference(_frames, self.ops)
+            del _frames
+            # mean
+            _mean_img = np.zeros((self.ops.get("yrange")[-1], self.ops.get("xrange")[-1]), dtype='float32')
+            _batch_size = self.ops.get("batch_size")
+
+            def mean_of_batch(Start: int) -> np.ndarray:
+                return np.asarray(_images[Start: min(Start + _batch_size, _num_frames)]).astype('float32')\
+                           .sum(axis=0) / _num_frames
+
+            # batches are summed in order, as the serial accumulation
+            with ThreadPoolExecutor(max_workers=_workers) as _executor:
+                for _batch_mean in _executor.map(mean_of_batch, np.arange(0, _num_frames, _batch_size)):
+                    _mean_img += _batch_mean
+            _stats = {"refImgO": _ref_img, "meanImg": _mean_img}
+            self.save_reference_stats(self.reference_stats_path, _key, _stats)
+
+        self.ops["refImgO"] = _stats.get("refImgO")
         self.ops["refImg"], self.ops["rmin"], self.ops["rmax"] = \
             suite2p.registration.register.normalize_reference_image(self.ops.get("refImgO"))
-        # mean
-        _mean_img = np.zeros((self.ops.get("yrange")[-1], self.ops.get("xrange")[-1]), dtype='float32')
-        _batch_size = self.ops.get("batch_size")
-        for k in np.arange(0, _num_frames, _batch_size):
-            frames = _images[k: min(k + _batch_size, _num_frames)].astype('float32')
-            _mean_img += frames.sum(axis=0) / _num_frames
-        self.ops["meanImg"] = _mean_img
+        self.ops["meanImg"] = _stats.get("meanImg")
         # Enhanced Mean
         self.ops = suite2p.registration.register.enhanced_mean_image(self.ops)
 
+    @property
+    def reference_stats_path(self) -> str:
+        return "".join([self.ops.get("data_path"), "\\reference_stats.npz"])
+
+    @staticmethod
+    def reference_stats_key(Images: Union[np.memmap, Any], Ops: dict) -> str:
+        """
+        Identifies the binary & the ops used to compute the reference & mean images
+
+        :param Images: memory-mapped binary video
+        :type Images: Any
+        :param Ops: Suite2P "ops"
+        :type Ops: dict
+        :return: key
+        :rtype: str
+        """
+        _stat = os.stat(Images.filename)
+        return json.dumps({
+            "shape": [int(_dim) for _dim in Images.shape],
+            "size": _stat.st_size,
+            "modified": _stat.st_mtime_ns,
+            **{_key: Ops.get(_key) for _key in ("nimg_init", "batch_size", "smooth_sigma", "smooth_sigma_time",
+                                                "maxregshift", "1Preg", "pre_smooth", "spatial_hp_reg",
+                                                "spatial_taper")}
+        }, sort_keys=True, default=str)
+
+    @staticmethod
+    def load_reference_stats(Filename: str, Key: str) -> Optional[dict]:
+        """
+        Loads cached reference & mean images
+
+        :param Filename: cache file
+        :type Filename: str
+        :param Key: key of the binary & ops (see reference_stats_key)
+        :type Key: str
+        :return: refImgO & meanImg, None if not cached or stale
+        :rtype: Optional[dict]
+        """
+        if not os.path.isfile(Filename):
+            return None
+        with np.load(Filename, allow_pickle=False) as _cache:
+            if str(_cache["key"]) != Key:
+                return None
+            return {"refImgO": _cache["refImgO"], "meanImg": _cache["meanImg"]}
+
+    @staticmethod
+    def save_reference_stats(Filename: str, Key: str, Stats: dict) -> None:
+        """
+        Caches reference & mean images
+
+        :param Filename: cache file
+        :type Filename: str
+        :param Key: key of the binary & ops (see reference_stats_key)
+        :type Key: str
+        :param Stats: refImgO & meanImg
+        :type Stats: dict
+        :rtype: None
+        """
+        with open(Filename, "wb") as _file:
+            np.savez(_file, key=np.array(Key), **Stats)
+
     @classmethod
-    def exportCroppedCorrection(cls, Ops: dict) -> sys.stdout:
+    def exportCroppedCorrection(cls, Ops: dict, **kwargs: int) -> sys.stdout:
         """
         Export Binary Filename Cropped According to Motion Correction
 
+        The registered binary is memory-mapped and cropped in chunks of frames into a preallocated binary video
+        (with its meta file) in Ops["save_path"]
+
         :param Ops: Suite2P "ops"
         :type Ops: dict
+        :keyword chunk_size: number of frames cropped at once (int, default 1000)
         :return: None
         """
+        _chunk_size = kwargs.get("chunk_size", 1000)
         _xrange = Ops.get("xrange")
         _yrange = Ops.get("yrange")
-        _images = cls.load_suite2p_binary(Ops.get("reg_file"))
-        _images = np.reshape(_images, (-1, Ops.get("Ly"), Ops.get("Lx")))
-        _images = _images[:, _yrange[0]:_yrange[-1], _xrange[0]:_xrange[-1]]
-        save_raw_binary(_images, Ops.get("save_path"))
+        _y_pixels, _x_pixels = Ops.get("Ly"), Ops.get("Lx")
+        _num_frames = os.path.getsize(Ops.get("reg_file")) // (_y_pixels * _x_pixels * np.dtype(np.int16).itemsize)
+        _images = np.memmap(Ops.get("reg_file"), dtype=np.int16, mode="r", shape=(_num_frames, _y_pixels, _x_pixels))
+        _shape = (_num_frames, _yrange[-1] - _yrange[0], _xrange[-1] - _xrange[0])
+
+        save_binary_meta(_shape, np.int16, Ops.get("save_path"))
+        _cropped_images = np.memmap("".join([Ops.get("save_path"), "\\binary_video"]), dtype=np.int16, mode="w+",
+                                    shape=_shape)
+        for _start in range(0, _num_frames, _chunk_size):
+            _cropped_images[_start:_start + _chunk_size] = \
+                _images[_start:_start + _chunk_size, _yrange[0]:_yrange[-1], _xrange[0]:_xrange[-1]]
+        _cropped_images.flush()
+        del _cropped_images, _images
         return print("Exported Cropped Motion-Corrected Images")
 
     # noinspection PyMethodMayBeStatic,PyUnusedLocal
@@ -393,24 +541,26 @@ class Suite2PAnalysis:
         return print("Not Yet Implemented")
 
     @staticmethod
-    def remove_small_neurons(Cells: np.ndarray, Stats: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    def remove_small_neurons(Cells: np.ndarray, Stats: Union[np.ndarray, ROITable]) -> Tuple[np.ndarray, np.ndarray]:
         """
         Remove small diameter neurons
 
         :param Cells: Suite2P "iscell"
         :type Cells: Any
-        :param Stats: Suite2P "stat"
+        :param Stats: Suite2P "stat" or ROITable
         :type Stats: Any
         :return: modified cells, stats
         :rtype: Any
         """
-        _num_rois = Stats.shape[0]
         diameters = Suite2PAnalysis.find_diameters(Stats)
-
-        _rem_idx = np.where(diameters < 10)[0]
-        Cells[_rem_idx, 0] = 0
-        for _roi in range(_num_rois):
-            Stats[_roi]['diameter'] = diameters[_roi]
+        Cells[diameters < 10, 0] = 0
+        if isinstance(Stats, ROITable):
+            # diameters of a table are derived from the radius column
+            if Stats.iscell is not None:
+                Stats.iscell[:, 0] = Cells[:, 0]
+        else:
+            for _roi, _diameter in enumerate(diameters):
+                Stats[_roi]['diameter'] = _diameter
         return Cells, Stats
 
     @staticmethod
@@ -437,20 +587,18 @@ class Suite2PAnalysis:
         return files, first_tiffs
 
     @staticmethod
-    def find_diameters(Stats: np.ndarray[np.ndarray]) -> np.ndarray:
+    def find_diameters(Stats: Union[np.ndarray, ROITable]) -> np.ndarray:
         """
         Return roi diameters
 
-        :param Stats: Suite2P "stats"
+        :param Stats: Suite2P "stats" or ROITable
         :type Stats: Any
         :return: roi diameters
         :rtype: Any
         """
-        _num_rois = Stats.shape[0]
-        diameters = np.zeros(_num_rois)
-        for _roi in range(_num_rois):
-            diameters[_roi] = Stats[_roi].get('radius') * 2
-        return diameters
+        if isinstance(Stats, ROITable):
+            return Stats.diameters
+        return np.array([_stat.get('radius') * 2 for _stat in Stats], dtype=np.float64)
 
 
     @staticmethod
@@ -515,12 +663,314 @@ class Suite2PAnalysis:
 
         if Images.dtype.type == np.uint16:
             return (Images // 2).astype(np.int16)
-        elif Images.dtype.type == np.int16 or Images.dtype.type == int16:
+        elif Images.dtype.type == np.int16:
             print("No conversion was necessary!!!")
             return Images
         else:
             return Images.astype(np.int16)
 
+    @staticmethod
+    def convert_binary_file(ImageDirectory: str, **kwargs: int) -> str:
+        """
+        Converts the binary video in ImageDirectory to match the form of suite2p binaries (see convert_binary)
+
+        The video is converted in chunks by a pool of threads from a memmap into ImageDirectory\\converted.
+        The size & modification time of the source are recorded (conversion_source.json), so a valid converted
+        binary is reused instead of being converted again.
+
+        :param ImageDirectory: Directory containing the binary video
+        :type ImageDirectory: str
+        :keyword chunk_size: number of frames converted at once (int, default 7000)
+        :keyword workers: number of threads (int, default os.cpu_count())
+        :return: Directory containing the converted binary video
+        :rtype: str
+        """
+        _chunk_size = kwargs.get("chunk_size", 7000)
+        _workers = kwargs.get("workers", os.cpu_count())
+
+        _images = load_mapped_binary("", "", ImageDirectory)
+        _stat = os.stat(_images.filename)
+        _source = {"size": _stat.st_size, "modified": _stat.st_mtime_ns,
+                   "shape": [int(_dim) for _dim in _images.shape], "type": str(np.dtype(_images.dtype))}
+        _output_directory = "".join([ImageDirectory, "\\converted"])
+        _output_file = "".join([_output_directory, "\\binary_video"])
+        _stamp_file = "".join([_output_directory, "\\conversion_source.json"])
+
+        try:
+            with open(_stamp_file, "r") as f:
+                _stamp = json.load(f)
+            if _stamp == _source and \
+                    os.path.getsize(_output_file) == np.prod(_images.shape, dtype=np.int64) * 2:
+                print("Reusing converted binary")
+                return _output_directory
+        except (FileNotFoundError, ValueError):
+            pass
+
+        os.makedirs(_output_directory, exist_ok=True)
+        if os.path.isfile(_stamp_file):
+            os.remove(_stamp_file)
+        _converted = np.memmap(_output_file, dtype=np.int16, mode="w+", shape=_images.shape)
+
+        def convert_chunk(Start: int) -> None:
+            _stop = min(Start + _chunk_size, _images.shape[0])
+            _converted[Start:_stop] = Suite2PAnalysis.convert_binary(np.asarray(_images[Start:_stop]))
+
+        with ThreadPoolExecutor(max_workers=_workers) as _executor:
+            list(tqdm(_executor.map(convert_chunk, range(0, _images.shape[0], _chunk_size)),
+                      total=-(-_images.shape[0] // _chunk_size), desc="Converting Binary...", disable=False))
+        _converted.flush()
+        del _converted
+        save_binary_meta(_images.shape, np.int16, _output_directory)
+
+        # the stamp is written last, an interrupted conversion is never reused
+        with open(_stamp_file, "w") as f:
+            json.dump(_source, f)
+        return _output_directory
+
+
+class ConvertedBinary:
+    """
+    Read-only view of a binary video converted to the form of suite2p binaries on the fly (see
+    Suite2PAnalysis.convert_binary), so suite2p can read it without a converted copy
+
+    Implements the reading interface of suite2p.io.BinaryRWFile (used by suite2p.detection_wrapper &
+    suite2p.extraction_wrapper) with the same indexing: an integer returns a single frame [1 x Y x X].
+
+    **Required Inputs**
+        | *Images* : memory-mapped binary video [Z x Y x X]
+
+    **Properties**
+        | *shape* : Frames, Height, Width of the video
+        | *dtype* : int16
+        | *Ly* : Height of the video
+        | *Lx* : Width of the video
+        | *n_frames* : number of frames
+        | *size* : number of pixels
+        | *data* : all frames
+
+    **Self Methods**
+        | *ix* : frames at specific indices
+        | *sampled_mean* : mean of up to 1000 frames sampled across the video
+        | *close* : does nothing, the video is not opened by the view
+    """
+    def __init__(self, Images: Union[np.memmap, Any]):
+        self.images = Images
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return tuple(self.images.shape)
+
+    @property
+    def dtype(self) -> np.dtype:
+        return np.dtype(np.int16)
+
+    @property
+    def Ly(self) -> int:
+        return self.shape[1]
+
+    @property
+    def Lx(self) -> int:
+        return self.shape[2]
+
+    @property
+    def n_frames(self) -> int:
+        return self.shape[0]
+
+    @property
+    def size(self) -> int:
+        return int(np.prod(np.array(self.shape).astype(np.int64)))
+
+    @property
+    def data(self) -> np.ndarray:
+        return self.ix(np.arange(self.n_frames))
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __enter__(self) -> ConvertedBinary:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __getitem__(self, Key) -> np.ndarray:
+        _frames, *_crop = Key if isinstance(Key, tuple) else (Key, )
+        if isinstance(_frames, (int, np.integer)):
+            _frames = self.ix([_frames])
+        elif isinstance(_frames, slice):
+            _frames = self.ix(np.arange(self.n_frames)[_frames], is_slice=True)
+        else:
+            _frames = self.ix(_frames)
+        return _frames[(slice(None), ) + tuple(_crop)] if _crop else _frames
+
+    def ix(self, indices: Sequence[int], is_slice: bool = False) -> np.ndarray:
+        """
+        Frames at specific indices
+
+        :param indices: indices of the frames
+        :type indices: Sequence[int]
+        :param is_slice: whether the indices are consecutive (read as a single slice)
+        :type is_slice: bool
+        :return: frames [Z x Y x X]
+        :rtype: Any
+        """
+        _indices = np.asarray(indices, dtype=np.int64)
+        if is_slice and _indices.size:
+            _images = np.asarray(self.images[int(_indices[0]):int(_indices[-1]) + 1])
+        else:
+            _images = read_frames(self.images, _indices)
+        return Suite2PAnalysis.convert_binary(_images)
+
+    def sampled_mean(self) -> np.ndarray:
+        """
+        Mean of up to 1000 frames sampled across the video (as suite2p.io.BinaryRWFile.sampled_mean)
+
+        :rtype: Any
+        """
+        _samples = np.linspace(0, self.n_frames, 1 + min(self.n_frames, 1000)).astype(np.int64)[:-1]
+        return self.ix(_samples).astype(np.float32).mean(axis=0)
+
+    def close(self) -> None:
+        """
+        Does nothing, the video is not opened by the view
+
+        :rtype: None
+        """
+        return
+
+
+def register_binary_parallel(Ops: dict, **kwargs: int) -> Tuple[Any, ...]:
+    """
+    Registers the single-channel suite2p binary Ops["raw_file"] into Ops["reg_file"] using a pool of processes
+
+    The reference image (and bidiphase offset) is computed once from the raw binary. The batches of the binary
+    (Ops["batch_size"] frames, the same batches suite2p uses) are registered against the shared reference by the
+    workers, which write their registered frames directly into the registered binary. The workers only receive the
+    parameters used to register a batch. The offsets and the mean image are stitched in batch order, so the outputs
+    match suite2p.registration_wrapper of a single channel (meanImg_chan2 is None). Ops is not modified (an
+    estimated bidiphase offset is not written back).
+
+    :param Ops: Suite2P "ops" (Ly, Lx, raw_file, reg_file & registration parameters)
+    :type Ops: dict
+    :keyword workers: number of worker processes (int, default os.cpu_count())
+    :return: refImg, rmin, rmax, meanImg, rigid_offsets, nonrigid_offsets, zest, meanImg_chan2, badframes, yrange,
+        xrange (see suite2p.registration_wrapper)
+    :rtype: tuple
+    """
+    _workers = kwargs.get("workers", os.cpu_count())
+    _register = suite2p.registration.register
+    Ops = dict(Ops)
+
+    with suite2p.io.BinaryRWFile(Ly=Ops.get("Ly"), Lx=Ops.get("Lx"), filename=Ops.get("raw_file")) as f_raw:
+        _num_frames, _y_pixels, _x_pixels = f_raw.shape
+        _total_frames = _num_frames
+        # reference image & bidiphase offset
+        _frames = f_raw[np.linspace(0, _num_frames, 1 + np.minimum(Ops["nimg_init"], _num_frames), dtype=int)[:-1]]
+    if Ops["do_bidiphase"] and Ops["bidiphase"] == 0 and not Ops["bidi_corrected"]:
+        Ops["bidiphase"] = suite2p.registration.bidiphase.compute(_frames)
+        print("NOTE: estimated bidiphase offset from data: %d pixels" % Ops.get("bidiphase"))
+        if Ops["bidiphase"] != 0:
+            suite2p.registration.bidiphase.shift(_frames, int(Ops["bidiphase"]))
+    _ref_img = _register.compute_reference(_frames, ops=Ops)
+
+    if Ops.get("norm_frames", False):
+        _normalized_ref_img, _rmin, _rmax = _register.normalize_reference_image(_ref_img.copy())
+    else:
+        _normalized_ref_img, _rmin, _rmax = _ref_img.copy(), -np.inf, np.inf
+    _bidiphase = int(Ops["bidiphase"]) if Ops["bidiphase"] and not Ops["bidi_corrected"] else 0
+    _ref_and_masks = _register.compute_reference_masks(_normalized_ref_img, Ops)
+    # parameters of suite2p.registration.register.register_frames & of reading, writing & saving a batch
+    _batch_ops = {_key: Ops[_key] for _key in (
+        "Ly", "Lx", "raw_file", "reg_file", "save_path", "reg_tif", "reg_tif_chan2", "functional_chan",
+        "align_by_chan", "norm_frames", "smooth_sigma_time", "1Preg", "pre_smooth", "spatial_hp_reg", "maxregshift",
+        "nonrigid", "snr_thresh", "maxregshiftNR", "block_size", "smooth_sigma", "spatial_taper") if _key in Ops}
+
+    # the registered binary has the length of the raw binary, each worker writes its own frames
+    with open(Ops.get("reg_file"), "wb") as _file:
+        _file.truncate(int(_total_frames) * _y_pixels * _x_pixels * np.dtype(np.int16).itemsize)
+
+    if Ops["frames_include"] != -1:
+        _num_frames = min(_num_frames, Ops["frames_include"])
+    _batches = [(_start, min(_start + Ops["batch_size"], _num_frames))
+                for _start in range(0, _num_frames, Ops["batch_size"])]
+
+    _mean_img = np.zeros((_y_pixels, _x_pixels), "float32")
+    _rigid_offsets = []
+    _nonrigid_offsets = []
+    _z_positions = []
+    _z_correlations = []
+    with ProcessPoolExecutor(max_workers=_workers) as _executor:
+        _futures = [_executor.submit(register_batch, _batch_ops, _ref_and_masks, _rmin, _rmax, _bidiphase, _start,
+                                     _stop) for _start, _stop in _batches]
+        for _future in tqdm(_futures, total=len(_futures), desc="Registering Images...", disable=False):
+            _rigid_offset, _nonrigid_offset, _frame_sum, _zest = _future.result()
+            _rigid_offsets.append(_rigid_offset)
+            if _zest is not None:
+                _z_positions.extend(list(_zest[0]))
+                _z_correlations.extend(list(_zest[1]))
+            if Ops["nonrigid"]:
+                _nonrigid_offsets.append(_nonrigid_offset)
+            # accumulated in the order (and precision) of suite2p
+            _mean_img += _frame_sum / _num_frames
+
+    _rigid_offsets = suite2p.registration.utils.combine_offsets_across_batches(_rigid_offsets, rigid=True)
+    if Ops["nonrigid"]:
+        _nonrigid_offsets = suite2p.registration.utils.combine_offsets_across_batches(_nonrigid_offsets, rigid=False)
+
+    # bad frames & valid region, as suite2p.registration_wrapper
+    _bad_frames = np.zeros(_total_frames, "bool")
+    if "data_path" in Ops and len(Ops["data_path"]) > 0:
+        _bad_frames_file = os.path.abspath(os.path.join(Ops["data_path"][0], "bad_frames.npy"))
+        if os.path.isfile(_bad_frames_file):
+            print("bad frames file path: %s" % _bad_frames_file)
+            _bad_frames[np.load(_bad_frames_file).flatten().astype(int)] = True
+            print("number of badframes: %d" % _bad_frames.sum())
+    _yoff, _xoff, _corr_xy = _rigid_offsets
+    _bad_frames, _yrange, _xrange = _register.compute_crop(xoff=_xoff, yoff=_yoff, corrXY=_corr_xy,
+                                                           th_badframes=Ops["th_badframes"], badframes=_bad_frames,
+                                                           maxregshift=Ops["maxregshift"], Ly=_y_pixels,
+                                                           Lx=_x_pixels)
+
+    return _ref_img, _rmin, _rmax, _mean_img, _rigid_offsets, _nonrigid_offsets, (_z_positions, _z_correlations), \
+        None, _bad_frames, _yrange, _xrange
+
+
+def register_batch(Ops: dict, RefAndMasks: tuple, RMin: float, RMax: float, BiDiPhase: int, Start: int,
+                   Stop: int) -> Tuple[list, list, np.ndarray, Optional[tuple]]:
+    """
+    Registers one batch of the raw binary against the reference & writes it into the registered binary
+
+    :param Ops: registration parameters of Suite2P "ops" (see register_binary_parallel)
+    :type Ops: dict
+    :param RefAndMasks: reference image & masks (see suite2p.registration.register.compute_reference_masks)
+    :type RefAndMasks: tuple
+    :param RMin: clip frames at RMin
+    :type RMin: float
+    :param RMax: clip frames at RMax
+    :type RMax: float
+    :param BiDiPhase: bidiphase offset
+    :type BiDiPhase: int
+    :param Start: first frame of the batch
+    :type Start: int
+    :param Stop: last frame of the batch (exclusive)
+    :type Stop: int
+    :return: rigid offsets, nonrigid offsets, sum of the registered frames, z-positions & correlations (or None)
+    :rtype: tuple[list, list, Any, Optional[tuple]]
+    """
+    with suite2p.io.BinaryRWFile(Ly=Ops.get("Ly"), Lx=Ops.get("Lx"), filename=Ops.get("raw_file")) as f_raw:
+        _frames = f_raw[Start:Stop]
+    _frames, _ymax, _xmax, _cmax, _ymax1, _xmax1, _cmax1, _zest = suite2p.registration.register.register_frames(
+        RefAndMasks, _frames, rmin=RMin, rmax=RMax, bidiphase=BiDiPhase, ops=Ops, nZ=1)
+    with suite2p.io.BinaryRWFile(Ly=Ops.get("Ly"), Lx=Ops.get("Lx"), filename=Ops.get("reg_file")) as f_reg:
+        f_reg[Start:Stop] = _frames
+
+    if Ops["reg_tif"] if Ops["functional_chan"] == Ops["align_by_chan"] else Ops["reg_tif_chan2"]:
+        suite2p.io.save_tiff(mov=_frames, fname=suite2p.io.generate_tiff_filename(
+            functional_chan=Ops["functional_chan"], align_by_chan=Ops["align_by_chan"], save_path=Ops["save_path"],
+            k=Start, ichan=True))
+
+    return [_ymax, _xmax, _cmax], [_ymax1, _xmax1, _cmax1], _frames.sum(axis=0), _zest
+
 
 def get_date():
     return date.isoformat(date.today())
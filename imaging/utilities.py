@@ -8,9 +8,155 @@ import scipy.ndimage
 import pandas as pd
 
 
+class TraceTensor:
+    """
+    Dense traces (neuron, component, frame) with the frame boundaries of each tiff
+
+    Replaces the ROI x TIFF object arrays (each component x frame) of fissa, so traces across tiffs are contiguous
+    rows instead of arrays concatenated per neuron on each call. Traces are stored as float32.
+
+    **Required Inputs**
+        | *Data* : traces [Neurons x Components x Frames] (or [Neurons x Frames] for a single component)
+
+    **Keyword Arguments**
+        | *boundaries* : first frame of each tiff followed by the number of frames (Sequence[int], default one tiff)
+
+    **Properties**
+        | *shape* : Neurons, Components, Frames
+        | *neurons* : number of neurons
+        | *components* : number of components
+        | *frames* : number of frames
+        | *tiffs* : number of tiffs
+
+    **Self Methods**
+        | *tiff* : traces of a single tiff
+        | *merged* : traces of a single component across tiffs
+        | *with_data* : tensor of other traces with the same boundaries
+        | *to_object_array* : traces in the ROI x TIFF layout of fissa
+        | *from_object_array* : tensor of traces in the ROI x TIFF layout of fissa
+    """
+
+    def __init__(self, Data: np.ndarray, **kwargs):
+        _data = np.asarray(Data, dtype=np.float32)
+        if _data.ndim == 2:
+            _data = _data[:, np.newaxis, :]
+        if _data.ndim != 3:
+            raise ValueError("Traces must be [Neurons x Components x Frames]")
+        self.data = _data
+
+        _boundaries = kwargs.get("boundaries", None)
+        self.boundaries = np.asarray([0, _data.shape[2]] if _boundaries is None else _boundaries, dtype=np.int64)
+        if self.boundaries[0] != 0 or self.boundaries[-1] != _data.shape[2] or np.any(np.diff(self.boundaries) < 0):
+            raise ValueError("Boundaries must increase from 0 to the number of frames")
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return self.data.shape
+
+    @property
+    def neurons(self) -> int:
+        return self.data.shape[0]
+
+    @property
+    def components(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def frames(self) -> int:
+        return self.data.shape[2]
+
+    @property
+    def tiffs(self) -> int:
+        return self.boundaries.shape[0] - 1
+
+    def tiff(self, Tiff: int) -> np.ndarray:
+        """
+        Traces of a single tiff
+
+        :param Tiff: tiff
+        :type Tiff: int
+        :return: view of the traces [Neurons x Components x Frames in Tiff]
+        :rtype: Any
+        """
+        return self.data[:, :, self.boundaries[Tiff]:self.boundaries[Tiff + 1]]
+
+    def merged(self, Component: int = 0) -> np.ndarray:
+        """
+        Traces of a single component across tiffs
+
+        :param Component: component
+        :type Component: int
+        :return: view of the traces [Neurons x Frames]
+        :rtype: Any
+        """
+        return self.data[:, Component, :]
+
+    def with_data(self, Data: np.ndarray) -> TraceTensor:
+        """
+        Tensor of other traces with the same boundaries
+
+        :param Data: traces [Neurons x Components x Frames]
+        :type Data: Any
+        :rtype: TraceTensor
+        """
+        return TraceTensor(Data, boundaries=self.boundaries)
+
+    def to_object_array(self) -> np.ndarray:
+        """
+        Traces in the ROI x TIFF layout of fissa (views of the tensor)
+
+        :return: traces [Neurons x Tiffs] <- [Components x Frames]
+        :rtype: Any
+        """
+        _traces = np.empty((self.neurons, self.tiffs), dtype=object)
+        for _neuron, _tiff in itertools.product(range(self.neurons), range(self.tiffs)):
+            _traces[_neuron, _tiff] = self.data[_neuron, :, self.boundaries[_tiff]:self.boundaries[_tiff + 1]]
+        return _traces
+
+    @classmethod
+    def from_object_array(cls, Traces: np.ndarray) -> TraceTensor:
+        """
+        Tensor of traces in the ROI x TIFF layout of fissa
+
+        :param Traces: traces [Neurons x Tiffs] <- [Components x Frames]
+        :type Traces: Any
+        :rtype: TraceTensor
+        """
+        [_neurons, _tiffs] = Traces.shape
+        _boundaries = np.concatenate([[0], np.cumsum([Traces[0, _tiff].shape[1] for _tiff in range(_tiffs)])])
+        _components = Traces[0, 0].shape[0]
+        _data = np.empty((_neurons, _components, _boundaries[-1]), dtype=np.float32)
+        for _neuron, _tiff in itertools.product(range(_neurons), range(_tiffs)):
+            if Traces[_neuron, _tiff].shape != (_components, _boundaries[_tiff + 1] - _boundaries[_tiff]):
+                raise ValueError("Traces of each neuron must have the same components & frames in each tiff")
+            _data[_neuron, :, _boundaries[_tiff]:_boundaries[_tiff + 1]] = Traces[_neuron, _tiff]
+        return cls(_data, boundaries=_boundaries)
+
+
+def as_trace_tensor(Traces: Union[TraceTensor, np.ndarray]) -> TraceTensor:
+    """
+    Traces as a TraceTensor
+
+    :param Traces: tensor, traces in the ROI x TIFF layout of fissa or traces [Neurons x (Components x) Frames]
+    :type Traces: Union[TraceTensor, Any]
+    :rtype: TraceTensor
+    """
+    if isinstance(Traces, TraceTensor):
+        return Traces
+    if Traces.dtype == object:
+        return TraceTensor.from_object_array(Traces)
+    return TraceTensor(Traces)
+
+
 def mergeTraces(Traces, **kwargs):
     _component = kwargs.get('component', 0)
 
+    if isinstance(Traces, TraceTensor):
+        return np.ascontiguousarray(Traces.merged(_component))
+
     [_neurons, _tiffs] = Traces.shape
     _frames = np.concatenate(Traces[0], axis=1)[0, :].shape[0]
     mergedTraces = np.full((_neurons, _frames), 0, dtype=np.float64)
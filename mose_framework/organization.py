@@ -13,7 +13,7 @@ import pathlib
 from tqdm import tqdm
 from shutil import copytree
 from imaging.io import save_raw_binary, determine_bruker_folder_contents, repackage_bruker_tiffs, \
-    pretty_print_bruker_command, load_all_tiffs
+    pretty_print_bruker_command, load_all_tiffs, TraceStore
 from migration_tools.Converters import renamed_load
 from mose_framework.user_interfaces import select_directory, verbose_copying, validate_string, validate_path_string, \
     select_file, validate_config_format, terminal_style
@@ -1938,12 +1938,15 @@ class ImagingAnalysis(Data):
                                          dtype=np.int16), (Frames, Y, X))
         save_raw_binary(_images, self.folders.get("denoised"))
 
-    def load_fissa_exports(self) -> Tuple[dict, dict, dict]:
+    def load_fissa_exports(self) -> Tuple[dict, dict, Union[dict, TraceStore]]:
         """
         This function loads the prepared and separated files exported from Fissa
 
+        Processed traces are returned as a lazily loaded store (each field is memory-mapped on first access, see
+        imaging.io.TraceStore). Processed traces saved as a pickle by previous versions are returned as a dictionary.
+
         :return: Prepared, Separated, ProcessedTraces
-        :rtype: tuple[dict, dict, dict]
+        :rtype: tuple[dict, dict, Union[dict, TraceStore]]
         """
 
         def load_processed_traces(Filename) -> dict:
@@ -1999,12 +2002,18 @@ class ImagingAnalysis(Data):
 
         # noinspection PyBroadException
         try:
-            ProcessedTraces = load_processed_traces(self.find_matching_files("ProcessedTraces")[0])
+            _store = self.find_matching_files("processed_traces.json")
+            if len(_store) > 0:
+                ProcessedTraces = TraceStore(_store[0])
+            else:
+                ProcessedTraces = load_processed_traces(self.find_matching_files("ProcessedTraces")[0])
         except Exception:
             print("Could not locate processed traces file")
             ProcessedTraces = dict()
 
-        if isinstance(ProcessedTraces, dict):
+        if isinstance(ProcessedTraces, TraceStore):
+            return {**Prepared}, {**Separated}, ProcessedTraces
+        elif isinstance(ProcessedTraces, dict):
             return {**Prepared}, {**Separated}, {**ProcessedTraces}
         else:
             return {**Prepared}, {**Separated}, {**ProcessedTraces.__dict__}
@@ -0,0 +1,32 @@
+"""
+Benchmark of fast_median_filter against scipy.ndimage.median_filter on a 512 x 512 uint16 movie
+
+Usage: python testing/benchmark_fast_median_filter.py [frames]
+"""
+import sys
+import time
+import numpy as np
+import scipy.ndimage
+from imaging.image_processing import fast_median_filter
+
+
+def benchmark(Frames: int = 100) -> None:
+    _images = np.random.default_rng(0).integers(0, 8192, (Frames, 512, 512), dtype=np.uint16)
+
+    for _footprint, _kwargs in ((np.ones((3, 3, 3)), {}), (np.ones((3, 1, 1)), {"temporal_only": True})):
+        _start = time.perf_counter()
+        _reference = scipy.ndimage.median_filter(_images, footprint=_footprint)
+        _scipy_time = time.perf_counter() - _start
+
+        _start = time.perf_counter()
+        _filtered = fast_median_filter(_images, **_kwargs)
+        _fast_time = time.perf_counter() - _start
+
+        print("".join(["Footprint ", " x ".join([str(_dim) for _dim in _footprint.shape]), " (", str(Frames),
+                       " x 512 x 512 uint16): scipy ", format(_scipy_time, ".2f"), " s, fast ",
+                       format(_fast_time, ".2f"), " s, speedup ", format(_scipy_time / _fast_time, ".1f"),
+                       "x, identical: ", str(np.array_equal(_filtered, _reference))]))
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
@@ -0,0 +1,67 @@
+import pytest
+import numpy as np
+import scipy.ndimage
+import skimage.measure
+from imaging.image_processing import filter_images, blockwise_filter_images, fast_median_filter, \
+    grouped_z_project, multi_grouped_z_project
+
+
+@pytest.fixture
+def images():
+    return np.random.default_rng(0).integers(0, 8192, (57, 13, 11), dtype=np.uint16)
+
+
+@pytest.mark.parametrize("footprint", [np.ones((3, 3, 3)), np.ones((5, 1, 1))])
+def test_blockwise_filter_images(images, footprint):
+    filtered = blockwise_filter_images(images, footprint, block_size=10, workers=2)
+    np.testing.assert_array_equal(filtered, scipy.ndimage.median_filter(images, footprint=footprint))
+
+
+def test_blockwise_filter_images_mapped(images, tmp_path):
+    mapped_images = np.memmap(tmp_path.joinpath("images"), dtype=images.dtype, mode="w+", shape=images.shape)
+    mapped_images[:] = images
+    mapped_images.flush()
+    output = np.memmap(tmp_path.joinpath("output"), dtype=images.dtype, mode="w+", shape=images.shape)
+    blockwise_filter_images(mapped_images, Output=output, block_size=8, workers=2)
+    np.testing.assert_array_equal(np.memmap(tmp_path.joinpath("output"), dtype=images.dtype, mode="r",
+                                            shape=images.shape), filter_images(images))
+    with pytest.raises(ValueError):
+        blockwise_filter_images(mapped_images, Output=mapped_images)
+
+
+@pytest.mark.parametrize("shape", [(9, 7, 5), (1, 1, 1), (2, 17, 3), (21, 33, 35)])
+@pytest.mark.parametrize("dtype", [np.uint16, np.int16, np.uint8])
+def test_fast_median_filter(shape, dtype):
+    # few distinct values to exercise ties
+    images = np.random.default_rng(1).integers(0, 7, shape).astype(dtype)
+    np.testing.assert_array_equal(fast_median_filter(images, chunk_frames=3, chunk_rows=5),
+                                  scipy.ndimage.median_filter(images, footprint=np.ones((3, 3, 3))))
+    np.testing.assert_array_equal(fast_median_filter(images, temporal_only=True, chunk_frames=2),
+                                  scipy.ndimage.median_filter(images, footprint=np.ones((3, 1, 1))))
+
+
+def test_filter_images_fast_path(images):
+    np.testing.assert_array_equal(filter_images(images),
+                                  scipy.ndimage.median_filter(images, footprint=np.ones((3, 3, 3))))
+
+
+def test_multi_grouped_z_project(images, tmp_path):
+    mapped_images = np.memmap(tmp_path.joinpath("images"), dtype=images.dtype, mode="w+", shape=images.shape)
+    mapped_images[:] = images
+    mapped_images.flush()
+    bin_sizes = [(3, 1, 1), (10, 1, 1), (4, 2, 3), 2]
+    projections = multi_grouped_z_project(mapped_images, bin_sizes, str(tmp_path), chunk_size=16)
+    for bin_size, projection in zip(bin_sizes, projections):
+        expected = skimage.measure.block_reduce(images, block_size=bin_size, func=np.mean).astype(images.dtype)
+        assert isinstance(projection, np.memmap)
+        np.testing.assert_array_equal(projection, expected)
+    np.testing.assert_array_equal(np.load(str(tmp_path) + "\\grouped_z_project_3x1x1.npy"), projections[0])
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.float32])
+def test_grouped_z_project(images, dtype):
+    images = images.astype(dtype) - 4096
+    expected = skimage.measure.block_reduce(images, block_size=(3, 1, 1), func=np.mean).astype(dtype)
+    np.testing.assert_allclose(grouped_z_project(images, (3, 1, 1)), expected, rtol=1e-6)
+    np.testing.assert_array_equal(grouped_z_project(images, (3, 1, 1), np.max),
+                                  skimage.measure.block_reduce(images, block_size=(3, 1, 1), func=np.max))
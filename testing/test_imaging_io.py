@@ -1,7 +1,17 @@
 import os
+import itertools
+import threading
+import pathlib
 import pytest
+import numpy as np
+import tifffile
+import imageio
 from shutil import rmtree
-from imaging.io import determine_bruker_folder_contents, repackage_bruker_tiffs
+from imaging.io import determine_bruker_folder_contents, repackage_bruker_tiffs, load_single_frame_tiffs, \
+    BrukerFolderIndex, convert_bruker_to_binary, load_mapped_binary, load_all_tiffs, load_raw_binary, \
+    load_binary_meta, save_raw_binary, BinaryVideoHeader, ChunkedVideo, save_tiff_stack, \
+    PrefetchReader, demultiplex_bruker_tiffs, load_bruker_tiffs, save_video, FrameChunk, save_trace_store, \
+    TraceStore, read_frames
 
 FIXTURE_DIR = "".join([os.path.abspath(os.path.join(os.getcwd(), os.pardir)), "\\TestingData"])
 
@@ -58,3 +68,276 @@ def test_repackage_bruker_tiffs_single_plane(datafiles, tmp_path):
     os.mkdir(output_folder)
     repackage_bruker_tiffs(input_folder, output_folder, 0)
     rmtree(datafiles)
+
+
+def generate_single_frame_tiffs(Directory, Frames=10, Height=8, Width=6):
+    images = np.arange(Frames * Height * Width, dtype=np.uint16).reshape(Frames, Height, Width)
+    for _frame in range(Frames):
+        tifffile.imwrite(pathlib.Path(Directory).joinpath("".join(["TSeries_Cycle00001_Ch2_",
+                                                                     str(_frame + 1).zfill(6), ".ome.tif"])),
+                         images[_frame])
+    return images
+
+
+def test_load_single_frame_tiffs_order(tmp_path):
+    images = generate_single_frame_tiffs(tmp_path, 130)
+    files = sorted(tmp_path.glob("*.ome.tif"))
+    loaded = load_single_frame_tiffs(files, workers=4, block_size=16, verbose=False)
+    np.testing.assert_array_equal(loaded, images)
+
+
+def generate_multiplane_tiffs(Directory, Frames=7, Planes=2, Height=8, Width=6, Channel=2):
+    images = np.random.default_rng(Channel).integers(0, 65535, (Frames, Planes, Height, Width), dtype=np.uint16)
+    for _frame, _plane in itertools.product(range(Frames), range(Planes)):
+        tifffile.imwrite(pathlib.Path(Directory).joinpath("".join(["TSeries_Cycle", str(_frame + 1).zfill(5),
+                                                                     "_Ch", str(Channel), "_",
+                                                                     str(_plane + 1).zfill(6),
+                                                                     ".ome.tif"])),
+                         images[_frame, _plane])
+    return images
+
+
+def test_repackage_bruker_tiffs_chunked(tmp_path):
+    input_folder = tmp_path.joinpath("input")
+    input_folder.mkdir()
+    images = generate_multiplane_tiffs(input_folder)
+    output_folder = "".join([str(tmp_path), "\\output"])
+    repackage_bruker_tiffs(str(input_folder), output_folder, 1, chunk_size=3, workers=2)
+    compiled = tifffile.imread("".join([output_folder, "\\compiledVideo_01_of_1.tif"]), key=range(0, 7, 1))
+    np.testing.assert_array_equal(compiled, images[:, 1])
+
+
+def test_convert_bruker_to_binary(tmp_path):
+    input_folder = tmp_path.joinpath("input")
+    input_folder.mkdir()
+    images = generate_multiplane_tiffs(input_folder)
+    output_folder = "".join([str(tmp_path), "\\output"])
+    assert(convert_bruker_to_binary(str(input_folder), output_folder, 0, chunk_size=3, workers=2) == (7, 8, 6))
+    binary_video = load_mapped_binary("", "", output_folder)
+    np.testing.assert_array_equal(binary_video, images[:, 0])
+
+
+def test_bruker_folder_index_contents(tmp_path):
+    generate_multiplane_tiffs(tmp_path)
+    assert(determine_bruker_folder_contents(str(tmp_path)) == (1, 2, 7, 8, 6))
+
+
+def test_bruker_folder_index_single_plane(tmp_path):
+    generate_single_frame_tiffs(tmp_path, 12)
+    index = BrukerFolderIndex(str(tmp_path))
+    assert(index.contents == (1, 1, 12, 8, 6))
+    assert(pathlib.Path(index.files()[-1]).name == "TSeries_Cycle00001_Ch2_000012.ome.tif")
+
+
+def test_bruker_folder_index_cache(tmp_path):
+    generate_multiplane_tiffs(tmp_path)
+    index = BrukerFolderIndex(str(tmp_path))
+    assert(pathlib.Path(index.index_file).exists())
+    assert(BrukerFolderIndex(str(tmp_path)).load())
+    # a new cycle invalidates the index
+    tifffile.imwrite(tmp_path.joinpath("TSeries_Cycle00008_Ch2_000001.ome.tif"), np.zeros((8, 6), dtype=np.uint16))
+    assert(not index.load())
+    assert(BrukerFolderIndex(str(tmp_path)).frames == 8)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib"])
+def test_tiff_volume_slicing(tmp_path, compression):
+    rng = np.random.default_rng(1)
+    images = rng.integers(0, 4096, (11, 8, 6), dtype=np.uint16)
+    for _stack, (start, stop) in enumerate([(0, 4), (4, 9), (9, 11)]):
+        with tifffile.TiffWriter(tmp_path.joinpath("".join(["compiledVideo_0", str(_stack), ".tif"]))) as tif:
+            for frame in images[start:stop]:
+                tif.write(frame, compression=compression)
+    with load_all_tiffs(str(tmp_path), lazy=True) as volume:
+        assert(volume.shape == images.shape and volume._page_views == [None] * 3)
+        np.testing.assert_array_equal(volume[-1], images[-1])
+        # only the file read is mapped, and only when its pages are uncompressed
+        assert(volume._page_views[0] is None and (volume._page_views[2] is not None) == (compression is None))
+        np.testing.assert_array_equal(volume[3:10:2, 2:5], images[3:10:2, 2:5])
+        np.testing.assert_array_equal(volume[[8, 0, 4]], images[[8, 0, 4]])
+    np.testing.assert_array_equal(load_all_tiffs(str(tmp_path)), images)
+
+
+def test_binary_video_header(tmp_path):
+    rng = np.random.default_rng(2)
+    images = rng.integers(0, 4096, (9, 8, 6), dtype=np.uint16)
+    output_folder = "".join([str(tmp_path), "\\output"])
+    save_raw_binary(images, output_folder, header=True, frame_rate=30.0, chunk_frames=4)
+    header = BinaryVideoHeader.read("".join([output_folder, "\\binary_video"]))
+    assert(header.shape == images.shape and header.dtype == images.dtype and header.frame_rate == 30.0)
+    assert(header.data_offset % BinaryVideoHeader.alignment == 0 and header.chunks == 3)
+    assert(load_binary_meta("".join([output_folder, "\\video_meta.txt"])) == (9, 8, 6, "uint16"))
+    np.testing.assert_array_equal(load_mapped_binary("", "", output_folder), images)
+    np.testing.assert_array_equal(load_raw_binary("", "", output_folder, verify=True), images)
+    mapped = load_mapped_binary("", "", output_folder, mode="r+")
+    mapped[5, 0, 0] += 1
+    mapped.flush()
+    del mapped
+    with pytest.raises(ValueError):
+        load_raw_binary("", "", output_folder, verify=True)
+
+
+def test_convert_bruker_to_binary_header(tmp_path):
+    input_folder = tmp_path.joinpath("input")
+    input_folder.mkdir()
+    images = generate_single_frame_tiffs(input_folder, 10)
+    output_folder = "".join([str(tmp_path), "\\output"])
+    convert_bruker_to_binary(str(input_folder), output_folder, chunk_size=4, workers=2, header=True)
+    np.testing.assert_array_equal(load_raw_binary("", "", output_folder, verify=True), images)
+
+
+@pytest.mark.parametrize("codec", ["raw", "zlib", "lzma"])
+def test_chunked_video_random_access(tmp_path, codec):
+    rng = np.random.default_rng(3)
+    images = rng.normal(1000, 50, (30, 21, 17)).astype(np.uint16)
+    output_folder = "".join([str(tmp_path), "\\output"])
+    save_raw_binary(images, output_folder, backend="chunked", chunks=(8, 8, 8), codec=codec, workers=2)
+    assert(load_binary_meta("".join([output_folder, "\\chunked_video"])) == (30, 21, 17, "uint16"))
+    np.testing.assert_array_equal(load_raw_binary("", "", output_folder), images)
+    with load_mapped_binary("", "", output_folder) as chunked_video:
+        assert(isinstance(chunked_video, ChunkedVideo) and chunked_video.shape == images.shape)
+        for key in [(slice(3, 25, 3), slice(5, 13), 2), (-1, ), ([7, 0, 29], slice(None, None, -2)), (Ellipsis, 4)]:
+            np.testing.assert_array_equal(chunked_video[key], images[key])
+        executor = chunked_video._executor
+        np.testing.assert_array_equal(chunked_video[2:9], images[2:9])
+        assert(chunked_video._executor is executor and len(chunked_video._cache) > 0)
+
+
+def test_chunked_video_partial_writes(tmp_path):
+    rng = np.random.default_rng(4)
+    images = rng.integers(0, 4096, (25, 12, 10), dtype=np.uint16)
+    filename = str(tmp_path.joinpath("chunked_video"))
+    with ChunkedVideo(filename, "w", images.shape, images.dtype, chunks=(4, 5, 5), workers=2) as chunked_video:
+        for start in range(0, 25, 7):
+            chunked_video[start:start + 7] = images[start:start + 7]
+    images[10:12, 3:5] = 7
+    size = os.path.getsize(filename)
+    for _ in range(5):
+        with ChunkedVideo(filename, "r+") as chunked_video:
+            chunked_video[10:12, 3:5] = 7
+    assert(os.path.getsize(filename) <= size)
+    np.testing.assert_array_equal(np.asarray(ChunkedVideo(filename)), images)
+
+
+def test_read_frames(tmp_path):
+    rng = np.random.default_rng(6)
+    images = rng.integers(0, 4096, (20, 9, 7), dtype=np.uint16)
+    filename = str(tmp_path.joinpath("chunked_video"))
+    with ChunkedVideo(filename, "w", images.shape, images.dtype, chunks=(4, 5, 5)) as chunked_video:
+        chunked_video[:] = images
+    frames = [12, 3, 4, 5, 19, 0]
+    np.testing.assert_array_equal(read_frames(images, frames), images[frames])
+    with ChunkedVideo(filename) as chunked_video:
+        np.testing.assert_array_equal(read_frames(chunked_video, frames), images[frames])
+        assert(read_frames(chunked_video, []).shape == (0, 9, 7))
+
+
+def test_save_tiff_stack(tmp_path):
+    rng = np.random.default_rng(5)
+    images = rng.uniform(0, 4096, (23, 8, 6)).astype(np.float32)
+    save_tiff_stack(images, str(tmp_path.joinpath("output")), stack_size=10, chunk_size=3, workers=2)
+    assert(len(list(tmp_path.glob("*Video_0?_of_3.tif"))) == 3)
+    np.testing.assert_array_equal(load_all_tiffs(str(tmp_path)), np.floor(images).astype(np.uint16))
+
+
+def test_prefetch_reader_halo(tmp_path):
+    images = np.arange(25 * 4 * 3, dtype=np.uint16).reshape(25, 4, 3)
+    output_folder = "".join([str(tmp_path), "\\output"])
+    save_raw_binary(images, output_folder)
+    reader = PrefetchReader(output_folder, chunk_size=7, halo=(2, 3), prefetch=2)
+    assert(len(reader) == 4)
+    for _ in range(2):  # re-iterable
+        frames = []
+        for start, stop, block, offset in reader:
+            np.testing.assert_array_equal(block, images[max(start - 2, 0):min(stop + 3, 25)])
+            frames.append(block[offset:offset + stop - start])
+        np.testing.assert_array_equal(np.concatenate(frames), images)
+
+
+def test_prefetch_reader_early_exit():
+    threads = threading.active_count()
+    reader = PrefetchReader(np.zeros((100, 2, 2)), chunk_size=1, prefetch=1)
+    for start, _, _, _ in reader:
+        if start == 3:
+            break
+    assert(threading.active_count() == threads)
+
+
+def test_frame_chunk(tmp_path):
+    images = np.arange(25 * 4 * 3, dtype=np.uint16).reshape(25, 4, 3)
+    output_folder = "".join([str(tmp_path), "\\output"])
+    save_raw_binary(images, output_folder)
+    chunk = FrameChunk(load_mapped_binary("", "", output_folder), 6, 17)
+    expected = images[6:17]
+    assert(chunk.shape == expected.shape and len(chunk) == 11 and chunk.dtype == np.uint16)
+    for key in (3, -1, slice(2, 9), slice(None, None, -2), np.array([0, 4, 10]), (slice(1, 5), 2, slice(None)),
+                Ellipsis):
+        np.testing.assert_array_equal(chunk[key], expected[key])
+    np.testing.assert_array_equal(np.asarray(chunk, dtype=np.float32), expected.astype(np.float32))
+
+
+def test_trace_store(tmp_path):
+    rng = np.random.default_rng(0)
+    raw = np.empty((3, 2), dtype=object)
+    for roi, tiff in itertools.product(range(3), range(2)):
+        raw[roi, tiff] = rng.random((5 - roi % 2, 10 + tiff))
+    merged = rng.random((3, 21)).astype(np.float32)
+    filename = "".join([str(tmp_path), "\\processed_traces"])
+    save_trace_store({"original_raw": raw, "merged_dFoF_raw": merged, "dFoF_raw": None}, filename)
+
+    store = TraceStore(filename + ".json")
+    assert(TraceStore.exists(filename) and set(store) == {"original_raw", "merged_dFoF_raw"})
+    assert(len(store._loaded) == 0)
+    assert(isinstance(store["merged_dFoF_raw"], np.memmap) and store.merged_dFoF_raw.dtype == np.float32)
+    np.testing.assert_array_equal(store["merged_dFoF_raw"], merged)
+    assert(store["original_raw"].shape == (3, 2))
+    for roi, tiff in itertools.product(range(3), range(2)):
+        np.testing.assert_array_equal(store["original_raw"][roi, tiff], raw[roi, tiff])
+    assert(store.get("dFoF_raw") is None)
+
+
+def test_trace_store_resave(tmp_path):
+    raw = np.empty((2, 2), dtype=object)
+    for roi, tiff in itertools.product(range(2), range(2)):
+        raw[roi, tiff] = np.full((3, 4 + tiff), roi * 10 + tiff, dtype=np.float64)
+    merged = np.arange(2 * 9, dtype=np.float64).reshape(2, 9)
+    filename = "".join([str(tmp_path), "\\processed_traces"])
+    save_trace_store({"original_raw": raw, "merged_dFoF_raw": merged}, filename)
+
+    # fields mapped from the store are saved back to the files they are mapped from
+    loaded = dict(TraceStore(filename))
+    assert(isinstance(loaded["merged_dFoF_raw"], np.memmap))
+    save_trace_store(loaded, filename)
+    del loaded
+
+    reloaded = TraceStore(filename)
+    np.testing.assert_array_equal(reloaded["merged_dFoF_raw"], merged)
+    for roi, tiff in itertools.product(range(2), range(2)):
+        np.testing.assert_array_equal(reloaded["original_raw"][roi, tiff], raw[roi, tiff])
+    assert(not any(_file.name.endswith(".partial") for _file in tmp_path.iterdir()))
+
+
+def test_demultiplex_bruker_tiffs(tmp_path):
+    input_folder = tmp_path.joinpath("input")
+    input_folder.mkdir()
+    images = np.stack([generate_multiplane_tiffs(input_folder, Planes=3, Channel=_channel) for _channel in (2, 3)])
+    output_folder = "".join([str(tmp_path), "\\output"])
+    demultiplexed = demultiplex_bruker_tiffs(str(input_folder), output_folder, workers=2)
+    assert(demultiplexed.shape == (2, 3, 7, 8, 6))
+    np.testing.assert_array_equal(demultiplexed, images.transpose(0, 2, 1, 3, 4))
+    np.testing.assert_array_equal(np.load("".join([output_folder, "\\demultiplexed_video.npy"]), mmap_mode="r"),
+                                  demultiplexed)
+    loaded = load_bruker_tiffs(str(input_folder), workers=2)
+    assert(len(loaded) == 6)
+    np.testing.assert_array_equal(loaded[4], images[1, :, 1])
+
+
+def test_save_video_streaming(tmp_path):
+    def render_chunks():
+        for _start in range(0, 23, 5):
+            yield np.full((min(5, 23 - _start), 16, 16, 3), _start * 10, dtype=np.float32)
+
+    filename = "".join([str(tmp_path), "\\video"])
+    save_video(render_chunks(), filename, fps=10)
+    with imageio.get_reader("".join([filename, ".mp4"])) as reader:
+        assert(reader.count_frames() == 23)
@@ -0,0 +1,129 @@
+import os
+import pytest
+import numpy as np
+from imaging.rois import ROITable, CroppedMask, MaskMatrix, as_roi_table, neuropil_masks, roi_edge
+from skimage.measure import find_contours
+
+
+@pytest.fixture
+def stats():
+    rng = np.random.default_rng(0)
+    _stats = []
+    for _roi in range(9):
+        _npix = int(rng.integers(1, 40))
+        _stats.append({
+            "ypix": rng.integers(0, 31, _npix), "xpix": rng.integers(0, 27, _npix),
+            "lam": rng.random(_npix).astype(np.float32), "overlap": rng.random(_npix) > 0.7,
+            "med": [float(rng.integers(0, 31)), float(rng.integers(0, 27)) + 0.5],
+            "radius": float(rng.random() * 6), "npix": _npix, "compact": float(rng.random())
+        })
+    return np.array(_stats, dtype=object)
+
+
+def points_in_circle(radius, x0=0, y0=0, ):
+    x_ = np.arange(x0 - radius - 1, x0 + radius + 1, dtype=int)
+    y_ = np.arange(y0 - radius - 1, y0 + radius + 1, dtype=int)
+    x, y = np.where((x_[:, np.newaxis] - x0) ** 2 + (y_ - y0) ** 2 <= radius ** 2)
+    for x, y in zip(x_[x], y_[y]):
+        yield x, y
+
+
+def npil_mask(mask, totalexpansion):
+    # dense neuropil growth of fissa.roitools.get_npil_mask
+    area_orig, area_current, count = mask.sum(), 0, 0
+    grown = np.copy(mask)
+    while area_current < totalexpansion * area_orig and area_current < mask.size - area_orig:
+        reference = np.pad(grown, 1)
+        shifts = ((1, 0), (-1, 0), (0, 1), (0, -1)) if count % 2 == 0 else ((1, 1), (1, -1), (-1, 1), (-1, -1))
+        for dy, dx in shifts:
+            grown |= reference[1 - dy:reference.shape[0] - 1 - dy, 1 - dx:reference.shape[1] - 1 - dx]
+        area_current = grown.sum() - area_orig
+        count += 1
+    grown[mask] = False
+    return grown
+
+
+def test_roi_table(stats, tmp_path):
+    cells = np.column_stack([np.arange(9) % 2, np.linspace(0, 1, 9)])
+    table = ROITable.from_suite2p(stats, cells)
+    assert len(table) == 9
+    np.testing.assert_array_equal(table.neurons, [1, 3, 5, 7])
+    np.testing.assert_array_equal(table.diameters, [_stat["radius"] * 2 for _stat in stats])
+    for _roi in (0, 4, -1):
+        np.testing.assert_array_equal(table[_roi]["ypix"], stats[_roi]["ypix"])
+        np.testing.assert_array_equal(table[_roi]["lam"], stats[_roi]["lam"])
+        assert table[_roi]["radius"] == stats[_roi]["radius"]
+    stats[3]["soma_crop"] = np.arange(stats[3]["npix"]) % 2 == 0
+    np.testing.assert_array_equal(ROITable.from_suite2p(stats)[3]["soma_crop"], stats[3]["soma_crop"])
+    assert table.to_suite2p().shape == (9, ) and table.to_suite2p()[4]["soma_crop"].all()
+
+    subset = table[np.array([7, 2, 5])]
+    for _position, _roi in enumerate([7, 2, 5]):
+        np.testing.assert_array_equal(subset.pixels(_position)[1], stats[_roi]["xpix"])
+        np.testing.assert_array_equal(subset.med[_position], stats[_roi]["med"])
+    np.testing.assert_array_equal(subset.iscell, cells[[7, 2, 5]])
+
+    masks = table.masks((31, 27))
+    for _roi, _stat in enumerate(stats):
+        expected = np.zeros((31, 27), dtype=bool)
+        expected[_stat["ypix"][~_stat["overlap"]], _stat["xpix"][~_stat["overlap"]]] = 1
+        np.testing.assert_array_equal(masks[_roi], expected)
+
+    pairs = [_pair for _stat in stats for _pair in points_in_circle(_stat["radius"], *_stat["med"])]
+    y, x = table.circle_pixels()
+    assert list(zip(y.tolist(), x.tolist())) == [(int(_y), int(_x)) for _y, _x in pairs]
+
+    table.save(str(tmp_path.joinpath("table.npz")))
+    loaded = ROITable.load(str(tmp_path.joinpath("table.npz")))
+    for _column in ("offsets", ) + ROITable.pixel_columns + ROITable.roi_columns:
+        np.testing.assert_array_equal(getattr(loaded, _column), getattr(table, _column))
+    assert as_roi_table(loaded) is loaded
+
+
+def test_roi_table_from_suite2p_folder(stats, tmp_path):
+    directory = str(tmp_path.joinpath("plane0"))
+    np.save(directory + "\\stat.npy", stats, allow_pickle=True)
+    table = ROITable.from_suite2p_folder(directory)
+    assert os.path.isfile(directory + "\\roi_table.npz")
+    assert table.iscell is None
+
+    np.save(directory + "\\stat.npy", stats[:4], allow_pickle=True)
+    os.utime(directory + "\\roi_table.npz", (0, 0))
+    assert len(ROITable.from_suite2p_folder(directory)) == 4
+    assert len(ROITable.from_suite2p_folder(directory)) == 4
+
+
+def test_cropped_masks(stats):
+    table = ROITable.from_suite2p(stats)
+    masks = table.masks((31, 27))
+    for _roi, _cropped in enumerate(table.cropped_masks()):
+        np.testing.assert_array_equal(_cropped.dense((31, 27)), masks[_roi])
+        assert _cropped.area == masks[_roi].sum()
+        assert _cropped.mask.size <= masks[_roi].size
+
+    yy, xx = np.mgrid[:40, :50]
+    for centre, radius in (((20, 25), 3), ((1, 2), 2), ((38, 47), 4)):
+        mask = (yy - centre[0]) ** 2 + (xx - centre[1]) ** 2 <= radius ** 2
+        regions = neuropil_masks(CroppedMask.from_coordinates(*mask.nonzero()), (40, 50), 4, 1)
+        dense = np.array([_region.dense((40, 50)) for _region in regions])
+        np.testing.assert_array_equal(dense.any(axis=0), npil_mask(mask, 4))
+        assert dense.sum(axis=0).max() == 1
+        assert dense.sum(axis=(1, 2)).min() >= dense.sum() // 4 - 2
+
+
+def test_mask_matrix(stats):
+    images = np.random.default_rng(1).integers(-500, 4000, (37, 31, 27)).astype(np.int16)
+    table = ROITable.from_suite2p(stats)
+    cropped = table.cropped_masks(exclude_overlap=False) + [CroppedMask.from_coordinates([], [])]
+    masks = list(table.masks((31, 27), exclude_overlap=False)) + [np.zeros((31, 27), dtype=bool)]
+    traces, mean = MaskMatrix(cropped, (31, 27)).extract(images, chunk_size=10)
+    with np.errstate(invalid="ignore"), pytest.warns(RuntimeWarning):
+        expected = np.array([images[:, _mask].mean(axis=1, dtype=np.float64) for _mask in masks])
+    np.testing.assert_array_equal(traces, expected)
+    np.testing.assert_array_equal(mean, images.mean(axis=0, dtype=np.float64))
+
+    for _cropped, _mask in zip(cropped[:-1], masks):
+        expected = find_contours(np.pad(_mask.astype(float), 1), level=0.5)
+        assert len(roi_edge(_cropped)) == len(expected)
+        for _edge, _expected in zip(roi_edge(_cropped), expected):
+            np.testing.assert_array_equal(_edge, _expected - 0.5)
@@ -0,0 +1,82 @@
+import glob
+import pytest
+import numpy as np
+from imaging.separation import separate_rois_parallel
+
+separated = []
+
+
+def stub_separator(Raw, verbosity=0, **kwargs):
+    # two components per ROI: the first region scaled by alpha & the mean of the regions
+    separated.append(float(Raw[0][0, 0]))
+    _sep = [np.stack([_trial[0] * kwargs.get("alpha"), _trial.mean(axis=0)]) for _trial in Raw]
+    _match = [_trial[::-1] for _trial in _sep]
+    _mixmat = np.arange(Raw[0].shape[0] * 2, dtype=np.float64).reshape(-1, 2)
+    return _sep, _match, _mixmat, {"converged": True, "iterations": 1}
+
+
+def failing_separator(Raw, verbosity=0, **kwargs):
+    if Raw[0][0, 0] >= 4:
+        raise RuntimeError("Interrupted")
+    return stub_separator(Raw, verbosity, **kwargs)
+
+
+@pytest.fixture
+def raw():
+    rng = np.random.default_rng(0)
+    _raw = np.empty((7, 2), dtype=object)
+    for _roi, _trial in np.ndindex(_raw.shape):
+        _raw[_roi, _trial] = rng.random((5, 10 + _trial))
+        # the first value identifies the ROI
+        _raw[_roi, _trial][0, 0] = _roi
+    return _raw
+
+
+def test_separate_rois_layout(raw):
+    separated.clear()
+    sep, result, mixmat, info = separate_rois_parallel(raw, stub_separator, workers=1, batch_size=3, alpha=0.5)
+    assert(sep.shape == result.shape == mixmat.shape == info.shape == (7, 2))
+    assert(sorted(separated) == list(range(7)))
+    for _roi, _trial in np.ndindex(sep.shape):
+        assert(sep[_roi, _trial].shape == (2, 10 + _trial))
+        np.testing.assert_array_equal(sep[_roi, _trial][0], raw[_roi, _trial][0] * 0.5)
+        np.testing.assert_array_equal(result[_roi, _trial][0], raw[_roi, _trial].mean(axis=0))
+        np.testing.assert_array_equal(mixmat[_roi, _trial], np.arange(10).reshape(5, 2))
+        assert(info[_roi, _trial] == {"converged": True, "iterations": 1})
+
+
+def test_separate_rois_resume(raw, tmp_path):
+    checkpoint_folder = "".join([str(tmp_path), "\\separation_checkpoint"])
+    with pytest.raises(RuntimeError):
+        separate_rois_parallel(raw, failing_separator, workers=1, batch_size=2, checkpoint_folder=checkpoint_folder,
+                               alpha=0.5)
+    assert(len(glob.glob(checkpoint_folder + "\\*")) == 3)
+
+    # finished ROIs are loaded from the checkpoints
+    separated.clear()
+    expected = separate_rois_parallel(raw, stub_separator, workers=1, batch_size=2, alpha=0.5)
+    separated.clear()
+    resumed = separate_rois_parallel(raw, stub_separator, workers=1, batch_size=2,
+                                     checkpoint_folder=checkpoint_folder, alpha=0.5)
+    assert(sorted(separated) == [4, 5, 6])
+    for _expected, _resumed in zip(expected, resumed):
+        for _position in np.ndindex(_expected.shape):
+            if isinstance(_expected[_position], dict):
+                assert(_resumed[_position] == _expected[_position])
+            else:
+                np.testing.assert_array_equal(_resumed[_position], _expected[_position])
+    assert(len(glob.glob(checkpoint_folder + "\\*")) == 0)
+
+
+def test_separate_rois_checkpoint_mismatch(raw, tmp_path):
+    checkpoint_folder = "".join([str(tmp_path), "\\separation_checkpoint"])
+    with pytest.raises(RuntimeError):
+        separate_rois_parallel(raw, failing_separator, workers=1, batch_size=2, checkpoint_folder=checkpoint_folder,
+                               alpha=0.5)
+
+    # checkpoints of other parameters are discarded
+    separated.clear()
+    sep = separate_rois_parallel(raw, stub_separator, workers=1, batch_size=2, checkpoint_folder=checkpoint_folder,
+                                 alpha=0.25)[0]
+    assert(sorted(separated) == list(range(7)))
+    np.testing.assert_array_equal(sep[1, 1][0], raw[1, 1][0] * 0.25)
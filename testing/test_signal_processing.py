@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+from imaging.utilities import as_trace_tensor
+
+pytest.importorskip("fissa")
+pytest.importorskip("obspy")
+from imaging.signal_processing import calculate_dFoF, smoothTraces_TiffOrg, detrendTraces_TiffOrg  # noqa: E402
+
+
+def object_traces(Seed, Components=3):
+    rng = np.random.default_rng(Seed)
+    _traces = np.empty((5, 3), dtype=object)
+    for _neuron, _tiff in np.ndindex(_traces.shape):
+        _trace = 1 + rng.random((Components, 40)) + np.sin(np.arange(40) / (3 + _neuron))
+        _traces[_neuron, _tiff] = _trace.astype(np.float32).astype(np.float64)
+    return _traces
+
+
+def copy_traces(Traces):
+    _copied = np.empty(Traces.shape, dtype=object)
+    for _position in np.ndindex(Traces.shape):
+        _copied[_position] = Traces[_position].copy()
+    return _copied
+
+
+@pytest.mark.parametrize("across_tiffs", [True, False])
+@pytest.mark.parametrize("use_raw_f0", [True, False])
+def test_calculate_dFoF_tensor(across_tiffs, use_raw_f0):
+    traces = object_traces(0)
+    raw = object_traces(1)
+    tensor = as_trace_tensor(traces)
+    options = {"across_tiffs": across_tiffs, "use_raw_f0": use_raw_f0}
+
+    expected = calculate_dFoF(copy_traces(traces), 30.0, raw=raw, **options)
+    np.testing.assert_allclose(calculate_dFoF(tensor, 30.0, raw=raw, **options), expected, rtol=1e-4, atol=1e-5)
+    # the tensor is not modified
+    np.testing.assert_array_equal(tensor.data, as_trace_tensor(traces).data)
+
+    expected = calculate_dFoF(copy_traces(traces), 30.0, raw=raw, merge_after=False, **options)
+    unmerged = calculate_dFoF(tensor, 30.0, raw=raw, merge_after=False, **options).to_object_array()
+    for _position in np.ndindex(expected.shape):
+        np.testing.assert_allclose(unmerged[_position], expected[_position], rtol=1e-4, atol=1e-5)
+
+
+def test_smooth_and_detrend_tensor():
+    traces = object_traces(2)
+    tensor = as_trace_tensor(traces)
+
+    expected, expected_by_component = smoothTraces_TiffOrg(traces)
+    smoothed, smoothed_by_component = smoothTraces_TiffOrg(tensor)
+    np.testing.assert_allclose(smoothed_by_component, expected_by_component, rtol=1e-4, atol=1e-4)
+    smoothed = smoothed.to_object_array()
+    for _position in np.ndindex(expected.shape):
+        np.testing.assert_allclose(smoothed[_position], expected[_position], rtol=1e-4, atol=1e-4)
+
+    expected = detrendTraces_TiffOrg(copy_traces(traces))
+    detrended = detrendTraces_TiffOrg(tensor).to_object_array()
+    for _position in np.ndindex(expected.shape):
+        np.testing.assert_allclose(detrended[_position], expected[_position], rtol=1e-4, atol=1e-4)
@@ -0,0 +1,88 @@
+import pytest
+import numpy as np
+from imaging.io import save_raw_binary, load_mapped_binary
+
+suite2p = pytest.importorskip("suite2p")
+from imaging.tool_wrappers.Suite2PModule import ConvertedBinary, Suite2PAnalysis, \
+    register_binary_parallel  # noqa: E402
+
+
+@pytest.fixture
+def binaries(tmp_path):
+    # four gaussian cells with sparse transients on a noisy background
+    rng = np.random.default_rng(0)
+    first, second = np.mgrid[:48, :48]
+    images = rng.normal(400, 20, (200, 48, 48))
+    for center in [(10, 12), (30, 34), (12, 36), (36, 10)]:
+        cell = np.exp(-((first - center[0]) ** 2 + (second - center[1]) ** 2) / 12.5)
+        images += ((rng.random(200) < 0.1) * rng.uniform(1500, 3000, 200))[:, np.newaxis, np.newaxis] * cell
+    images = np.clip(images, 0, 65535).astype(np.uint16)
+
+    image_directory = "".join([str(tmp_path), "\\video"])
+    save_raw_binary(images, image_directory)
+    # the converted binary suite2p reads as its registered binary
+    reg_file = "".join([str(tmp_path), "\\registered_data.bin"])
+    Suite2PAnalysis.convert_binary(images).tofile(reg_file)
+    return ConvertedBinary(load_mapped_binary("", "", image_directory)), \
+        suite2p.io.BinaryRWFile(Ly=48, Lx=48, filename=reg_file)
+
+
+def test_converted_binary_interface(binaries):
+    converted, f_reg = binaries
+    assert(converted.shape == f_reg.shape and converted.n_frames == f_reg.n_frames)
+    assert((converted.Ly, converted.Lx, converted.size) == (f_reg.Ly, f_reg.Lx, f_reg.size))
+    for key in [3, slice(2, 9), np.array([1, 5, 7])]:
+        expected = f_reg[key]
+        assert(converted[key].dtype == expected.dtype)
+        np.testing.assert_array_equal(converted[key], expected)
+    np.testing.assert_array_equal(converted.ix([0, 199, 4]), f_reg.ix([0, 199, 4]))
+    np.testing.assert_array_equal(converted.ix(np.arange(5, 15), is_slice=True),
+                                  f_reg.ix(np.arange(5, 15), is_slice=True))
+    np.testing.assert_array_equal(converted.data, f_reg.ix(np.arange(200)))
+    np.testing.assert_array_equal(converted.sampled_mean(), f_reg.sampled_mean())
+
+
+def test_converted_binary_wrappers(binaries):
+    converted, f_reg = binaries
+    ops = {**suite2p.default_ops(), "Ly": 48, "Lx": 48, "batch_size": 50, "nframes": 200, "spatial_scale": 1}
+
+    expected_ops, expected_stat = suite2p.detection_wrapper(f_reg, ops=dict(ops))
+    detected_ops, detected_stat = suite2p.detection_wrapper(converted, ops=dict(ops))
+    assert(len(detected_stat) == len(expected_stat) == 4)
+    for _detected, _expected in zip(detected_stat, expected_stat):
+        np.testing.assert_array_equal(_detected["ypix"], _expected["ypix"])
+        np.testing.assert_array_equal(_detected["xpix"], _expected["xpix"])
+
+    expected = suite2p.extraction_wrapper(expected_stat, f_reg, f_reg_chan2=None, ops=expected_ops)
+    extracted = suite2p.extraction_wrapper(detected_stat, converted, f_reg_chan2=None, ops=detected_ops)
+    np.testing.assert_array_equal(extracted[1], expected[1])
+    np.testing.assert_array_equal(extracted[2], expected[2])
+
+
+def test_register_binary_parallel(tmp_path):
+    # a moving, textured field of view
+    rng = np.random.default_rng(1)
+    field = rng.normal(800, 200, (72, 72))
+    images = np.stack([field[4 + _shift[0]:52 + _shift[0], 4 + _shift[1]:52 + _shift[1]]
+                       for _shift in rng.integers(-3, 4, (130, 2))])
+    images = np.clip(images + rng.normal(0, 20, images.shape), 0, 65535).astype(np.int16)
+    images.tofile("".join([str(tmp_path), "\\data_raw.bin"]))
+
+    ops = {**suite2p.default_ops(), "Ly": 48, "Lx": 48, "nframes": 130, "batch_size": 40, "nimg_init": 60,
+           "do_bidiphase": True, "raw_file": "".join([str(tmp_path), "\\data_raw.bin"]),
+           "reg_file": "".join([str(tmp_path), "\\parallel.bin"]), "save_path": str(tmp_path)}
+    copied = dict(ops)
+    outputs = register_binary_parallel(ops, workers=2)
+    assert(ops == copied)
+
+    with suite2p.io.BinaryRWFile(Ly=48, Lx=48, filename=ops["raw_file"]) as f_raw, \
+            suite2p.io.BinaryRWFile(Ly=48, Lx=48, filename="".join([str(tmp_path), "\\serial.bin"])) as f_reg:
+        expected = suite2p.registration_wrapper(f_reg, f_raw=f_raw, ops=dict(ops))
+
+    for _index in [0, 1, 2, 3, 8, 9, 10]:
+        np.testing.assert_array_equal(outputs[_index], expected[_index])
+    for _parallel, _serial in zip(outputs[4] + outputs[5], expected[4] + expected[5]):
+        np.testing.assert_array_equal(_parallel, _serial)
+    assert(outputs[6] == expected[6] and outputs[7] is expected[7] is None)
+    np.testing.assert_array_equal(np.fromfile(ops["reg_file"], dtype=np.int16),
+                                  np.fromfile("".join([str(tmp_path), "\\serial.bin"]), dtype=np.int16))
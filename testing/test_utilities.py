@@ -0,0 +1,49 @@
+import pytest
+import numpy as np
+from imaging.io import save_trace_store, TraceStore, is_memory_mapped
+from imaging.utilities import TraceTensor, as_trace_tensor, mergeTraces
+
+
+@pytest.fixture
+def traces():
+    rng = np.random.default_rng(0)
+    _traces = np.empty((4, 3), dtype=object)
+    for _neuron in range(4):
+        for _tiff, _frames in enumerate((20, 20, 13)):
+            _traces[_neuron, _tiff] = rng.random((5, _frames)).astype(np.float32).astype(np.float64)
+    return _traces
+
+
+def test_trace_tensor(traces):
+    tensor = as_trace_tensor(traces)
+    assert tensor.shape == (4, 5, 53) and tensor.tiffs == 3 and tensor.data.dtype == np.float32
+    np.testing.assert_array_equal(tensor.boundaries, [0, 20, 40, 53])
+    np.testing.assert_array_equal(tensor.tiff(2)[1], traces[1, 2])
+    assert as_trace_tensor(tensor) is tensor
+
+    converted = tensor.to_object_array()
+    assert converted.shape == traces.shape
+    for _neuron, _tiff in np.ndindex(traces.shape):
+        np.testing.assert_array_equal(converted[_neuron, _tiff], traces[_neuron, _tiff])
+    assert np.shares_memory(converted[3, 1], tensor.data)
+
+    np.testing.assert_array_equal(mergeTraces(tensor, component=2), mergeTraces(traces, component=2))
+    assert TraceTensor(np.zeros((4, 53))).components == 1
+    with pytest.raises(ValueError):
+        TraceTensor(np.zeros((4, 5, 53)), boundaries=[0, 20, 50])
+
+
+def test_trace_tensor_store(traces, tmp_path):
+    tensor = as_trace_tensor(traces)
+    filename = "".join([str(tmp_path), "\\processed_traces"])
+    save_trace_store({"dFoF_raw": tensor}, filename)
+
+    loaded = TraceStore(filename)["dFoF_raw"]
+    assert(isinstance(loaded, TraceTensor) and is_memory_mapped(loaded.data))
+    np.testing.assert_array_equal(loaded.data, tensor.data)
+    np.testing.assert_array_equal(loaded.boundaries, tensor.boundaries)
+
+    # a tensor mapped from the store is saved back to the file it is mapped from
+    save_trace_store({"dFoF_raw": loaded}, filename)
+    del loaded
+    np.testing.assert_array_equal(TraceStore(filename)["dFoF_raw"].tiff(2), tensor.tiff(2))